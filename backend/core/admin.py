@@ -1,4 +1,7 @@
 from django.contrib import admin
+from django.http import HttpResponseRedirect
+from django.urls import reverse
+from .duplicates import DEFAULT_DISTANCE, similar_listings
 from .models import Wardrobe, ClothingListing
 from django.contrib.gis.admin import GISModelAdmin
 
@@ -8,7 +11,20 @@ class WardrobeAdmin(admin.ModelAdmin):
 
 @admin.register(ClothingListing)
 class ClothingListingAdmin(GISModelAdmin):
-    pass
-
-
+    actions = ['show_duplicates']
 
+    @admin.action(description="Show listings with the same or a near-identical photo")
+    def show_duplicates(self, request, queryset):
+        selected = list(queryset.exclude(image='').values_list('id', 'image', 'image_phash'))
+        ids = {pk for pk, _, _ in selected}
+        blobs = {image for _, image, _ in selected}
+        if blobs:
+            ids.update(ClothingListing.objects.filter(image__in=blobs).values_list('id', flat=True))
+        for _, _, phash in selected:
+            if phash is not None:
+                ids.update(pk for _, pk in similar_listings(phash, DEFAULT_DISTANCE))
+        if len(ids) <= len(selected):
+            self.message_user(request, "No duplicates found for the selected listings.")
+            return None
+        url = reverse('admin:core_clothinglisting_changelist')
+        return HttpResponseRedirect(f"{url}?id__in={','.join(map(str, sorted(ids)))}")
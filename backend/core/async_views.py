@@ -0,0 +1,144 @@
+"""
+Async versions of the hot read endpoints for the ASGI deployment.
+
+DRF views are synchronous, so under ASGI each of them ties up a thread for
+the whole request. These plain Django async views use the async ORM and
+return the same payloads as their DRF counterparts, letting one worker keep
+many requests in flight while they wait on the database. They apply the
+same ``RATE_LIMITS`` scopes as their DRF counterparts, and public listings
+share the ``listings`` response cache. Limiter and cache calls may hit a
+shared cache, so they run in a worker thread.
+"""
+import contextlib
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views.decorators.http import require_safe
+from rest_framework import exceptions
+from rest_framework.request import Request
+
+from . import geo, locations, nearby_feeds, response_cache
+from .authentication import CachedTokenAuthentication
+from .conversations import amessage_window_start
+from .db_router import pin_primary
+from .models import ClothingListing, Message
+from .fast_serializers import ListingRowSerializer, MessageRowSerializer
+from .pagination import KeysetPagination
+from .renderers import dumps
+from .serializers import query_position, query_radius
+from .throttling import RateLimitThrottle
+from .views import NearbyListingsView, PublicListingsView, UserMessagesView
+
+
+def _json(data, status=200):
+    return HttpResponse(dumps(data), status=status, content_type='application/json')
+
+
+def _error(exc):
+    detail = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': str(exc.detail)}
+    response = _json(detail, status=exc.status_code)
+    if getattr(exc, 'wait', None):
+        response['Retry-After'] = '%d' % exc.wait
+    return response
+
+
+async def _authenticated_user(drf_request):
+    result = await CachedTokenAuthentication().aauthenticate(drf_request)
+    if result is None:
+        raise exceptions.NotAuthenticated()
+    # The limiter keys on it, as it does for DRF views.
+    drf_request.user = result[0]
+    return result[0]
+
+
+async def _throttle(drf_request, view_class):
+    """Apply ``view_class``'s rate limit scope, raising ``Throttled`` as DRF would."""
+    throttle = RateLimitThrottle()
+    if not await sync_to_async(throttle.allow_request)(drf_request, view_class):
+        raise exceptions.Throttled(throttle.wait())
+
+
+def _cached_entry(namespace, drf_request):
+    key = response_cache.key_for(namespace, drf_request)
+    return key, response_cache.get(key)
+
+
+@require_safe
+async def public_listings(request):
+    drf_request = Request(request)
+    # Always rendered as JSON, so keyed as DRF negotiates a JSON request.
+    drf_request.accepted_media_type = 'application/json'
+    namespace = PublicListingsView.response_cache_namespace
+    paginator = KeysetPagination()
+    try:
+        await _throttle(drf_request, PublicListingsView)
+        key, entry = await sync_to_async(_cached_entry)(namespace, drf_request)
+        response_cache.stats.record(namespace, hit=entry is not None)
+        if entry is not None:
+            return response_cache.respond(request, entry, hit=True)
+        serializer = ListingRowSerializer.from_request(drf_request)
+        queryset = serializer.project(ClothingListing.objects.filter(is_public=True), *paginator.key_fields)
+        page = await paginator.apaginate_queryset(queryset, drf_request)
+    except exceptions.APIException as exc:
+        return _error(exc)
+    response = _json({'next': paginator.get_next_link(), 'results': serializer.serialize(page)})
+    entry = await sync_to_async(response_cache.store)(key, response)
+    return response_cache.respond(request, entry, hit=False)
+
+
+@require_safe
+async def nearby_listings(request):
+    drf_request = Request(request)
+    try:
+        user = await _authenticated_user(drf_request)
+        await _throttle(drf_request, NearbyListingsView)
+        serializer = ListingRowSerializer.from_request(drf_request)
+    except exceptions.APIException as exc:
+        return _error(exc)
+    params = request.GET
+    try:
+        radius_km = query_radius(params)
+        position = query_position(params)
+    except exceptions.ValidationError as exc:
+        return _error(exc)
+    limit = NearbyListingsView.max_results
+    if position is None:
+        stored = await sync_to_async(locations.buffer.current)(user.pk)
+        if stored is None:
+            return _json([])
+        point = stored[0]
+        if radius_km <= nearby_feeds.FEED_RADIUS_KM:
+            built = await sync_to_async(nearby_feeds.ensure_feed)(user.pk, point)
+            queryset = serializer.project(nearby_feeds.feed_listings(user.pk, radius_km))[:limit]
+            # A feed just built is only on the primary so far.
+            with pin_primary() if built else contextlib.nullcontext():
+                rows = [row async for row in queryset]
+            return _json(serializer.serialize(rows))
+        position = (point.x, point.y)
+    lon, lat = position
+    candidates = await sync_to_async(geo.nearby_candidates)(lon, lat, radius_km, NearbyListingsView.load_candidates)
+    ranked = geo.rank_by_distance(candidates, lon, lat, radius_km, limit)
+    ids = [pk for _, pk in ranked]
+    rows = {
+        row['id']: row
+        async for row in serializer.project(ClothingListing.objects.filter(pk__in=ids), 'id')
+    }
+    return _json(serializer.serialize(rows[pk] for pk in ids if pk in rows))
+
+
+@require_safe
+async def user_messages(request):
+    drf_request = Request(request)
+    try:
+        user = await _authenticated_user(drf_request)
+        await _throttle(drf_request, UserMessagesView)
+        serializer = MessageRowSerializer.from_request(drf_request)
+    except exceptions.APIException as exc:
+        return _error(exc)
+    start = await amessage_window_start(user, unread_only=True)
+    if start is None:
+        return _json([])
+    queryset = serializer.project(
+        Message.objects.filter(receiver=user, is_read=False, created_at__gte=start).order_by('-created_at'),
+    )
+    return _json(serializer.serialize([row async for row in queryset]))
@@ -0,0 +1,197 @@
+"""
+Token authentication with an in-process LRU in front of the database.
+
+Resolving a token normally costs a ``Token`` + ``User`` query on every
+request. With ``AUTH_TOKEN_SHARED_CACHE`` set, ``CachedTokenAuthentication``
+answers from a bounded per-process LRU first, then from that shared cache,
+and only then from the database. Every entry is stamped with a generation
+counter kept in the shared cache; deleting or rotating a token, or saving
+its user (e.g. deactivating), bumps the generation, so every process stops
+trusting its cached entries on its next request. Checking the generation
+is one small cache read per request instead of two queries. Without a
+shared cache other processes couldn't be told, so nothing is cached.
+
+Code that deactivates users with ``QuerySet.update`` bypasses the signals
+and must call ``invalidate_all()`` itself.
+
+Tokens also expire ``AUTH_TOKEN_TTL`` seconds after they were issued.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .db_router import is_pinned, pin_if_recent_writer, pin_primary
+
+
+class LRUCache:
+    """Thread-safe LRU with a per-entry TTL."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local_cache = LRUCache(
+    maxsize=getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 10_000),
+    ttl=getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 60),
+)
+
+
+def _shared_cache():
+    alias = getattr(settings, 'AUTH_TOKEN_SHARED_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def _shared_key(key):
+    return f'auth:token:{key}'
+
+
+GENERATION_KEY = 'auth:token:generation'
+
+
+def _bump_generation():
+    shared = _shared_cache()
+    if shared is not None and not shared.add(GENERATION_KEY, 1, None):
+        try:
+            shared.incr(GENERATION_KEY)
+        except ValueError:
+            shared.set(GENERATION_KEY, 1, None)
+
+
+def token_expired(created):
+    ttl = getattr(settings, 'AUTH_TOKEN_TTL', None)
+    return bool(ttl) and created + timedelta(seconds=ttl) < timezone.now()
+
+
+def invalidate_all():
+    """Make every process drop its cached tokens."""
+    local_cache.clear()
+    _bump_generation()
+    # Again once the change is visible: a request that read the old rows
+    # before the commit must not keep them under the new generation.
+    transaction.on_commit(_bump_generation)
+
+
+def _forget(key):
+    local_cache.delete(key)
+    shared = _shared_cache()
+    if shared is not None:
+        shared.delete(_shared_key(key))
+
+
+def invalidate_token(key):
+    _forget(key)
+    invalidate_all()
+
+
+def rotate_token(user):
+    """Replace ``user``'s token with a fresh one; the old key stops working immediately."""
+    with transaction.atomic():
+        Token.objects.filter(user=user).delete()
+        return Token.objects.create(user=user)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        shared = _shared_cache()
+        entry = None
+        if shared is not None:
+            generation = shared.get(GENERATION_KEY, 0)
+            entry = local_cache.get(key)
+            if entry is None or entry[0] != generation:
+                entry = shared.get(_shared_key(key))
+                if entry is not None and entry[0] == generation:
+                    local_cache.set(key, entry)
+                else:
+                    entry = None
+        if entry is None:
+            token = self.load_token(key)
+            if shared is not None:
+                # Stamped with the generation read before the query, so an
+                # invalidation that raced with it makes the entry stale.
+                entry = (generation, token.user, token.created)
+                local_cache.set(key, entry)
+                shared.set(_shared_key(key), entry, local_cache.ttl)
+            else:
+                entry = (None, token.user, token.created)
+
+        _, user, created = entry
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        if token_expired(created):
+            # Every process checks expiry itself; no need to flush the others.
+            _forget(key)
+            raise exceptions.AuthenticationFailed('Token has expired.')
+        pin_if_recent_writer(user.pk)
+        # Concurrent requests mustn't share one mutable user instance.
+        user = copy.copy(user)
+        return user, Token(key=key, user=user, created=created)
+
+    @staticmethod
+    def load_token(key):
+        tokens = Token.objects.select_related('user')
+        try:
+            return tokens.get(key=key)
+        except Token.DoesNotExist:
+            if is_pinned() or not getattr(settings, 'DATABASE_REPLICAS', []):
+                raise exceptions.AuthenticationFailed('Invalid token.')
+        # A token issued moments ago may not have reached the replica yet.
+        with pin_primary():
+            try:
+                return tokens.get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+
+    async def aauthenticate(self, request):
+        """
+        Async counterpart of ``authenticate`` for plain Django async views.
+        Even a local LRU hit reads the shared generation, so resolution
+        always runs in a worker thread.
+        """
+        parts = request.headers.get('Authorization', '').split()
+        if not parts or parts[0].lower() != self.keyword.lower():
+            return None
+        if len(parts) != 2:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+        return await sync_to_async(self.authenticate_credentials)(parts[1])
@@ -0,0 +1,52 @@
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from . import conversations
+from .realtime import publish_read_receipts, user_group
+
+
+class InboxConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Per-user socket. Server -> client events are ``message.new`` and
+    ``message.read``; the client sends ``{"type": "read", "message_ids": [...]}``
+    to mark messages read, which fans a receipt out to each sender.
+    """
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+        self.group = user_group(user.pk)
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, 'group'):
+            await self.channel_layer.group_discard(self.group, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        if content.get('type') != 'read':
+            await self.send_json({'type': 'error', 'detail': "Unknown event type."})
+            return
+        ids = content.get('message_ids')
+        if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+            await self.send_json({'type': 'error', 'detail': "message_ids must be a list of ids."})
+            return
+        await self.mark_read(ids)
+
+    @database_sync_to_async
+    def mark_read(self, ids):
+        reader = self.scope['user']
+        ids = ids[:500]
+        _, senders = conversations.mark_read(reader, message_ids=ids)
+        if senders:
+            # Each sender only hears about their own messages.
+            for sender_id, own_ids in conversations.ids_by_sender(reader, ids, senders).items():
+                publish_read_receipts(reader.pk, [sender_id], message_ids=own_ids)
+
+    async def message_new(self, event):
+        await self.send_json({'type': 'message.new', 'message': event['message']})
+
+    async def message_read(self, event):
+        await self.send_json(event)
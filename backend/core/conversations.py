@@ -0,0 +1,115 @@
+"""
+Conversation bookkeeping. Every write that creates or reads messages goes
+through here so the denormalised ``last_message`` and per-participant
+``unread_count`` stay consistent with the message rows.
+"""
+from django.db import transaction
+from django.utils import timezone
+from django.db.models import Case, Count, F, IntegerField, Min, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Conversation, ConversationParticipant, Message
+
+
+def get_or_create_conversation(listing, user_a, user_b):
+    low, high = sorted((user_a.pk, user_b.pk))
+    conversation, created = Conversation.objects.get_or_create(
+        listing=listing, user_low_id=low, user_high_id=high,
+    )
+    if created:
+        ConversationParticipant.objects.bulk_create([
+            ConversationParticipant(conversation=conversation, user_id=low),
+            ConversationParticipant(conversation=conversation, user_id=high),
+        ], ignore_conflicts=True)
+    return conversation
+
+
+def record_message(message):
+    """Point the conversation at ``message`` and bump the receiver's unread count."""
+    conversation_id = message.conversation_id
+    Conversation.objects.filter(pk=conversation_id).update(
+        last_message=message, last_message_at=message.created_at,
+    )
+    ConversationParticipant.objects.filter(conversation_id=conversation_id).update(
+        last_message_at=message.created_at,
+        unread_count=Case(
+            When(user_id=message.receiver_id, then=F('unread_count') + 1),
+            default=F('unread_count'),
+        ),
+    )
+
+
+def send_message(serializer, sender, receiver, listing):
+    with transaction.atomic():
+        conversation = get_or_create_conversation(listing, sender, receiver)
+        message = serializer.save(sender=sender, receiver=receiver, conversation=conversation)
+        record_message(message)
+    return message
+
+
+def _window(user, unread_only):
+    participants = ConversationParticipant.objects.filter(user=user).order_by()
+    return participants.filter(unread_count__gt=0) if unread_only else participants
+
+
+def message_window_start(user, unread_only=False):
+    """
+    The earliest ``created_at`` any of ``user``'s messages (or unread
+    messages) can have, or ``None`` if there are none. No message predates
+    its conversation, so filtering on it lets PostgreSQL skip every older
+    monthly partition (see ``core.partitions``).
+    """
+    return _window(user, unread_only).aggregate(start=Min('conversation__created_at'))['start']
+
+
+async def amessage_window_start(user, unread_only=False):
+    return (await _window(user, unread_only).aaggregate(start=Min('conversation__created_at')))['start']
+
+
+def refresh_unread_counts(user, conversation_ids):
+    """Recount ``user``'s unread messages in the given conversations."""
+    unread = (
+        Message.objects.filter(conversation=OuterRef('conversation'), receiver=user, is_read=False)
+        .order_by().values('conversation').annotate(n=Count('id')).values('n')
+    )
+    ConversationParticipant.objects.filter(user=user, conversation_id__in=conversation_ids).update(
+        unread_count=Coalesce(Subquery(unread, output_field=IntegerField()), Value(0)),
+    )
+
+
+def mark_read(reader, up_to=None, listing_id=None, sender_id=None, message_ids=None):
+    """
+    Mark ``reader``'s unread messages read with a single UPDATE: everything
+    received up to the ``up_to`` watermark (default now), optionally narrowed
+    to one listing, one sender or explicit ids. The cost is a constant number
+    of queries however many rows change.
+
+    Returns ``(updated, sender_ids)``.
+    """
+    unread = Message.objects.filter(
+        receiver=reader, is_read=False, created_at__lte=up_to or timezone.now(),
+    ).order_by()
+    if listing_id is not None:
+        unread = unread.filter(listing_id=listing_id)
+    if sender_id is not None:
+        unread = unread.filter(sender_id=sender_id)
+    if message_ids is not None:
+        unread = unread.filter(id__in=message_ids)
+    with transaction.atomic():
+        touched = list(unread.values_list('sender_id', 'conversation_id').distinct())
+        if not touched:
+            return 0, []
+        updated = unread.update(is_read=True)
+        refresh_unread_counts(reader, {conversation_id for _, conversation_id in touched})
+    return updated, sorted({sender for sender, _ in touched})
+
+
+def ids_by_sender(reader, message_ids, sender_ids):
+    """``{sender_id: [ids]}`` of ``message_ids`` received by ``reader`` from ``sender_ids``."""
+    grouped = {}
+    rows = Message.objects.filter(
+        receiver=reader, sender_id__in=sender_ids, id__in=message_ids,
+    ).order_by('id').values_list('sender_id', 'id')
+    for sender_id, pk in rows:
+        grouped.setdefault(sender_id, []).append(pk)
+    return grouped
@@ -0,0 +1,216 @@
+"""
+Read-replica routing with read-your-writes stickiness.
+
+Reads go to a healthy replica from ``DATABASE_REPLICAS`` unless the current
+request (or background job) is pinned to the primary. A request is pinned
+when it uses an unsafe method, and a user stays pinned for
+``REPLICA_PIN_SECONDS`` after they wrote, so they always see their own
+writes. Writers are remembered by user id rather than by credentials, since
+register, login and token rotation hand out new ones: browsers get a
+short-lived cookie, and token requests are pinned once
+``core.authentication`` has resolved the user (``pin_if_recent_writer``).
+Reads inside a transaction on the primary also stay on the primary.
+
+Recent writers are kept in ``REPLICA_PIN_SHARED_CACHE``, a cache alias
+every worker shares (the default cache without one). A write through one
+worker must pin reads through the others, so with ``DATABASE_REPLICAS``
+set a process-local pin cache refuses to start (``check_pin_cache``).
+
+Replica lag is sampled at most every ``REPLICA_LAG_CHECK_INTERVAL`` seconds;
+a replica more than ``REPLICA_MAX_LAG`` seconds behind, or unreachable, is
+skipped until the next sample.
+"""
+import contextlib
+import itertools
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.functional import SimpleLazyObject
+
+logger = logging.getLogger(__name__)
+
+_pinned = ContextVar('pinned_to_primary', default=False)
+
+LAG_SQL = """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+@contextlib.contextmanager
+def pin_primary():
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+class _LagMonitor:
+    def __init__(self):
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def lag(self, alias):
+        interval = getattr(settings, 'REPLICA_LAG_CHECK_INTERVAL', 5)
+        now = time.monotonic()
+        with self._lock:
+            sample = self._samples.get(alias)
+            if sample is not None and now - sample[1] < interval:
+                return sample[0]
+        lag = self.measure(alias)
+        with self._lock:
+            self._samples[alias] = (lag, now)
+        return lag
+
+    @staticmethod
+    def measure(alias):
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(LAG_SQL)
+                value = cursor.fetchone()[0]
+        except DatabaseError:
+            logger.warning("Replica %s is unreachable; reading from the primary.", alias, exc_info=True)
+            return None
+        return float(value or 0)
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+
+lag_monitor = _LagMonitor()
+_round_robin = itertools.count()
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if _pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if not replicas:
+            return DEFAULT_DB_ALIAS
+        max_lag = getattr(settings, 'REPLICA_MAX_LAG', 5)
+        start = next(_round_robin)
+        for offset in range(len(replicas)):
+            alias = replicas[(start + offset) % len(replicas)]
+            lag = lag_monitor.lag(alias)
+            if lag is not None and lag <= max_lag:
+                return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_COOKIE = 'pin_primary'
+
+
+def _pin_cache():
+    alias = getattr(settings, 'REPLICA_PIN_SHARED_CACHE', None)
+    return caches[alias] if alias else cache
+
+
+def check_pin_cache():
+    """Raise ``ImproperlyConfigured`` if replicas are on but pins can't reach other workers."""
+    if getattr(settings, 'DATABASE_REPLICAS', []) and isinstance(_pin_cache(), (LocMemCache, DummyCache)):
+        raise ImproperlyConfigured(
+            "DATABASE_REPLICAS needs REPLICA_PIN_SHARED_CACHE set to a cache alias shared by every "
+            "worker (Redis or Memcached); with a process-local cache, writers read stale replicas "
+            "through the other workers."
+        )
+
+
+def _writer_key(user_id):
+    return f'replica-pin:user:{user_id}'
+
+
+def remember_writer(user_id):
+    """Pin ``user_id``'s reads to the primary for ``REPLICA_PIN_SECONDS``."""
+    _pin_cache().set(_writer_key(user_id), 1, getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+
+
+def pin_if_recent_writer(user_id):
+    """Pin the rest of the current request if ``user_id`` wrote recently."""
+    if not _pinned.get() and _pin_cache().get(_writer_key(user_id)) is not None:
+        _pinned.set(True)
+
+
+def _user_id(request):
+    # Only a user something already resolved: DRF assigns request.user, and
+    # AuthenticationMiddleware caches it once read. Never query for one here.
+    user = request.__dict__.get('user')
+    if isinstance(user, SimpleLazyObject):
+        user = getattr(request, '_cached_user', None)
+    return user.pk if user is not None and user.is_authenticated else None
+
+
+class ReplicaPinningMiddleware:
+    """
+    Pin writes, and reads from users that wrote recently, to the primary.
+    Recent writers are remembered by user id in the cache and by a
+    short-lived cookie (for browsers).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        writing = request.method not in SAFE_METHODS
+        token = _pinned.set(writing or PIN_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            _pinned.reset(token)
+        return self.remember_write(request, response, writing)
+
+    async def __acall__(self, request):
+        # ContextVars are copied into sync_to_async threads, and changes
+        # made there copied back, so the pin reaches async ORM calls too.
+        writing = request.method not in SAFE_METHODS
+        token = _pinned.set(writing or PIN_COOKIE in request.COOKIES)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _pinned.reset(token)
+        return self.remember_write(request, response, writing)
+
+    @staticmethod
+    def remember_write(request, response, writing):
+        if writing and response.status_code < 400:
+            pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+            user_id = _user_id(request)
+            if user_id is not None:
+                remember_writer(user_id)
+            response.set_cookie(PIN_COOKIE, '1', max_age=pin_seconds, httponly=True, samesite='Lax')
+        return response
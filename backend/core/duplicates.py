@@ -0,0 +1,117 @@
+"""
+Near-duplicate listing photos by perceptual hash.
+
+Every processed photo has a 64-bit DCT hash (``core.images.phash``);
+visually identical photos hash within a few bits of each other. Hashes are
+indexed by multi-index hashing: the hash is split into ``CHUNKS`` 16-bit
+chunks and each chunk, tagged with its position, is stored in
+``image_phash_chunks`` under a GIN index. Two hashes within ``distance``
+bits of each other must agree within ``distance // CHUNKS`` bits on at
+least one chunk (pigeonhole), so a lookup probes only those chunk variants
+(one ``&&`` index scan) and measures the few candidates it returns, instead
+of comparing against every photo.
+
+``HammingIndex`` is the same structure in memory, used to cluster a whole
+queryset at once.
+"""
+from itertools import combinations
+
+from .models import ClothingListing
+
+HASH_BITS = 64
+CHUNKS = 4
+CHUNK_BITS = HASH_BITS // CHUNKS
+DEFAULT_DISTANCE = 6
+MAX_DISTANCE = 11
+
+_MASK = (1 << HASH_BITS) - 1
+_CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+
+def hamming(a, b):
+    return ((a ^ b) & _MASK).bit_count()
+
+
+def _chunks(phash):
+    unsigned = phash & _MASK
+    return [(unsigned >> (i * CHUNK_BITS)) & _CHUNK_MASK for i in range(CHUNKS)]
+
+
+def chunk_keys(phash):
+    """The values stored in ``image_phash_chunks``: each chunk tagged with its position."""
+    return [i << CHUNK_BITS | chunk for i, chunk in enumerate(_chunks(phash))]
+
+
+def probe_keys(phash, distance):
+    """Every chunk key a hash within ``distance`` bits of ``phash`` must share at least one of."""
+    radius = distance // CHUNKS
+    flips = [0]
+    for r in range(1, radius + 1):
+        flips += [sum(1 << bit for bit in bits) for bits in combinations(range(CHUNK_BITS), r)]
+    return [i << CHUNK_BITS | (chunk ^ flip) for i, chunk in enumerate(_chunks(phash)) for flip in flips]
+
+
+def similar_listings(phash, distance=DEFAULT_DISTANCE, queryset=None):
+    """``[(distance, listing_id)]`` for listings whose photo is within ``distance`` bits, nearest first."""
+    distance = min(distance, MAX_DISTANCE)
+    queryset = ClothingListing.objects.all() if queryset is None else queryset
+    candidates = queryset.filter(image_phash_chunks__overlap=probe_keys(phash, distance)).values_list(
+        'id', 'image_phash',
+    )
+    return sorted(
+        (d, pk) for pk, other in candidates if (d := hamming(phash, other)) <= distance
+    )
+
+
+class HammingIndex:
+    """In-memory multi-index over ``(id, phash)`` pairs."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._hashes = {}
+
+    def add(self, pk, phash):
+        self._hashes[pk] = phash
+        for key in chunk_keys(phash):
+            self._buckets.setdefault(key, []).append(pk)
+
+    def query(self, phash, distance):
+        seen = set()
+        for key in probe_keys(phash, distance):
+            seen.update(self._buckets.get(key, ()))
+        return [pk for pk in seen if hamming(phash, self._hashes[pk]) <= distance]
+
+
+def duplicate_clusters(queryset, distance=DEFAULT_DISTANCE):
+    """
+    Groups of listing ids sharing one photo blob or a photo within
+    ``distance`` bits, largest first; singletons are left out.
+    """
+    distance = min(distance, MAX_DISTANCE)
+    parent = {}
+
+    def find(pk):
+        while parent[pk] != pk:
+            parent[pk] = parent[parent[pk]]
+            pk = parent[pk]
+        return pk
+
+    def union(a, b):
+        parent[find(a)] = find(b)
+
+    index, by_blob = HammingIndex(), {}
+    rows = queryset.exclude(image='').order_by('id').values_list('id', 'image', 'image_phash')
+    for pk, image, phash in rows.iterator(chunk_size=2000):
+        parent[pk] = pk
+        if image in by_blob:
+            union(pk, by_blob[image])
+        else:
+            by_blob[image] = pk
+        if phash is not None:
+            for other in index.query(phash, distance):
+                union(pk, other)
+            index.add(pk, phash)
+    clusters = {}
+    for pk in parent:
+        clusters.setdefault(find(pk), []).append(pk)
+    return sorted((sorted(ids) for ids in clusters.values() if len(ids) > 1), key=lambda ids: (-len(ids), ids[0]))
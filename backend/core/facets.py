@@ -0,0 +1,152 @@
+"""
+Facet counts for listing filters: per condition, per visibility and per
+distance band.
+
+Counts live in ``ListingFacetCount`` rows keyed by ``(grid_cell,
+condition, is_public)``, plus one ``TOTAL`` row per ``(condition,
+is_public)``. Listing writes adjust them in the writing transaction (see
+``core.signals`` and ``core.importer``), so the totals are a read of eight
+rows however many listings there are. ``reconcile()`` recounts them
+exactly; run the ``reconcile_facets`` command periodically to repair drift
+from writes that bypass the model (``QuerySet.update``, raw SQL).
+
+Distance bands are summed from the per-cell rows: a cell entirely inside a
+band counts in full, and only the cells crossed by a band's edge have
+their listings measured, from the cached candidate sets in ``core.geo``.
+"""
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+
+from . import geo
+from .models import ClothingListing, ListingFacetCount
+from .nearby_feeds import load_candidates
+
+TOTAL = '*'
+NO_LOCATION = ''
+DISTANCE_BANDS_KM = (1, 5, 10, 25)
+
+_UPSERT_SQL = """
+    INSERT INTO {table} (grid_cell, condition, is_public, count) VALUES {values}
+    ON CONFLICT (grid_cell, condition, is_public)
+    DO UPDATE SET count = {table}.count + EXCLUDED.count
+"""
+
+
+def record(deltas):
+    """
+    Apply ``{(grid_cell, condition, is_public): delta}`` to the counters and
+    their totals. Call inside the transaction that changed the listings.
+    """
+    changes = Counter()
+    for (cell, condition, is_public), delta in deltas.items():
+        changes[(cell or NO_LOCATION, condition, is_public)] += delta
+        changes[(TOTAL, condition, is_public)] += delta
+    # A fixed order means concurrent writers lock counter rows in the same
+    # sequence and can't deadlock each other.
+    rows = sorted((key, delta) for key, delta in changes.items() if delta)
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            _UPSERT_SQL.format(
+                table=ListingFacetCount._meta.db_table,
+                values=', '.join(['(%s, %s, %s, %s)'] * len(rows)),
+            ),
+            [value for (cell, condition, is_public), delta in rows for value in (cell, condition, is_public, delta)],
+        )
+
+
+def record_change(previous, current):
+    """Move one listing's count from facet key ``previous`` to ``current``; either may be ``None``."""
+    if previous == current:
+        return
+    deltas = Counter()
+    if previous is not None:
+        deltas[previous] -= 1
+    if current is not None:
+        deltas[current] += 1
+    record(deltas)
+
+
+def totals():
+    """Public listings per condition and all listings per visibility."""
+    conditions = dict.fromkeys((value for value, _ in ClothingListing.CONDITION_CHOICES), 0)
+    visibility = {'public': 0, 'private': 0}
+    rows = ListingFacetCount.objects.filter(grid_cell=TOTAL).values_list('condition', 'is_public', 'count')
+    for condition, is_public, count in rows:
+        visibility['public' if is_public else 'private'] += count
+        if is_public and condition in conditions:
+            conditions[condition] += count
+    return {'condition': conditions, 'visibility': visibility}
+
+
+def _distance_range_km(lon, lat, cell):
+    """Nearest and farthest distance from (lon, lat) to the cell."""
+    west, south, east, north = geo.cell_bounds(cell)
+    # Cells across the antimeridian are numbered from the other side.
+    if west - lon > 180:
+        west, east = west - 360, east - 360
+    elif lon - east > 180:
+        west, east = west + 360, east + 360
+    near = geo.haversine_km(lon, lat, min(max(lon, west), east), min(max(lat, south), north))
+    far = max(geo.haversine_km(lon, lat, x, y) for x in (west, east) for y in (south, north))
+    return near, far
+
+
+def distance_bands(lon, lat, bands=DISTANCE_BANDS_KM):
+    """``{km: count}`` of public listings within each of ``bands`` of (lon, lat)."""
+    cells = geo.covering_cells(lon, lat, max(bands))
+    per_cell = ListingFacetCount.objects.filter(grid_cell__in=cells, is_public=True).values('grid_cell').annotate(
+        total=Sum('count'),
+    ).values_list('grid_cell', 'total')
+    counts = dict.fromkeys(bands, 0)
+    edges = {}
+    for cell, total in per_cell:
+        if not total:
+            continue
+        near, far = _distance_range_km(lon, lat, cell)
+        for km in bands:
+            if far <= km:
+                counts[km] += total
+            elif near <= km:
+                edges.setdefault(cell, []).append(km)
+    if edges:
+        for _, c_lon, c_lat in geo.cell_candidates(sorted(edges), load_candidates):
+            cell_bands = edges.get(geo.cell_key(*geo.cell_index(c_lon, c_lat)), ())
+            distance = geo.haversine_km(lon, lat, c_lon, c_lat)
+            for km in cell_bands:
+                if distance <= km:
+                    counts[km] += 1
+    return counts
+
+
+def reconcile():
+    """
+    Rebuild every counter from the listings table. Returns the number of
+    counters that had drifted.
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # Writers block on their counter update until this commits, so
+            # their listings are either in the recount or counted after it.
+            cursor.execute(f'LOCK TABLE {ListingFacetCount._meta.db_table} IN EXCLUSIVE MODE')
+        exact = Counter()
+        rows = ClothingListing.objects.order_by().values_list('grid_cell', 'condition', 'is_public').annotate(
+            total=Count('id'),
+        )
+        for cell, condition, is_public, total in rows:
+            exact[(cell or NO_LOCATION, condition, is_public)] += total
+            exact[(TOTAL, condition, is_public)] += total
+        stored = {
+            (cell, condition, is_public): count for cell, condition, is_public, count in
+            ListingFacetCount.objects.values_list('grid_cell', 'condition', 'is_public', 'count')
+        }
+        drifted = sum(1 for key in exact.keys() | stored.keys() if exact.get(key, 0) != stored.get(key, 0))
+        ListingFacetCount.objects.all().delete()
+        ListingFacetCount.objects.bulk_create(
+            ListingFacetCount(grid_cell=cell, condition=condition, is_public=is_public, count=count)
+            for (cell, condition, is_public), count in exact.items() if count
+        )
+    return drifted
@@ -0,0 +1,261 @@
+"""
+Row-level serializers for the list endpoints.
+
+``ClothingListingSerializer`` and ``MessageSerializer`` build a model
+instance and a tree of field objects for every row. On list endpoints that
+dominates the request, so these read plain ``values()`` dicts with only the
+columns the payload needs and build the output dict directly. The output is
+key-for-key identical to the model serializers (``core.tests`` checks the
+rendered bytes), so clients can't tell which path served them.
+"""
+from django.core.handlers.asgi import ASGIRequest
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from . import metrics
+from .models import ClothingListing
+from .renderers import stream_json_list
+
+_datetime = serializers.DateTimeField()
+_rendition_storage = ClothingListing._meta.get_field('image_thumbnail').storage
+_original_storage = ClothingListing._meta.get_field('image').storage
+
+
+class FastRowSerializer:
+    """
+    Turns ``values()`` rows into the same dicts the model serializer would.
+
+    ``columns`` maps each output field, in output order, to the columns it
+    reads. Fields backed by one column of the same name are copied as-is;
+    anything else has a ``get_<field>(row)`` method. ``expansions`` map a
+    field to the columns of its nested form, built by ``expand_<field>(row)``.
+
+    ``fields`` and ``expand`` narrow the output, and with it the ``values()``
+    projection, so unselected columns and joins never leave the database.
+    """
+    columns = {}
+    expansions = {}
+    subfields = {}
+    fields_query_param = 'fields'
+    expand_query_param = 'expand'
+
+    def __init__(self, request=None, fields=None, expand=()):
+        self.request = request
+        self.selected, self.nested = self.select(fields, expand)
+        self.expanded = set(expand)
+        self.getters = [
+            (name, self.getter(name)) for name in self.columns if name in self.selected
+        ]
+
+    @classmethod
+    def from_request(cls, request):
+        params = request.query_params if hasattr(request, 'query_params') else request.GET
+
+        def names(param):
+            return [name.strip() for name in params.get(param, '').split(',') if name.strip()]
+
+        return cls(request, fields=names(cls.fields_query_param) or None, expand=names(cls.expand_query_param))
+
+    def select(self, fields, expand):
+        unknown = {name for name in expand if name not in self.expansions}
+        if unknown:
+            raise serializers.ValidationError({self.expand_query_param: self.unknown_message(unknown)})
+        if fields is None:
+            return set(self.columns) | set(expand), {}
+        whole, nested = set(), {}
+        for entry in fields:
+            name, _, sub = entry.partition('.')
+            if name not in self.columns or (sub and sub not in self.subfields.get(name, ())):
+                unknown.add(entry)
+            elif sub:
+                nested.setdefault(name, set()).add(sub)
+            else:
+                whole.add(name)
+        if unknown:
+            raise serializers.ValidationError({self.fields_query_param: self.unknown_message(unknown)})
+        nested = {name: subs for name, subs in nested.items() if name not in whole}
+        return whole | set(nested) | set(expand), nested
+
+    @staticmethod
+    def unknown_message(names):
+        return f"Unknown field(s): {', '.join(sorted(names))}."
+
+    def getter(self, name):
+        if name in self.expanded:
+            return getattr(self, f'expand_{name}')
+        method = getattr(self, f'get_{name}', None)
+        if method is not None:
+            return method
+        column = self.columns[name][0]
+        return lambda row: row[column]
+
+    def projection(self):
+        columns = []
+        for name in self.columns:
+            if name not in self.selected:
+                continue
+            source = self.expansions if name in self.expanded else self.columns
+            columns.extend(source[name])
+        return columns
+
+    def url(self, name, storage=_rendition_storage):
+        if not name:
+            return None
+        url = storage.url(name)
+        return self.request.build_absolute_uri(url) if self.request else url
+
+    def project(self, queryset, *extra):
+        """``queryset.values()`` over the selected columns plus ``extra`` (e.g. pagination keys)."""
+        return queryset.values(*dict.fromkeys([*self.projection(), *extra]))
+
+    def to_representation(self, row):
+        return {name: getter(row) for name, getter in self.getters}
+
+    def serialize(self, rows):
+        with metrics.serializing():
+            return [self.to_representation(row) for row in rows]
+
+
+class ListingRowSerializer(FastRowSerializer):
+    image_columns = {
+        'thumbnail': 'image_thumbnail',
+        'medium': 'image_medium',
+        'width': 'image_width',
+        'height': 'image_height',
+        'blurhash': 'image_blurhash',
+    }
+    columns = {
+        'id': ('id',),
+        'owner_username': ('wardrobe__user__username',),
+        'location_coords': ('location',),
+        # 'image' is the fallback for renditions that haven't been made yet.
+        'images': (*image_columns.values(), 'image'),
+        'title': ('title',),
+        'description': ('description',),
+        'condition': ('condition',),
+        'location': ('location',),
+        'is_public': ('is_public',),
+        'created_at': ('created_at',),
+        'updated_at': ('updated_at',),
+        'wardrobe': ('wardrobe_id',),
+    }
+    subfields = {'images': tuple(image_columns)}
+    expansions = {
+        'wardrobe': ('wardrobe_id', 'wardrobe__created_at', 'wardrobe__user_id'),
+    }
+
+    def projection(self):
+        columns = super().projection()
+        if 'images' in self.nested:
+            wanted = {column for _, column in self.image_keys}
+            if {'image_thumbnail', 'image_medium'} & wanted:
+                wanted.add('image')
+            unwanted = set(self.columns['images']) - wanted
+            columns = [column for column in columns if column not in unwanted]
+        return columns
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        keys = self.nested.get('images', self.image_columns)
+        self.image_keys = [(key, column) for key, column in self.image_columns.items() if key in keys]
+
+    def get_location_coords(self, row):
+        location = row['location']
+        return f"{location.x}, {location.y}" if location else None
+
+    def get_images(self, row):
+        images = {}
+        for key, column in self.image_keys:
+            value = row[column]
+            if key in ('thumbnail', 'medium'):
+                value = self.url(value) if value else self.url(row['image'], _original_storage)
+            elif key == 'blurhash':
+                value = value or None
+            images[key] = value
+        return images
+
+    def get_location(self, row):
+        location = row['location']
+        return str(location) if location is not None else None
+
+    def get_created_at(self, row):
+        return _datetime.to_representation(row['created_at'])
+
+    def get_updated_at(self, row):
+        return _datetime.to_representation(row['updated_at'])
+
+    def expand_wardrobe(self, row):
+        return {
+            'id': row['wardrobe_id'],
+            'created_at': _datetime.to_representation(row['wardrobe__created_at']),
+            'user': row['wardrobe__user_id'],
+        }
+
+
+class MessageRowSerializer(FastRowSerializer):
+    columns = {
+        'id': ('id',),
+        'sender_username': ('sender__username',),
+        'receiver_username': ('receiver__username',),
+        'content': ('content',),
+        'created_at': ('created_at',),
+        'is_read': ('is_read',),
+        'sender': ('sender_id',),
+        'receiver': ('receiver_id',),
+        'listing': ('listing_id',),
+        'conversation': ('conversation_id',),
+    }
+    expansions = {
+        'sender': ('sender_id', 'sender__username'),
+        'receiver': ('receiver_id', 'receiver__username'),
+        'listing': ('listing_id', 'listing__title', 'listing__image_thumbnail'),
+    }
+
+    def get_created_at(self, row):
+        return _datetime.to_representation(row['created_at'])
+
+    def expand_sender(self, row):
+        return {'id': row['sender_id'], 'username': row['sender__username']}
+
+    def expand_receiver(self, row):
+        return {'id': row['receiver_id'], 'username': row['receiver__username']}
+
+    def expand_listing(self, row):
+        return {
+            'id': row['listing_id'],
+            'title': row['listing__title'],
+            'thumbnail': self.url(row['listing__image_thumbnail']),
+        }
+
+
+class FastListMixin:
+    """
+    ``list()`` for generic views that serialises through ``fast_serializer_class``.
+
+    Paginated lists hand the projected rows to the paginator; unpaginated
+    ones are streamed straight from a chunked cursor when the client
+    negotiated JSON and the server is WSGI. Under ASGI the body would be
+    iterated on the event loop's side, outside the view's database thread,
+    replica pinning and query metrics, so the rows are read in the view.
+    ``?fields=`` and ``?expand=`` narrow the projection.
+    """
+    fast_serializer_class = None
+    stream_chunk_size = 2000
+
+    def get_fast_serializer(self):
+        return self.fast_serializer_class.from_request(self.request)
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_fast_serializer()
+        key_fields = self.paginator.key_fields if self.paginator is not None else ()
+        queryset = serializer.project(self.filter_queryset(self.get_queryset()), *key_fields)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer.serialize(page))
+        if not isinstance(request.accepted_renderer, JSONRenderer) or isinstance(request._request, ASGIRequest):
+            return Response(serializer.serialize(list(queryset)))
+        # Resolve the database now: the body is produced after the view (and
+        # the replica pinning around it) has returned.
+        rows = queryset.using(queryset.db).iterator(chunk_size=self.stream_chunk_size)
+        return stream_json_list(map(serializer.to_representation, rows))
@@ -0,0 +1,126 @@
+"""
+Fixed-size lat/lon grid used to pre-bucket listings for nearby lookups.
+
+Every listing stores the cell its point falls in, so a radius query becomes
+an indexed ``grid_cell IN (...)`` lookup over a handful of cells followed by
+an exact distance re-rank of the (small) candidate set in Python.
+"""
+import hashlib
+import math
+
+from django.core.cache import cache
+
+CELL_DEGREES = 0.1
+CELL_KM = 111.32 * CELL_DEGREES
+EARTH_RADIUS_KM = 6371.0088
+MAX_RADIUS_KM = 50
+CANDIDATE_CACHE_TIMEOUT = 300
+
+_ROWS = int(round(180 / CELL_DEGREES))
+_COLS = int(round(360 / CELL_DEGREES))
+
+
+def cell_index(lon, lat):
+    row = min(int(math.floor((lat + 90) / CELL_DEGREES)), _ROWS - 1)
+    col = int(math.floor((lon + 180) / CELL_DEGREES)) % _COLS
+    return row, col
+
+
+def cell_key(row, col):
+    return f'{row}:{col}'
+
+
+def cell_for_point(point):
+    if point is None:
+        return None
+    return cell_key(*cell_index(point.x, point.y))
+
+
+def cell_bounds(key):
+    """``(west, south, east, north)`` of the cell with ``key``."""
+    row, col = map(int, key.split(':'))
+    return (col * CELL_DEGREES - 180, row * CELL_DEGREES - 90,
+            (col + 1) * CELL_DEGREES - 180, (row + 1) * CELL_DEGREES - 90)
+
+
+def covering_cells(lon, lat, radius_km):
+    """
+    Cells that can contain a point within ``radius_km`` of *any* point in
+    the cell containing (lon, lat). Depending only on the snapped cell is
+    what lets neighbouring requests share one cached candidate set.
+    """
+    row, col = cell_index(lon, lat)
+    row_ring = int(math.ceil(radius_km / CELL_KM))
+    # Use the edge of the cell nearest a pole, where longitude cells are narrowest.
+    edge_lat = max(abs(row * CELL_DEGREES - 90), abs((row + 1) * CELL_DEGREES - 90))
+    reach_lat = edge_lat + row_ring * CELL_DEGREES
+    if reach_lat >= 90 - CELL_DEGREES:
+        # The circle may reach the polar row or the pole itself, around
+        # which every longitude is close.
+        columns = range(_COLS)
+    else:
+        width_km = CELL_KM * math.cos(math.radians(reach_lat))
+        col_ring = int(math.ceil(radius_km / width_km))
+        columns = range(_COLS) if 2 * col_ring + 1 >= _COLS else range(col - col_ring, col + col_ring + 1)
+    cells = []
+    for r in range(max(row - row_ring, 0), min(row + row_ring, _ROWS - 1) + 1):
+        for c in columns:
+            cells.append(cell_key(r, c % _COLS))
+    return cells
+
+
+def haversine_km(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def _version_key(cell):
+    return f'geo:cell-version:{cell}'
+
+
+def bump_cell_versions(*cells):
+    """Evict every cached candidate set that covers one of ``cells``."""
+    for cell in {c for c in cells if c}:
+        try:
+            cache.incr(_version_key(cell))
+        except ValueError:
+            cache.set(_version_key(cell), 1, None)
+
+
+def _candidates_key(cells):
+    versions = cache.get_many([_version_key(c) for c in cells])
+    digest = hashlib.md5(
+        ','.join(f'{c}={versions.get(_version_key(c), 0)}' for c in cells).encode('ascii'),
+        usedforsecurity=False,
+    ).hexdigest()
+    return f'geo:candidates:{digest}'
+
+
+def nearby_candidates(lon, lat, radius_km, loader):
+    """
+    Return ``(id, lon, lat)`` tuples for every listing in the cells covering
+    the radius, calling ``loader(cells)`` only on a cache miss.
+    """
+    return cell_candidates(covering_cells(lon, lat, radius_km), loader)
+
+
+def cell_candidates(cells, loader):
+    """Cached ``loader(cells)``, evicted when any of ``cells`` changes."""
+    key = _candidates_key(cells)
+    candidates = cache.get(key)
+    if candidates is None:
+        candidates = list(loader(cells))
+        cache.set(key, candidates, CANDIDATE_CACHE_TIMEOUT)
+    return candidates
+
+
+def rank_by_distance(candidates, lon, lat, radius_km, limit):
+    ranked = []
+    for pk, c_lon, c_lat in candidates:
+        distance = haversine_km(lon, lat, c_lon, c_lat)
+        if distance <= radius_km:
+            ranked.append((distance, pk))
+    ranked.sort()
+    return ranked[:limit]
@@ -0,0 +1,252 @@
+"""
+Image renditions for listing photos.
+
+The original upload is never served by list endpoints; instead a worker
+produces EXIF-free thumbnail and medium renditions and records the original
+dimensions, a BlurHash placeholder and a perceptual hash (see
+``core.duplicates``) on the listing. Originals are content-addressed
+(``core.storage``), so a listing whose blob was already processed for
+another listing reuses that listing's renditions instead of rendering again.
+
+Renditions are deleted when the last listing using them lets go of them;
+blobs, and anything a crash left behind, are collected by
+``sweep_unreferenced``.
+"""
+import math
+import os
+import posixpath
+from datetime import timedelta
+from io import BytesIO
+from itertools import islice
+
+import numpy as np
+from django.core.files.base import ContentFile
+from django.db import models, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from .duplicates import chunk_keys
+from .models import ClothingListing
+from .response_cache import bump_version
+from .storage import BLOB_DIRECTORY
+
+RENDITIONS = {
+    'thumbnail': (320, 320),
+    'medium': (1024, 1024),
+}
+RENDITION_FORMAT, RENDITION_EXT = ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+RENDITION_QUALITY = 80
+
+BLURHASH_COMPONENTS = (4, 3)
+_BASE83 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+
+
+def _base83(value, length):
+    return ''.join(_BASE83[(value // 83 ** (length - i - 1)) % 83] for i in range(length))
+
+
+def _linear_to_srgb(value):
+    v = min(max(value, 0.0), 1.0)
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash(image, components=BLURHASH_COMPONENTS):
+    """Encode ``image`` as a BlurHash string (https://blurha.sh)."""
+    cx, cy = components
+    small = image.convert('RGB')
+    small.thumbnail((32, 32))
+    pixels = np.asarray(small, dtype=np.float64) / 255.0
+    linear = np.where(pixels <= 0.04045, pixels / 12.92, ((pixels + 0.055) / 1.055) ** 2.4)
+    height, width = linear.shape[:2]
+    xs = np.arange(width) * math.pi / width
+    ys = np.arange(height) * math.pi / height
+
+    factors = []
+    for j in range(cy):
+        for i in range(cx):
+            basis = np.outer(np.cos(ys * j), np.cos(xs * i))
+            scale = (1 if i == 0 and j == 0 else 2) / (width * height)
+            factors.append((linear * basis[:, :, None]).sum(axis=(0, 1)) * scale)
+
+    dc, ac = factors[0], factors[1:]
+    result = _base83((cx - 1) + (cy - 1) * 9, 1)
+    if ac:
+        quantised_max = int(max(0, min(82, math.floor(max(np.abs(ac).max() * 166 - 0.5, 0)))))
+        max_value = (quantised_max + 1) / 166
+    else:
+        quantised_max, max_value = 0, 1
+    result += _base83(quantised_max, 1)
+    r, g, b = (_linear_to_srgb(c) for c in dc)
+    result += _base83((r << 16) + (g << 8) + b, 4)
+    for component in ac:
+        q = [
+            int(max(0, min(18, math.floor(math.copysign(abs(c / max_value) ** 0.5, c) * 9 + 9.5))))
+            for c in component
+        ]
+        result += _base83(q[0] * 19 * 19 + q[1] * 19 + q[2], 2)
+    return result
+
+
+def _dct_matrix(n):
+    k, i = np.arange(n)[:, None], np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * math.sqrt(2 / n)
+    matrix[0] /= math.sqrt(2)
+    return matrix
+
+
+PHASH_SAMPLE = 32
+_PHASH_DCT = _dct_matrix(PHASH_SAMPLE)
+
+
+def phash(image):
+    """
+    64-bit DCT perceptual hash: one bit per low-frequency coefficient, set
+    when it is above the median. Returned signed so it fits a bigint.
+    """
+    gray = image.convert('L').resize((PHASH_SAMPLE, PHASH_SAMPLE), Image.LANCZOS)
+    coefficients = _PHASH_DCT @ np.asarray(gray, dtype=np.float64) @ _PHASH_DCT.T
+    low = coefficients[:8, :8].flatten()
+    bits = low > np.median(low[1:])
+    value = int.from_bytes(np.packbits(bits).tobytes(), 'big')
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+# Everything process_listing_image derives from the original.
+DERIVED_FIELDS = (
+    'image_thumbnail', 'image_medium', 'image_width', 'image_height', 'image_blurhash',
+    'image_phash', 'image_phash_chunks',
+)
+
+
+def release_rendition(listing_id, field):
+    """
+    Delete a rendition file, once the current transaction commits, unless
+    another listing shares it. Call it inside the transaction that drops
+    ``listing_id``'s reference.
+    """
+    name, storage = field.name, field.storage
+    if not name:
+        return
+    shared = ClothingListing.objects.filter(
+        models.Q(image_thumbnail=name) | models.Q(image_medium=name),
+    ).exclude(pk=listing_id).exists()
+    if not shared:
+        transaction.on_commit(lambda: storage.delete(name))
+
+
+def render(image, size):
+    """Downscale ``image`` to fit ``size`` and encode it without any metadata."""
+    rendition = image.copy()
+    rendition.thumbnail(size, Image.LANCZOS)
+    buffer = BytesIO()
+    rendition.save(buffer, RENDITION_FORMAT, quality=RENDITION_QUALITY)
+    return buffer.getvalue()
+
+
+def process_listing_image(listing_id):
+    listing = ClothingListing.objects.filter(pk=listing_id).first()
+    if listing is None or not listing.image or listing.image_processed_for == listing.image.name:
+        return
+    source_name = listing.image.name
+    previous = [getattr(listing, f'image_{name}') for name in RENDITIONS]
+    with transaction.atomic():
+        # The lock keeps the twin from being deleted or re-rendered, which
+        # would release these renditions, until this listing uses them too.
+        twin = ClothingListing.objects.select_for_update().filter(
+            image=source_name, image_processed_for=source_name,
+        ).exclude(pk=listing_id).values(*DERIVED_FIELDS).first()
+        if twin is not None:
+            updates = {**twin, 'image_processed_for': source_name, 'updated_at': timezone.now()}
+            return _apply(listing_id, source_name, previous, updates)
+    _apply(listing_id, source_name, previous, _render_all(listing, source_name))
+
+
+def _apply(listing_id, source_name, previous, updates):
+    # Conditional update: if the image was replaced meanwhile, that upload's
+    # own job wins and these renditions are left for it to overwrite.
+    with transaction.atomic():
+        if not ClothingListing.objects.filter(pk=listing_id, image=source_name).update(**updates):
+            return
+        for field in previous:
+            if field.name not in (updates['image_thumbnail'], updates['image_medium']):
+                release_rendition(listing_id, field)
+    bump_version('listings')
+
+
+def load(field):
+    """Open a stored photo upright and in RGB."""
+    with field.open('rb') as fh:
+        return ImageOps.exif_transpose(Image.open(fh)).convert('RGB')
+
+
+def _render_all(listing, source_name):
+    image = load(listing.image)
+    base = os.path.splitext(os.path.basename(source_name))[0]
+    image_phash = phash(image)
+    updates = {
+        'image_width': image.width,
+        'image_height': image.height,
+        'image_blurhash': blurhash(image),
+        'image_phash': image_phash,
+        'image_phash_chunks': chunk_keys(image_phash),
+        'image_processed_for': source_name,
+        'updated_at': timezone.now(),
+    }
+    for name, size in RENDITIONS.items():
+        field = listing._meta.get_field(f'image_{name}')
+        updates[f'image_{name}'] = field.storage.save(
+            field.generate_filename(listing, f'{base}-{name}.{RENDITION_EXT}'),
+            ContentFile(render(image, size)),
+        )
+    return updates
+
+
+def _stored_files(storage, directory):
+    try:
+        directories, files = storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for name in files:
+        yield posixpath.join(directory, name)
+    for subdirectory in directories:
+        yield from _stored_files(storage, posixpath.join(directory, subdirectory))
+
+
+def sweep_unreferenced(grace=timedelta(hours=24), dry_run=False, batch_size=500):
+    """
+    Delete photo blobs and renditions that no listing references. Files
+    modified within ``grace`` are kept: their upload's listing may not be
+    saved yet. Returns ``(deleted, bytes_freed)``.
+    """
+    original = ClothingListing._meta.get_field('image')
+    rendition = ClothingListing._meta.get_field('image_thumbnail')
+    locations = (
+        (original.storage, posixpath.join(original.upload_to.rstrip('/'), BLOB_DIRECTORY)),
+        (rendition.storage, rendition.upload_to.rstrip('/')),
+    )
+    cutoff = timezone.now() - grace
+    deleted = freed = 0
+    for storage, directory in locations:
+        old = (name for name in _stored_files(storage, directory) if storage.get_modified_time(name) < cutoff)
+        while batch := list(islice(old, batch_size)):
+            count, size = _delete_unreferenced(storage, batch, dry_run)
+            deleted += count
+            freed += size
+    return deleted, freed
+
+
+def _delete_unreferenced(storage, names, dry_run):
+    used = set()
+    rows = ClothingListing.objects.filter(
+        models.Q(image__in=names) | models.Q(image_thumbnail__in=names) | models.Q(image_medium__in=names),
+    ).values_list('image', 'image_thumbnail', 'image_medium')
+    for row in rows:
+        used.update(row)
+    unused = [name for name in names if name not in used]
+    freed = sum(storage.size(name) for name in unused)
+    if not dry_run:
+        for name in unused:
+            storage.delete(name)
+    return len(unused), freed
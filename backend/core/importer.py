@@ -0,0 +1,137 @@
+"""
+Streaming bulk import of clothing listings from CSV or JSON Lines.
+
+Rows are read lazily, validated a chunk at a time and inserted with
+``bulk_create``; each chunk commits in its own transaction so memory and
+lock time stay bounded however large the input is. Invalid rows are skipped
+and reported with their 1-based row number.
+"""
+import csv
+import json
+from collections import Counter
+from dataclasses import dataclass, field
+from itertools import islice
+
+from django.db import transaction
+from rest_framework import serializers
+
+from . import facets
+from .geo import bump_cell_versions, cell_for_point
+from .models import ClothingListing
+from .nearby_feeds import refresh_listings
+from .recommendations import record_changes
+from .response_cache import bump_version
+from .serializers import ListingImportSerializer
+from .tasks import enqueue
+from .tiles import bump_tiles
+
+FORMATS = ('csv', 'jsonl')
+DEFAULT_CHUNK_SIZE = 500
+
+
+# What a mis-encoded or malformed file raises while its rows are read.
+READ_ERRORS = (UnicodeDecodeError, csv.Error)
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    errors: list = field(default_factory=list)
+    # Set when the file stopped being readable; rows after it weren't seen.
+    read_error: str = ''
+
+    @property
+    def failed(self):
+        return len(self.errors)
+
+
+def guess_format(filename):
+    if filename.lower().endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    return 'csv'
+
+
+def iter_rows(stream, fmt):
+    """Yield ``(row_number, data)`` from a text stream; JSON errors become rows too."""
+    if fmt == 'csv':
+        for number, row in enumerate(csv.DictReader(stream), start=1):
+            yield number, row
+    elif fmt == 'jsonl':
+        number = 0
+        for line in stream:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                row = exc
+            yield number, row
+    else:
+        raise ValueError(f"Unknown import format {fmt!r}; expected one of {FORMATS}.")
+
+
+def import_listings(wardrobe, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Import ``rows`` a chunk at a time. If the file turns out to be unreadable
+    part-way, the chunks before it stay committed and ``read_error`` says why.
+    """
+    result = ImportResult()
+    rows = iter(rows)
+    while True:
+        chunk = []
+        try:
+            chunk.extend(islice(rows, chunk_size))
+        except READ_ERRORS as exc:
+            result.read_error = f"Could not read the file: {exc}"
+        if chunk:
+            _import_chunk(wardrobe, chunk, result)
+        if result.read_error or len(chunk) < chunk_size:
+            break
+    return result
+
+
+def _import_chunk(wardrobe, chunk, result):
+    # One serializer validates the whole chunk, the same way ListSerializer
+    # drives its child, so field construction isn't repeated per row.
+    validator = ListingImportSerializer()
+    listings = []
+    for number, row in chunk:
+        if not isinstance(row, dict):
+            result.errors.append({'row': number, 'errors': {'non_field_errors': [f'Invalid row: {row}']}})
+            continue
+        try:
+            attrs = validator.run_validation(row)
+        except serializers.ValidationError as exc:
+            result.errors.append({'row': number, 'errors': exc.detail})
+            continue
+        listings.append(ClothingListing(
+            wardrobe=wardrobe,
+            grid_cell=cell_for_point(attrs.get('location')),
+            **attrs,
+        ))
+    if not listings:
+        return
+    with transaction.atomic():
+        ClothingListing.objects.bulk_create(listings)
+        bulk_created(listings)
+    result.created += len(listings)
+
+
+def bulk_created(listings):
+    """
+    What the ``post_save`` handlers in ``core.signals`` would have done for
+    ``listings``, which ``bulk_create`` just inserted without them: count the
+    facets and, on commit, evict the nearby, tile and public response caches,
+    log the change for recommendations and refresh nearby feeds. Call inside
+    the inserting transaction.
+    """
+    facets.record(Counter(listing.facet_key() for listing in listings))
+    cells = {listing.grid_cell for listing in listings}
+    points = [listing.location for listing in listings if listing.is_public]
+    transaction.on_commit(lambda: bump_cell_versions(*cells))
+    transaction.on_commit(lambda: bump_tiles(*points))
+    pks = [listing.pk for listing in listings]
+    transaction.on_commit(lambda: record_changes(*pks))
+    transaction.on_commit(lambda: enqueue(refresh_listings, *pks))
+    transaction.on_commit(lambda: bump_version('listings'))
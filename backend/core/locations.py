@@ -0,0 +1,124 @@
+"""
+Coalescing writer for ``UserLocation``.
+
+Clients report their position often, but only the latest one per user
+matters. Reports that moved less than ``LOCATION_MIN_MOVE_METERS`` from the
+last accepted position are dropped; the rest are held in a per-process
+buffer and written every ``LOCATION_FLUSH_INTERVAL`` seconds as one batched
+upsert. Reads go through the buffer first, so a user sees their own latest
+position before it reaches the database.
+
+With ``LOCATION_FLUSH_INTERVAL = 0`` every accepted report is written
+straight away (tests, management commands).
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.gis.geos import Point
+from django.db import connections
+from django.utils import timezone
+
+from .geo import haversine_km
+from .models import UserLocation
+
+logger = logging.getLogger(__name__)
+
+MAX_TRACKED_USERS = 100_000
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class LocationBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last = {}
+        self._flusher = None
+
+    def report(self, user_id, lon, lat):
+        """
+        Record a position; returns False when it is within the movement
+        threshold of the last accepted one and was dropped.
+        """
+        threshold_km = _setting('LOCATION_MIN_MOVE_METERS', 25) / 1000
+        with self._lock:
+            last = self._last.get(user_id)
+            if last is not None and haversine_km(last[0], last[1], lon, lat) < threshold_km:
+                return False
+            if len(self._last) >= MAX_TRACKED_USERS and user_id not in self._last:
+                self._last.pop(next(iter(self._last)))
+            self._last[user_id] = (lon, lat)
+            self._pending[user_id] = (lon, lat, timezone.now())
+        if not _setting('LOCATION_FLUSH_INTERVAL', 5):
+            self.flush()
+        else:
+            self._ensure_flusher()
+        return True
+
+    def pending(self, user_ids):
+        """``{user_id: (lon, lat, reported_at)}`` not yet written, for ``user_ids``."""
+        with self._lock:
+            return {user_id: self._pending[user_id] for user_id in user_ids if user_id in self._pending}
+
+    def current(self, user_id):
+        """The user's latest position as ``(point, updated_at)``, or ``None``."""
+        pending = self.pending([user_id]).get(user_id)
+        if pending is not None:
+            lon, lat, reported_at = pending
+            return Point(lon, lat, srid=4326), reported_at
+        row = UserLocation.objects.filter(user_id=user_id, location__isnull=False).values_list(
+            'location', 'updated_at',
+        ).first()
+        if row is not None:
+            with self._lock:
+                self._last.setdefault(user_id, (row[0].x, row[0].y))
+        return row
+
+    def flush(self):
+        """Write every pending position in one upsert. Returns the number written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            UserLocation.objects.bulk_create(
+                [
+                    UserLocation(user_id=user_id, location=Point(lon, lat, srid=4326))
+                    for user_id, (lon, lat, _) in pending.items()
+                ],
+                update_conflicts=True, unique_fields=['user'], update_fields=['location', 'updated_at'],
+            )
+        except Exception:
+            # Put them back unless a newer report arrived meanwhile.
+            with self._lock:
+                for user_id, position in pending.items():
+                    self._pending.setdefault(user_id, position)
+            raise
+        return len(pending)
+
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, name='core-location-flush', daemon=True)
+                self._flusher.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(_setting('LOCATION_FLUSH_INTERVAL', 5))
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Location flush failed")
+            finally:
+                connections.close_all()
+
+
+buffer = LocationBuffer()
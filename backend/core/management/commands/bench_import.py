@@ -0,0 +1,64 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import importer
+from core.models import ClothingListing, Wardrobe
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure bulk import throughput in rows per second against one-by-one "
+        "creates. Synthetic rows are inserted inside a transaction that is "
+        "rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000)
+        parser.add_argument('--chunk-size', type=int, default=importer.DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        conditions = [choice for choice, _ in ClothingListing.CONDITION_CHOICES]
+        rows = [
+            (i, {
+                'title': f'Bench item {i}',
+                'description': 'Synthetic listing for the import benchmark.',
+                'condition': rng.choice(conditions),
+                'location': f'{rng.uniform(-180, 180):.6f},{rng.uniform(-90, 90):.6f}',
+                'is_public': 'true',
+            })
+            for i in range(1, options['rows'] + 1)
+        ]
+        try:
+            with transaction.atomic():
+                wardrobe = Wardrobe.objects.create(user=User.objects.create_user(username='bench-import'))
+                bulk = self.timed(lambda: importer.import_listings(wardrobe, rows, options['chunk_size']))
+                sample = rows[:min(len(rows), 1000)]
+                single = self.timed(lambda: self.create_one_by_one(wardrobe, sample))
+                raise _Rollback
+        except _Rollback:
+            pass
+        self.stdout.write(f"bulk import:   {len(rows) / bulk:,.0f} rows/s ({len(rows)} rows)")
+        self.stdout.write(f"one-by-one:    {len(sample) / single:,.0f} rows/s ({len(sample)} rows)")
+
+    @staticmethod
+    def create_one_by_one(wardrobe, rows):
+        for _, row in rows:
+            serializer = importer.ListingImportSerializer(data=row)
+            serializer.is_valid(raise_exception=True)
+            serializer.save(wardrobe=wardrobe)
+
+    @staticmethod
+    def timed(fn):
+        start = time.perf_counter()
+        fn()
+        return time.perf_counter() - start
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from core.middleware import RequestMetricsMiddleware
+
+
+class Command(BaseCommand):
+    help = "Measure the per-request overhead of RequestMetricsMiddleware and fail if it exceeds the budget."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20_000)
+        parser.add_argument('--budget-us', type=float, default=50.0)
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        n = options['requests']
+
+        def view(request):
+            return HttpResponse(b'ok')
+
+        def run(handler):
+            requests = [factory.get('/api/public-listings/') for _ in range(n)]
+            for request in requests:
+                request.resolver_match = None
+            start = time.perf_counter()
+            for request in requests:
+                handler(request)
+            return (time.perf_counter() - start) / n * 1e6
+
+        baseline = run(view)
+        instrumented = run(RequestMetricsMiddleware(view))
+        overhead = instrumented - baseline
+        self.stdout.write(
+            f"baseline {baseline:.2f}us/request, instrumented {instrumented:.2f}us/request, "
+            f"overhead {overhead:.2f}us (budget {options['budget_us']:.0f}us)"
+        )
+        if overhead > options['budget_us']:
+            raise CommandError("Metrics middleware overhead is over budget.")
@@ -0,0 +1,99 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import D
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import geo
+from core.models import Wardrobe, ClothingListing
+from core.views import NearbyListingsView
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare p50/p99 latency of the grid-bucketed nearby lookup against a "
+        "direct distance query. Synthetic listings are inserted inside a "
+        "transaction that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--radius', type=float, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--center', type=float, nargs=2, default=[76.27, 9.93], metavar=('LON', 'LAT'))
+        parser.add_argument('--spread', type=float, default=1.0, help="Degrees around the centre to scatter points over.")
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    self.run_size(size, options)
+                    raise _Rollback
+            except _Rollback:
+                pass
+
+    def run_size(self, size, options):
+        rng = random.Random(options['seed'])
+        lon0, lat0 = options['center']
+        spread = options['spread']
+        user = User.objects.create_user(username=f'bench-nearby-{size}')
+        wardrobe = Wardrobe.objects.create(user=user)
+        batch = []
+        for i in range(size):
+            point = Point(lon0 + rng.uniform(-spread, spread), lat0 + rng.uniform(-spread, spread), srid=4326)
+            batch.append(ClothingListing(
+                wardrobe=wardrobe, title=f'Bench {i}', description='', condition='good',
+                location=point, grid_cell=geo.cell_for_point(point),
+            ))
+            if len(batch) == 5000:
+                ClothingListing.objects.bulk_create(batch)
+                batch = []
+        ClothingListing.objects.bulk_create(batch)
+
+        queries = [
+            (lon0 + rng.uniform(-spread, spread), lat0 + rng.uniform(-spread, spread))
+            for _ in range(options['queries'])
+        ]
+        radius = options['radius']
+        cache.clear()
+        direct = self.measure(queries, lambda lon, lat: self.direct_query(lon, lat, radius))
+        grid = self.measure(queries, lambda lon, lat: self.grid_query(lon, lat, radius))
+        self.stdout.write(f"{size} listings")
+        self.report('direct', direct)
+        self.report('grid', grid)
+
+    @staticmethod
+    def direct_query(lon, lat, radius):
+        point = Point(lon, lat, srid=4326)
+        return list(ClothingListing.objects.filter(
+            is_public=True, location__distance_lte=(point, D(km=radius)),
+        ).annotate(distance=Distance('location', point)).order_by('distance').values_list('id', flat=True)[:20])
+
+    @staticmethod
+    def grid_query(lon, lat, radius):
+        candidates = geo.nearby_candidates(lon, lat, radius, NearbyListingsView.load_candidates)
+        return geo.rank_by_distance(candidates, lon, lat, radius, NearbyListingsView.max_results)
+
+    @staticmethod
+    def measure(queries, fn):
+        timings = []
+        for lon, lat in queries:
+            start = time.perf_counter()
+            fn(lon, lat)
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def report(self, label, timings):
+        q = statistics.quantiles(timings, n=100)
+        self.stdout.write(f"  {label:<7} p50={q[49]:.2f}ms p99={q[98]:.2f}ms")
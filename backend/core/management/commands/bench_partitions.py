@@ -0,0 +1,108 @@
+import re
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core import partitions
+from core.models import Conversation, Message
+
+PARTITION_RE = re.compile(rf'\b({partitions.TABLE}_(?:p\d{{4}}_\d{{2}}|default))\b')
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Show that conversation reads stay flat as message history grows. "
+        "Against the data from seed_load, adds synthetic older months of "
+        "messages step by step and reports the total message index size, the "
+        "index size of the partitions a conversation page touches, and p50/p99 "
+        "latency of that page with and without the conversation's created_at "
+        "bound. Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--history-months', type=int, nargs='+', default=[0, 6, 12, 24])
+        parser.add_argument('--messages-per-month', type=int, default=50_000)
+        parser.add_argument('--threads', type=int, default=100, help="Most recent conversations to read.")
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        threads = list(
+            Conversation.objects.filter(last_message__isnull=False).order_by('-created_at')
+            .values_list('id', 'created_at')[:options['threads']]
+        )
+        if not threads:
+            raise CommandError("No conversations with messages; run seed_load first.")
+        template = Message.objects.filter(conversation_id=threads[0][0]).values_list(
+            'sender_id', 'receiver_id', 'listing_id',
+        ).first()
+        try:
+            with transaction.atomic():
+                added = 0
+                for months in sorted(options['history_months']):
+                    while added < months:
+                        added += 1
+                        self.add_history_month(added, template, options['messages_per_month'])
+                    with connection.cursor() as cursor:
+                        cursor.execute(f'ANALYZE {partitions.TABLE}')
+                    self.report(months, threads, options['repeat'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    @staticmethod
+    def add_history_month(months_back, template, count):
+        month = partitions.add_months(partitions.month_of(timezone.now()), -months_back)
+        partitions.create_partition(month)
+        start, _ = partitions.month_bounds(month)
+        sender_id, receiver_id, listing_id = template
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {partitions.TABLE} (sender_id, receiver_id, listing_id, content, created_at, is_read)
+                SELECT %s, %s, %s, 'Bench history', %s::timestamptz + random() * interval '27 days', true
+                FROM generate_series(1, %s)
+                """,
+                [sender_id, receiver_id, listing_id, start, count],
+            )
+
+    @staticmethod
+    def page(conversation_id, started):
+        queryset = Message.objects.filter(conversation_id=conversation_id)
+        if started is not None:
+            queryset = queryset.filter(created_at__gte=started)
+        return queryset.select_related('sender', 'receiver').order_by('-created_at', '-id')[:21]
+
+    def measure(self, threads, repeat, bounded):
+        timings = []
+        for _ in range(repeat):
+            for conversation_id, started in threads:
+                start = time.perf_counter()
+                list(self.page(conversation_id, started if bounded else None))
+                timings.append((time.perf_counter() - start) * 1000)
+        conversation_id, started = threads[0]
+        touched = set(PARTITION_RE.findall(self.page(conversation_id, started if bounded else None).explain()))
+        return timings, touched
+
+    def report(self, months, threads, repeat):
+        sizes = {name: (rows, index_bytes) for _, name, rows, index_bytes, _ in partitions.partitions()}
+        rows = sum(rows for rows, _ in sizes.values())
+        total_index = sum(index_bytes for _, index_bytes in sizes.values())
+        self.stdout.write(
+            f"+{months:>2} months history: ~{rows:,} messages in {len(sizes)} partitions, "
+            f"indexes {total_index / 2**20:.1f} MiB"
+        )
+        for label, bounded in (('bounded', True), ('unbounded', False)):
+            timings, touched = self.measure(threads, repeat, bounded)
+            q = statistics.quantiles(timings, n=100)
+            touched_index = sum(sizes.get(name, (0, 0))[1] for name in touched)
+            self.stdout.write(
+                f"  {label:<9} p50={q[49]:.2f}ms p99={q[98]:.2f}ms  "
+                f"{len(touched)} partitions, {touched_index / 2**20:.1f} MiB of indexes"
+            )
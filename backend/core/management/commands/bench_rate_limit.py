@@ -0,0 +1,65 @@
+import time
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.throttling import CacheRateLimiter, LocalRateLimiter, RateLimitThrottle, parse_rate
+
+
+class _View:
+    rate_limit_scope = 'bench'
+    rate_limit_methods = ('POST',)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the rate limiter's own cost per check in microseconds: the "
+        "in-process GCRA limiter and the shared-cache sliding window, for "
+        "admitted and refused requests, and a full RateLimitThrottle check "
+        "including key extraction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200_000)
+        parser.add_argument('--keys', type=int, default=10_000, help="Distinct clients to spread checks over.")
+        parser.add_argument('--cache', default='default', help="Cache alias for the shared limiter.")
+
+    def handle(self, *args, **options):
+        n, keys = options['iterations'], options['keys']
+        admitted = [((('bench', 'user', i % keys),) + parse_rate('1000000/min'),) for i in range(n)]
+        refused = [((('bench', 'user', 'hot'),) + parse_rate('1/day'),)] * n
+
+        local = LocalRateLimiter()
+        local.acquire(refused[0])
+        self.report('local, admitted', n, lambda: [local.acquire(checks) for checks in admitted])
+        self.report('local, refused', n, lambda: [local.acquire(checks) for checks in refused])
+
+        shared = CacheRateLimiter(caches[options['cache']])
+        shared_n = min(n, 20_000)
+        shared.acquire(refused[0])
+        self.report(f"cache '{options['cache']}', admitted", shared_n,
+                    lambda: [shared.acquire(checks) for checks in admitted[:shared_n]])
+        self.report(f"cache '{options['cache']}', refused", shared_n,
+                    lambda: [shared.acquire(checks) for checks in refused[:shared_n]])
+
+        factory, view = APIRequestFactory(), _View()
+        requests = [
+            Request(factory.post('/api/messages/', REMOTE_ADDR=f'10.0.{i // 256 % 256}.{i % 256}'))
+            for i in range(min(keys, n))
+        ]
+        for request in requests:
+            request.user = type('Anonymous', (), {'is_authenticated': False, 'pk': None})()
+        throttle = RateLimitThrottle()
+        with override_settings(RATE_LIMITS={'bench': {'user': '1000000/min', 'ip': '1000000/min'}},
+                               RATE_LIMIT_SHARED_CACHE=None):
+            self.report('throttle check (ip)', n,
+                        lambda: [throttle.allow_request(requests[i % len(requests)], view) for i in range(n)])
+
+    def report(self, label, count, fn):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"{label:<28} {elapsed / count * 1e6:8.2f} µs/check  ({count:,} checks)")
@@ -0,0 +1,212 @@
+import contextlib
+import io
+import itertools
+import json
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from core import urls as core_urls
+from core.models import ClothingListing, ConversationParticipant, UserLocation
+from core.tiles import tile_for_point
+from .seed_load import PASSWORD
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every route in core/urls.py against data from seed_load: latency "
+        "percentiles, queries per request and throughput. Writes are rolled back. "
+        "Compare with --baseline to fail on regressions; store one with --save-baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='load', help="Username prefix used by seed_load.")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per route.")
+        parser.add_argument('--routes', nargs='*', help="Only run these route names.")
+        parser.add_argument('--cold', action='store_true', help="Clear the cache before every request.")
+        parser.add_argument('--baseline', help="JSON file to compare against.")
+        parser.add_argument('--save-baseline', help="Write results to this JSON file.")
+        parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed p50 slowdown (0.25 = 25%%).")
+        parser.add_argument('--rate-limits', action='store_true',
+                            help="Keep RATE_LIMITS on; by default they are lifted so write routes aren't answered with 429s.")
+
+    def handle(self, *args, **options):
+        fixtures = self.fixtures(options['prefix'])
+        specs = self.specs(fixtures)
+        names = [p.name for p in core_urls.urlpatterns if p.name]
+        missing = [name for name in names if name not in specs]
+        if missing:
+            raise CommandError(f"No benchmark spec for route(s): {', '.join(missing)}")
+        # Variants of a route (e.g. with query parameters) are benchmarked too.
+        names += [name for name in specs if name not in names]
+        if options['routes']:
+            names = [name for name in names if name in options['routes']]
+
+        client = Client(SERVER_NAME='localhost', HTTP_AUTHORIZATION=f"Token {fixtures['token']}")
+        results = {}
+        limits = contextlib.nullcontext() if options['rate_limits'] else override_settings(RATE_LIMITS={})
+        with limits:
+            for name in names:
+                results[name] = self.run_route(client, name, specs[name], options)
+                r = results[name]
+                self.stdout.write(
+                    f"{name:<24} p50={r['p50_ms']:8.2f}ms p95={r['p95_ms']:8.2f}ms p99={r['p99_ms']:8.2f}ms "
+                    f"queries={r['queries']:6.1f} {r['rps']:8.0f} req/s  status={r['statuses']}"
+                )
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as fh:
+                json.dump(results, fh, indent=2, sort_keys=True)
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['tolerance'])
+
+    def run_route(self, client, name, spec, options):
+        method, make_url, make_data = spec
+        timings, queries, statuses = [], [], {}
+        counter = itertools.count()
+        for _ in range(options['requests']):
+            if options['cold']:
+                cache.clear()
+            i = next(counter)
+            url, data = make_url(i), make_data(i) if make_data else None
+            try:
+                with transaction.atomic():
+                    with CaptureQueriesContext(connection) as captured:
+                        start = time.perf_counter()
+                        if method == 'get':
+                            response = client.get(url, data)
+                        elif isinstance(data, dict) and any(hasattr(v, 'read') for v in data.values()):
+                            response = client.post(url, data)
+                        else:
+                            response = client.post(url, json.dumps(data or {}), content_type='application/json')
+                        if response.streaming:
+                            # Streamed bodies are produced lazily; time (and count) them too.
+                            b''.join(response.streaming_content)
+                        timings.append((time.perf_counter() - start) * 1000)
+                    raise _Rollback
+            except _Rollback:
+                pass
+            # Only the token should authenticate; drop cookies a login may have set.
+            client.cookies.clear()
+            queries.append(len(captured))
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        q = statistics.quantiles(timings, n=100) if len(timings) > 1 else timings * 99
+        return {
+            'p50_ms': q[49],
+            'p95_ms': q[94],
+            'p99_ms': q[98],
+            'queries': statistics.mean(queries),
+            'rps': len(timings) / (sum(timings) / 1000),
+            'statuses': statuses,
+        }
+
+    def compare(self, results, path, tolerance):
+        with open(path) as fh:
+            baseline = json.load(fh)
+        failures = []
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            if result['p50_ms'] > before['p50_ms'] * (1 + tolerance):
+                failures.append(f"{name}: p50 {before['p50_ms']:.2f}ms -> {result['p50_ms']:.2f}ms")
+            if result['queries'] > before['queries']:
+                failures.append(f"{name}: queries {before['queries']:.1f} -> {result['queries']:.1f}")
+        if failures:
+            raise CommandError("Regressions against baseline:\n  " + "\n  ".join(failures))
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {path}."))
+
+    @staticmethod
+    def fixtures(prefix):
+        user = User.objects.filter(username=f'{prefix}0').first()
+        if user is None:
+            raise CommandError(f"No seeded data for prefix {prefix!r}; run seed_load first.")
+        location = UserLocation.objects.get(user=user).location
+        foreign = ClothingListing.objects.filter(is_public=True).exclude(wardrobe__user=user).order_by('id').first()
+        participant = ConversationParticipant.objects.filter(user=user).order_by('id').first()
+        title = ClothingListing.objects.filter(is_public=True).values_list('title', flat=True).first() or 'jacket'
+        return {
+            'user': user,
+            'token': Token.objects.get(user=user).key,
+            'lon': location.x,
+            'lat': location.y,
+            'listing': foreign.id,
+            'conversation': participant.conversation_id if participant else 0,
+            'term': title.split()[-1],
+        }
+
+    @staticmethod
+    def specs(f):
+        """route name -> (method, url(i), data(i) or None)."""
+        def url(name, **kwargs):
+            return lambda i: reverse(name, kwargs=kwargs or None)
+
+        def csv_upload(i):
+            upload = io.BytesIO(
+                b'title,description,condition,location\n'
+                + b''.join(b'Bench %d,Bulk row,good,"%f,%f"\n' % (n, f['lon'], f['lat']) for n in range(50))
+            )
+            upload.name = 'bench.csv'
+            return {'file': upload}
+
+        def tile(i):
+            # Pan across zoom levels around the fixture user, clustered and not.
+            z = 4 + i % 13
+            x, y = tile_for_point(z, f['lon'], f['lat'])
+            return reverse('listing-tile', kwargs={'z': z, 'x': x, 'y': y})
+
+        return {
+            'register': ('post', url('register'), lambda i: {
+                'username': f'bench-register-{i}', 'email': f'bench{i}@example.com', 'password': PASSWORD,
+            }),
+            'login': ('post', url('login'), lambda i: {'username': f['user'].username, 'password': PASSWORD}),
+            'token-rotate': ('post', url('token-rotate'), None),
+            'wardrobe-list': ('get', url('wardrobe-list'), None),
+            'listing-list': ('get', url('listing-list'), None),
+            'listing-bulk-import': ('post', url('listing-bulk-import'), csv_upload),
+            'listing-changes': ('get', url('listing-changes'), None),
+            'public-listings': ('get', url('public-listings'), lambda i: {'page_size': 20}),
+            'public-listing-changes': ('get', url('public-listing-changes'), None),
+            'public-listings-sparse': ('get', url('public-listings'), lambda i: {
+                'page_size': 20, 'fields': 'id,title,images.thumbnail,location_coords',
+            }),
+            'listing-search': ('get', url('listing-search'), lambda i: {'q': f['term']}),
+            'nearby-listings': ('get', url('nearby-listings'), lambda i: {
+                'lat': f['lat'] + (i % 10) * 0.01, 'lon': f['lon'], 'radius': 10,
+            }),
+            'listing-tile': ('get', tile, None),
+            'listing-facets': ('get', url('listing-facets'), lambda i: {
+                'lat': f['lat'] + (i % 10) * 0.01, 'lon': f['lon'],
+            }),
+            # Staff only: as the seeded user this measures the refusal path.
+            'listing-duplicates': ('get', url('listing-duplicates'), lambda i: {'listing': f['listing']}),
+            'suggested-swaps': ('get', url('suggested-swaps'), None),
+            'nearby-listings-stored': ('get', url('nearby-listings'), None),
+            'message-list': ('get', url('message-list'), None),
+            'message-read': ('post', url('message-read'), lambda i: {}),
+            'conversation-list': ('get', url('conversation-list'), None),
+            'conversation-messages': ('get', url('conversation-messages', pk=f['conversation']), None),
+            'inbox': ('get', url('inbox'), None),
+            'async-public-listings': ('get', url('async-public-listings'), lambda i: {'page_size': 20}),
+            'async-nearby-listings': ('get', url('async-nearby-listings'), lambda i: {
+                'lat': f['lat'] + (i % 10) * 0.01, 'lon': f['lon'], 'radius': 10,
+            }),
+            'async-inbox': ('get', url('async-inbox'), None),
+            'user-location': ('post', url('user-location'), lambda i: {
+                # Alternate a real move with jitter below the movement threshold.
+                'location': f"{f['lon'] + (i // 2) * 0.01 + (i % 2) * 0.00001},{f['lat']}",
+            }),
+        }
+
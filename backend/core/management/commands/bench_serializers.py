@@ -0,0 +1,97 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.fast_serializers import ListingRowSerializer, MessageRowSerializer
+from core.geo import cell_for_point
+from core.models import ClothingListing, Message, Wardrobe
+from core.renderers import FastJSONRenderer, stream_json_list
+from core.serializers import ClothingListingSerializer, MessageSerializer
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure list serialisation throughput in rows per second for the "
+        "model serializers against the values()-based fast path, including "
+        "the JSON encode. Synthetic rows are inserted inside a transaction "
+        "that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        sizes = sorted(options['sizes'])
+        request = Request(APIRequestFactory().get('/api/listings/'))
+        try:
+            with transaction.atomic():
+                self.populate(sizes[-1], random.Random(options['seed']))
+                for size in sizes:
+                    listings = ClothingListing.objects.filter(title__startswith='Bench item').order_by('-id')[:size]
+                    messages = Message.objects.filter(content__startswith='Bench message').order_by('-id')[:size]
+                    self.report('listings', size, [
+                        ('model serializer', lambda: JSONRenderer().render(ClothingListingSerializer(
+                            listings.select_related('wardrobe__user'), many=True, context={'request': request},
+                        ).data)),
+                        ('fast path', lambda: self.fast(ListingRowSerializer(request), listings)),
+                        ('fast path, streamed', lambda: self.streamed(ListingRowSerializer(request), listings)),
+                    ])
+                    self.report('messages', size, [
+                        ('model serializer', lambda: JSONRenderer().render(MessageSerializer(
+                            messages.select_related('sender', 'receiver'), many=True,
+                        ).data)),
+                        ('fast path', lambda: self.fast(MessageRowSerializer(), messages)),
+                        ('fast path, streamed', lambda: self.streamed(MessageRowSerializer(), messages)),
+                    ])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def populate(self, count, rng):
+        seller = User.objects.create_user(username='bench-serializers-seller')
+        buyer = User.objects.create_user(username='bench-serializers-buyer')
+        wardrobe = Wardrobe.objects.create(user=seller)
+        conditions = [choice for choice, _ in ClothingListing.CONDITION_CHOICES]
+        listings = []
+        for i in range(count):
+            point = Point(rng.uniform(-180, 180), rng.uniform(-90, 90), srid=4326)
+            listings.append(ClothingListing(
+                wardrobe=wardrobe, title=f'Bench item {i}',
+                description='Synthetic listing for the serializer benchmark.',
+                condition=rng.choice(conditions), location=point, grid_cell=cell_for_point(point),
+            ))
+        listings = ClothingListing.objects.bulk_create(listings, batch_size=2000)
+        Message.objects.bulk_create((
+            Message(sender=buyer, receiver=seller, listing=listings[i % len(listings)],
+                    content=f'Bench message {i}')
+            for i in range(count)
+        ), batch_size=2000)
+
+    @staticmethod
+    def fast(serializer, queryset):
+        return FastJSONRenderer().render(serializer.serialize(serializer.project(queryset)))
+
+    @staticmethod
+    def streamed(serializer, queryset):
+        rows = serializer.project(queryset).iterator(chunk_size=2000)
+        for _ in stream_json_list(map(serializer.to_representation, rows)).streaming_content:
+            pass
+
+    def report(self, name, size, variants):
+        for label, fn in variants:
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"{name:<9} {size:>7,} rows  {label:<20} {size / elapsed:>10,.0f} rows/s")
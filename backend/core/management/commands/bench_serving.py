@@ -0,0 +1,102 @@
+import asyncio
+import contextlib
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+
+from .bench_routes import Command as RouteBenchmark
+
+# route -> (WSGI/DRF path, ASGI/async path)
+PAIRS = {
+    'public-listings': ('/api/public-listings/', '/api/async/public-listings/'),
+    'nearby-listings': ('/api/nearby-listings/', '/api/async/nearby-listings/'),
+    'inbox': ('/api/inbox/', '/api/async/inbox/'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the synchronous DRF endpoints (one request at a time per worker, as "
+        "under WSGI) with their async counterparts (up to --concurrency requests in "
+        "flight per worker, as under ASGI) at the same worker count. Needs seed_load data; "
+        "run with DB_POOL=1 or a high enough max_connections for the ASGI side."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='load')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--concurrency', type=int, default=16, help="In-flight requests per ASGI worker.")
+        parser.add_argument('--requests', type=int, default=1000, help="Requests per route and mode.")
+        parser.add_argument('--routes', nargs='*', choices=sorted(PAIRS), default=sorted(PAIRS))
+        parser.add_argument('--rate-limits', action='store_true',
+                            help="Keep RATE_LIMITS on; by default they are lifted so neither side times 429s.")
+
+    def handle(self, *args, **options):
+        fixtures = RouteBenchmark.fixtures(options['prefix'])
+        headers = {'Authorization': f"Token {fixtures['token']}"}
+        params = {'lat': fixtures['lat'], 'lon': fixtures['lon'], 'radius': 10}
+        limits = contextlib.nullcontext() if options['rate_limits'] else override_settings(RATE_LIMITS={})
+        # AsyncClient always sends ``Host: testserver``.
+        hosts = override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'])
+        for route in options['routes']:
+            sync_path, async_path = PAIRS[route]
+            with limits, hosts:
+                wsgi = self.run_wsgi(sync_path, params, headers, options)
+                asgi = self.run_asgi(async_path, params, headers, options)
+            self.stdout.write(route)
+            self.report('WSGI', wsgi, options)
+            self.report('ASGI', asgi, options)
+
+    def run_wsgi(self, path, params, headers, options):
+        timings, lock = [], threading.Lock()
+        per_worker = options['requests'] // options['workers']
+
+        def worker(n):
+            client = Client(SERVER_NAME='localhost', headers=headers)
+            for i in range(per_worker):
+                start = time.perf_counter()
+                # A unique parameter keeps the public response cache out of the comparison.
+                client.get(path, {**params, '_': f'{n}-{i}'})
+                with lock:
+                    timings.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options['workers']) as pool:
+            list(pool.map(worker, range(options['workers'])))
+        return timings, time.perf_counter() - start
+
+    def run_asgi(self, path, params, headers, options):
+        timings, lock = [], threading.Lock()
+        per_worker = options['requests'] // options['workers']
+
+        async def worker_loop(n):
+            client = AsyncClient(headers=headers)
+            semaphore = asyncio.Semaphore(options['concurrency'])
+
+            async def one(i):
+                async with semaphore:
+                    start = time.perf_counter()
+                    # The same cache-busting parameter as the WSGI side.
+                    await client.get(path, {**params, '_': f'{n}-{i}'})
+                    with lock:
+                        timings.append(time.perf_counter() - start)
+
+            await asyncio.gather(*(one(i) for i in range(per_worker)))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options['workers']) as pool:
+            list(pool.map(lambda n: asyncio.run(worker_loop(n)), range(options['workers'])))
+        return timings, time.perf_counter() - start
+
+    def report(self, label, result, options):
+        timings, elapsed = result
+        q = statistics.quantiles([t * 1000 for t in timings], n=100)
+        self.stdout.write(
+            f"  {label}: {len(timings) / elapsed:8.0f} req/s  p50={q[49]:.2f}ms p99={q[98]:.2f}ms "
+            f"({options['workers']} workers)"
+        )
@@ -0,0 +1,57 @@
+import asyncio
+import statistics
+import time
+from types import SimpleNamespace
+
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+
+from core.consumers import InboxConsumer
+from core.realtime import user_group
+
+
+class Command(BaseCommand):
+    help = (
+        "Open N concurrent inbox sockets in this process and measure connect "
+        "time and push latency through the configured channel layer."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=1000)
+        parser.add_argument('--rounds', type=int, default=5)
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options['connections'], options['rounds']))
+
+    async def run(self, count, rounds):
+        app = InboxConsumer.as_asgi()
+        sockets = []
+        start = time.perf_counter()
+        for user_id in range(1, count + 1):
+            communicator = WebsocketCommunicator(app, '/ws/inbox/')
+            communicator.scope['user'] = SimpleNamespace(pk=user_id, is_authenticated=True)
+            connected, _ = await communicator.connect()
+            if not connected:
+                raise RuntimeError(f"Socket {user_id} was rejected.")
+            sockets.append((user_id, communicator))
+        connect_time = time.perf_counter() - start
+        self.stdout.write(f"{count} sockets open in {connect_time:.2f}s ({count / connect_time:,.0f} connects/s)")
+
+        layer = get_channel_layer()
+        latencies = []
+        for _ in range(rounds):
+            async def deliver(user_id, communicator):
+                sent = time.perf_counter()
+                await layer.group_send(user_group(user_id), {'type': 'message.new', 'message': {'id': user_id}})
+                await communicator.receive_json_from(timeout=5)
+                latencies.append((time.perf_counter() - sent) * 1000)
+            round_start = time.perf_counter()
+            await asyncio.gather(*(deliver(u, c) for u, c in sockets))
+            elapsed = time.perf_counter() - round_start
+            self.stdout.write(f"  pushed {count} messages in {elapsed:.2f}s ({count / elapsed:,.0f} msg/s)")
+
+        q = statistics.quantiles(latencies, n=100)
+        self.stdout.write(f"push latency p50={q[49]:.2f}ms p99={q[98]:.2f}ms with {count} open sockets")
+        for _, communicator in sockets:
+            await communicator.disconnect()
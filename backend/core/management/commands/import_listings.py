@@ -0,0 +1,57 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core import importer
+from core.models import Wardrobe
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Stream listings from a CSV or JSONL file into a user's wardrobe."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--user', required=True, help="Username that owns the imported listings.")
+        parser.add_argument('--format', choices=importer.FORMATS, help="Defaults to the file extension.")
+        parser.add_argument('--chunk-size', type=int, default=importer.DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Validate and insert, then roll everything back.")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['user']!r}.")
+        fmt = options['format'] or importer.guess_format(options['path'])
+
+        start = time.perf_counter()
+        try:
+            with transaction.atomic():
+                wardrobe, _ = Wardrobe.objects.get_or_create(user=user)
+                with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+                    result = importer.import_listings(
+                        wardrobe, importer.iter_rows(stream, fmt), chunk_size=options['chunk_size'],
+                    )
+                if result.read_error:
+                    # Raised inside the transaction, so nothing is kept.
+                    raise CommandError(f"{options['path']}: {result.read_error}; nothing was imported.")
+                if options['dry_run']:
+                    raise _Rollback
+        except _Rollback:
+            pass
+        except OSError as exc:
+            raise CommandError(str(exc))
+        elapsed = time.perf_counter() - start
+
+        for error in result.errors:
+            self.stderr.write(f"row {error['row']}: {error['errors']}")
+        rows = result.created + result.failed
+        self.stdout.write(
+            f"{'Validated' if options['dry_run'] else 'Imported'} {result.created} listings, "
+            f"{result.failed} failed, in {elapsed:.2f}s ({rows / elapsed if elapsed else 0:.0f} rows/s)"
+        )
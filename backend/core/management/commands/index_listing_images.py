@@ -0,0 +1,68 @@
+import os
+import posixpath
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Case, F, Value, When
+
+from core.duplicates import chunk_keys
+from core.images import load, phash
+from core.models import ClothingListing
+from core.storage import BLOB_DIRECTORY, blob_name, content_digest
+
+
+class Command(BaseCommand):
+    help = (
+        "Move listing photos uploaded before content-addressed storage into "
+        "shared blobs, deleting the copies that become unreferenced, and "
+        "compute missing perceptual hashes. Safe to re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-blobs', action='store_true', help="Only compute missing hashes.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if not options['skip_blobs']:
+            moved, removed, freed = self.move_to_blobs()
+            self.stdout.write(f"moved {moved} photos to blobs; removed {removed} files, {freed / 2**20:.1f} MiB freed")
+        hashed = self.hash_missing()
+        self.stdout.write(f"hashed {hashed} photos in {time.perf_counter() - start:.2f}s")
+
+    @staticmethod
+    def move_to_blobs():
+        storage = ClothingListing._meta.get_field('image').storage
+        legacy = ClothingListing.objects.exclude(image='').exclude(image__contains=f'/{BLOB_DIRECTORY}/')
+        moved = removed = freed = 0
+        for pk, name in legacy.order_by('id').values_list('id', 'image').iterator(chunk_size=500):
+            if not storage.exists(name):
+                continue
+            with storage.open(name, 'rb') as fh:
+                target = blob_name(posixpath.dirname(name), content_digest(fh), os.path.splitext(name)[1])
+                if not storage.exists(target):
+                    storage.save(target, fh)
+                    freed -= storage.size(target)
+            # Conditional, like the image job: a listing whose photo changed
+            # meanwhile keeps its new one. Renditions stay valid for the blob.
+            ClothingListing.objects.filter(pk=pk, image=name).update(
+                image=target,
+                image_processed_for=Case(When(image_processed_for=name, then=Value(target)), default=F('image_processed_for')),
+            )
+            moved += 1
+            if not ClothingListing.objects.filter(image=name).exists():
+                freed += storage.size(name)
+                storage.delete(name)
+                removed += 1
+        return moved, removed, freed
+
+    @staticmethod
+    def hash_missing():
+        # Photos not processed yet get their hash from the image job.
+        pending = ClothingListing.objects.filter(image_phash__isnull=True, image_processed_for=F('image')).exclude(image='')
+        hashed = 0
+        for listing in pending.only('id', 'image').iterator(chunk_size=200):
+            value = phash(load(listing.image))
+            hashed += ClothingListing.objects.filter(pk=listing.pk, image=listing.image.name).update(
+                image_phash=value, image_phash_chunks=chunk_keys(value),
+            )
+        return hashed
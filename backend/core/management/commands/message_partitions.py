@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Manage the monthly message partitions. 'maintain' (run daily) creates "
+        "the coming months and archives months older than MESSAGE_HOT_MONTHS; "
+        "'archive' and 'restore' move one month to or from its gzipped JSON "
+        "Lines file in MESSAGE_ARCHIVE_DIR; 'status' lists the partitions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['status', 'maintain', 'archive', 'restore'])
+        parser.add_argument('--month', help="YYYY-MM, for archive and restore.")
+        parser.add_argument('--months-ahead', type=int, default=3)
+        parser.add_argument('--keep-months', type=int, default=None,
+                            help="Months kept in the database by maintain (default MESSAGE_HOT_MONTHS).")
+        parser.add_argument('--archive-dir', default=None, help="Default MESSAGE_ARCHIVE_DIR.")
+
+    def handle(self, *args, **options):
+        action, directory = options['action'], options['archive_dir']
+        if action in ('archive', 'restore'):
+            if not options['month']:
+                raise CommandError(f"{action} needs --month YYYY-MM.")
+            try:
+                month = partitions.parse_month(options['month'])
+            except ValueError:
+                raise CommandError("--month must be YYYY-MM.")
+        try:
+            if action == 'status':
+                self.status(directory)
+            elif action == 'maintain':
+                created = partitions.ensure_partitions(options['months_ahead'])
+                keep = options['keep_months'] if options['keep_months'] is not None else settings.MESSAGE_HOT_MONTHS
+                archived = partitions.archive_older_than(max(keep, 1), directory)
+                self.stdout.write(f"created {len(created)} partitions: {', '.join(created) or '-'}")
+                for path, rows in archived:
+                    self.stdout.write(f"archived {rows} messages to {path}")
+            elif action == 'archive':
+                path, rows = partitions.archive_partition(month, directory)
+                self.stdout.write(f"archived {rows} messages to {path}")
+            else:
+                rows = partitions.restore_partition(month, directory)
+                self.stdout.write(f"restored {rows} messages for {month:%Y-%m}")
+        except (ValueError, LookupError, FileNotFoundError) as exc:
+            raise CommandError(str(exc))
+
+    def status(self, directory):
+        for month, name, rows, index_bytes, total_bytes in partitions.partitions():
+            self.stdout.write(
+                f"{name:<28} ~{rows:>10,} rows  indexes {index_bytes / 2**20:>8.1f} MiB  "
+                f"total {total_bytes / 2**20:>8.1f} MiB"
+            )
+        for path in sorted(partitions.archive_dir(directory).glob('*.jsonl.gz')):
+            self.stdout.write(f"archived: {path.name} ({path.stat().st_size / 2**20:.1f} MiB)")
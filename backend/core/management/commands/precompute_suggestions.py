@@ -0,0 +1,46 @@
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        "Precompute the top-K suggested swaps for recently active users and "
+        "store them in RECOMMENDATIONS_SHARED_CACHE, where the suggested-swaps "
+        "endpoint reads them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=50)
+        parser.add_argument('--active-days', type=int, default=30, help="Users who logged in this recently.")
+        parser.add_argument('--batch-size', type=int, default=64)
+
+    def handle(self, *args, **options):
+        shared = recommendations.shared_cache()
+        if shared is None:
+            raise CommandError(
+                "RECOMMENDATIONS_SHARED_CACHE is not set; suggestions stored by this "
+                "command would never reach the web workers."
+            )
+        if isinstance(shared, LocMemCache):
+            self.stderr.write(
+                "RECOMMENDATIONS_SHARED_CACHE is a local-memory cache: suggestions "
+                "are only visible inside this process."
+            )
+        since = timezone.now() - timedelta(days=options['active_days'])
+        user_ids = list(User.objects.filter(is_active=True, last_login__gte=since).values_list('id', flat=True))
+        start = time.perf_counter()
+        recommendations.matrix.refresh()
+        built = time.perf_counter()
+        stored = recommendations.precompute(user_ids, options['top_k'], options['batch_size'])
+        done = time.perf_counter()
+        self.stdout.write(
+            f"feature matrix: {len(recommendations.matrix.rows)} listings in {built - start:.2f}s; "
+            f"stored top-{options['top_k']} for {stored} users in {done - built:.2f}s"
+        )
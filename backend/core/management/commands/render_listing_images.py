@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from core.images import process_listing_image
+from core.models import ClothingListing
+
+
+class Command(BaseCommand):
+    help = (
+        "Make renditions for every listing photo that doesn't have them yet: "
+        "listings created before renditions existed, and jobs lost when a "
+        "worker restarted (the task queue is in-process). Safe to re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help="Process at most this many listings.")
+
+    def handle(self, *args, **options):
+        pending = ClothingListing.objects.exclude(image='').exclude(image_processed_for=F('image'))
+        ids = pending.order_by('id').values_list('id', flat=True)
+        if options['limit']:
+            ids = ids[:options['limit']]
+        start = time.perf_counter()
+        done = failed = 0
+        # Run inline: jobs queued from this process would die with it.
+        for pk in list(ids):
+            try:
+                process_listing_image(pk)
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(f"listing {pk}: {exc}")
+            else:
+                done += 1
+        self.stdout.write(f"rendered {done} listings ({failed} failed) in {time.perf_counter() - start:.2f}s")
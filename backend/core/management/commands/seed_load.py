@@ -0,0 +1,204 @@
+import math
+import random
+import re
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from core import importer, partitions
+from core.geo import cell_for_point
+from core.models import (
+    ClothingListing, Conversation, ConversationParticipant, Message, UserLocation, Wardrobe,
+)
+
+CLUSTERS = [
+    ('Kochi', 76.27, 9.93),
+    ('Bengaluru', 77.59, 12.97),
+    ('Mumbai', 72.88, 19.08),
+    ('Delhi', 77.21, 28.61),
+    ('London', -0.13, 51.51),
+    ('New York', -73.99, 40.73),
+]
+CLUSTER_SIGMA_KM = 6
+ADJECTIVES = ['Vintage', 'Oversized', 'Slim', 'Cropped', 'Classic', 'Handmade', 'Retro', 'Linen', 'Wool', 'Silk']
+COLOURS = ['black', 'white', 'navy', 'olive', 'mustard', 'red', 'denim', 'beige', 'pink', 'grey']
+ITEMS = ['jacket', 'dress', 'kurta', 'jeans', 'shirt', 'skirt', 'sweater', 'saree', 'coat', 'sneakers', 'hoodie']
+DESCRIPTIONS = [
+    'Worn a handful of times, no stains or tears.',
+    'Bought last season, slightly faded from washing.',
+    'Perfect for summer evenings. Fits true to size.',
+    'Thrifted find, small repair on the inner lining.',
+    'Never worn, tags still attached.',
+]
+MESSAGES = ['Is this still available?', 'Would you swap for a jacket?', 'What size is it?', 'Can we meet this weekend?', 'Sure, sounds good!']
+BATCH_SIZE = 2000
+PASSWORD = 'swap-load-test'
+
+
+class Command(BaseCommand):
+    help = (
+        "Deterministically generate users, wardrobes, listings clustered around a few "
+        "cities, stored user locations and message threads for load testing. Users are "
+        "named <prefix><n> with password 'swap-load-test' and an API token."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--listings-per-user', type=int, default=10)
+        parser.add_argument('--threads', type=int, default=2000, help="Conversations to create.")
+        parser.add_argument('--messages-per-thread', type=int, default=5)
+        parser.add_argument('--history-months', type=int, default=0,
+                            help="Spread conversation start times over this many past months.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='load')
+        parser.add_argument('--clear', action='store_true', help="Delete users previously seeded with this prefix first.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        prefix = options['prefix']
+        with transaction.atomic():
+            if options['clear']:
+                deleted, _ = User.objects.filter(username__regex=rf'^{re.escape(prefix)}[0-9]+$').delete()
+                self.stdout.write(f"Deleted {deleted} rows from a previous seed.")
+            users = self.seed_users(rng, prefix, options['users'])
+            listings = self.seed_listings(rng, users, options['listings_per_user'])
+            # Inserted without signals; run the hooks the importer runs.
+            importer.bulk_created(listings)
+            conversations = self.seed_threads(
+                rng, users, listings, options['threads'], options['messages_per_thread'], options['history_months'],
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(users)} users, {len(listings)} listings and {conversations} conversations "
+            f"(seed={options['seed']}, password={PASSWORD!r})."
+        ))
+
+    def seed_users(self, rng, prefix, count):
+        password = make_password(PASSWORD)
+        names = [f'{prefix}{i}' for i in range(count)]
+        User.objects.bulk_create(
+            [User(username=name, email=f'{name}@example.com', password=password) for name in names],
+            batch_size=BATCH_SIZE,
+        )
+        users = list(User.objects.filter(username__in=names).order_by('id'))
+        Wardrobe.objects.bulk_create([Wardrobe(user=u) for u in users], batch_size=BATCH_SIZE)
+        Token.objects.bulk_create(
+            [Token(user=u, key=f'{rng.getrandbits(160):040x}') for u in users], batch_size=BATCH_SIZE,
+        )
+        UserLocation.objects.bulk_create(
+            [UserLocation(user=u, location=self.clustered_point(rng)) for u in users], batch_size=BATCH_SIZE,
+        )
+        return users
+
+    def seed_listings(self, rng, users, per_user):
+        wardrobes = dict(Wardrobe.objects.filter(user__in=users).values_list('user_id', 'id'))
+        conditions = [choice for choice, _ in ClothingListing.CONDITION_CHOICES]
+        listings = []
+        for user in users:
+            for _ in range(per_user):
+                point = self.clustered_point(rng)
+                listings.append(ClothingListing(
+                    wardrobe_id=wardrobes[user.id],
+                    title=f'{rng.choice(ADJECTIVES)} {rng.choice(COLOURS)} {rng.choice(ITEMS)}',
+                    description=rng.choice(DESCRIPTIONS),
+                    condition=rng.choice(conditions),
+                    location=point,
+                    grid_cell=cell_for_point(point),
+                    is_public=rng.random() < 0.9,
+                ))
+        return ClothingListing.objects.bulk_create(listings, batch_size=BATCH_SIZE)
+
+    def seed_threads(self, rng, users, listings, count, per_thread, history_months=0):
+        if len(users) < 2 or not listings:
+            return 0
+        owners = dict(Wardrobe.objects.filter(user__in=users).values_list('id', 'user_id'))
+        keys = set()
+        for _ in range(count * 2):
+            if len(keys) >= count:
+                break
+            listing = rng.choice(listings)
+            buyer = rng.choice(users).id
+            seller = owners[listing.wardrobe_id]
+            if buyer != seller:
+                keys.add((listing.id, *sorted((buyer, seller)), buyer))
+        conversations = Conversation.objects.bulk_create(
+            [Conversation(listing_id=l, user_low_id=lo, user_high_id=hi) for l, lo, hi, _ in sorted(keys)],
+            batch_size=BATCH_SIZE,
+        )
+        ConversationParticipant.objects.bulk_create(
+            [ConversationParticipant(conversation=c, user_id=uid)
+             for c in conversations for uid in (c.user_low_id, c.user_high_id)],
+            batch_size=BATCH_SIZE,
+        )
+
+        messages = []
+        for conversation, (_, low, high, buyer) in zip(conversations, sorted(keys)):
+            seller = high if buyer == low else low
+            for n in range(per_thread):
+                sender, receiver = (buyer, seller) if n % 2 == 0 else (seller, buyer)
+                messages.append(Message(
+                    conversation=conversation, listing_id=conversation.listing_id,
+                    sender_id=sender, receiver_id=receiver,
+                    content=rng.choice(MESSAGES),
+                    is_read=n < per_thread - 1 or rng.random() < 0.5,
+                ))
+        Message.objects.bulk_create(messages, batch_size=BATCH_SIZE)
+        if history_months:
+            self.backdate_threads(rng, conversations, history_months)
+        self.refresh_conversations([c.id for c in conversations])
+        return len(conversations)
+
+    @staticmethod
+    def backdate_threads(rng, conversations, months):
+        """Start each thread at a random time in the last ``months`` months, a message every few minutes."""
+        now = timezone.now()
+        current = partitions.month_of(now)
+        for n in range(months + 1):
+            partitions.create_partition(partitions.add_months(current, -n))
+        for conversation in conversations:
+            conversation.created_at = now - timedelta(days=rng.uniform(1, months * 30))
+        Conversation.objects.bulk_update(conversations, ['created_at'], batch_size=BATCH_SIZE)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {Message._meta.db_table} m
+                SET created_at = c.created_at + (m.id - f.first_id) * interval '7 minutes'
+                FROM {Conversation._meta.db_table} c JOIN (
+                    SELECT conversation_id, min(id) AS first_id FROM {Message._meta.db_table}
+                    WHERE conversation_id = ANY(%s) GROUP BY conversation_id
+                ) f ON f.conversation_id = c.id
+                WHERE m.conversation_id = c.id
+                """,
+                [[c.id for c in conversations]],
+            )
+
+    @staticmethod
+    def refresh_conversations(conversation_ids):
+        latest = Message.objects.filter(conversation=OuterRef('pk')).order_by('-created_at', '-id')
+        Conversation.objects.filter(id__in=conversation_ids).update(
+            last_message=Subquery(latest.values('id')[:1]),
+            last_message_at=Subquery(latest.values('created_at')[:1]),
+        )
+        unread = (
+            Message.objects.filter(conversation=OuterRef('conversation'), receiver=OuterRef('user'), is_read=False)
+            .order_by().values('conversation').annotate(n=Count('id')).values('n')
+        )
+        participants = ConversationParticipant.objects.filter(conversation_id__in=conversation_ids)
+        participants.update(last_message_at=Subquery(
+            Conversation.objects.filter(pk=OuterRef('conversation')).values('last_message_at')[:1]
+        ))
+        participants.update(unread_count=Coalesce(Subquery(unread, output_field=IntegerField()), Value(0)))
+
+    @staticmethod
+    def clustered_point(rng):
+        _, lon, lat = rng.choice(CLUSTERS)
+        sigma_lat = CLUSTER_SIGMA_KM / 111.32
+        sigma_lon = sigma_lat / math.cos(math.radians(lat))
+        return Point(lon + rng.gauss(0, sigma_lon), lat + rng.gauss(0, sigma_lat), srid=4326)
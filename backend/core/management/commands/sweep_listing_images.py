@@ -0,0 +1,26 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from core.images import sweep_unreferenced
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete listing photo blobs and renditions that no listing references "
+        "any more. Files newer than --grace-hours are kept, since their "
+        "listing may still be saving. Safe to re-run; run it daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=24.0)
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be deleted.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        deleted, freed = sweep_unreferenced(timedelta(hours=options['grace_hours']), options['dry_run'])
+        verb = "would delete" if options['dry_run'] else "deleted"
+        self.stdout.write(
+            f"{verb} {deleted} unreferenced files, {freed / 2**20:.1f} MiB, in {time.perf_counter() - start:.2f}s"
+        )
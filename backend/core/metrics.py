@@ -0,0 +1,173 @@
+"""
+In-process request metrics, exported in the Prometheus text format.
+
+Each worker process keeps its own histograms; Prometheus scrapes every
+worker and aggregates. Recording is a bisect plus a few additions under a
+lock, so it stays cheap enough to run on every request.
+
+Serialisation is timed where it happens (``serializing()``) and render time
+in the middleware, so both can be told apart from the view's own time.
+"""
+import contextvars
+import hmac
+import ipaddress
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, labelnames):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.labelnames = labelnames
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {labels: (list(counts), total, n) for labels, (counts, total, n) in self._series.items()}
+        for labels, (counts, total, n) in sorted(series.items()):
+            base = _labels(self.labelnames, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, le=_fmt(bound))} {cumulative}')
+            lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, le="+Inf")} {n}')
+            lines.append(f'{self.name}_sum{base} {_fmt(total)}')
+            lines.append(f'{self.name}_count{base} {n}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {_fmt(value)}')
+        return lines
+
+
+def _fmt(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, **extra):
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+requests_total = Counter(
+    'swap_http_requests_total', 'Requests by view, method and status.', ('view', 'method', 'status'),
+)
+request_seconds = Histogram(
+    'swap_http_request_duration_seconds', 'Wall time spent handling a request.',
+    LATENCY_BUCKETS, ('view', 'method'),
+)
+db_queries = Histogram(
+    'swap_http_request_db_queries', 'Database queries issued per request.',
+    QUERY_BUCKETS, ('view', 'method'),
+)
+db_seconds = Histogram(
+    'swap_http_request_db_seconds', 'Time spent in database queries per request.',
+    LATENCY_BUCKETS, ('view', 'method'),
+)
+render_seconds = Histogram(
+    'swap_http_request_render_seconds', 'Time spent rendering the response body.',
+    LATENCY_BUCKETS, ('view', 'method'),
+)
+serialize_seconds = Histogram(
+    'swap_http_request_serialize_seconds', 'Time spent serialising rows inside the view.',
+    LATENCY_BUCKETS, ('view', 'method'),
+)
+
+REGISTRY = [requests_total, request_seconds, db_queries, db_seconds, render_seconds, serialize_seconds]
+
+_serializing = contextvars.ContextVar('metrics_serializing', default=None)
+
+
+def begin_request():
+    """Start collecting the current request's serialisation time: ``(seconds, token)``."""
+    seconds = [0.0]
+    return seconds, _serializing.set(seconds)
+
+
+def end_request(token):
+    _serializing.reset(token)
+
+
+@contextmanager
+def serializing():
+    """Count the enclosed block towards the current request's serialisation time."""
+    seconds = _serializing.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if seconds is not None:
+            seconds[0] += time.perf_counter() - start
+
+
+def scrape_allowed(request):
+    """Whether ``request`` may read ``/metrics``: from ``METRICS_ALLOWED_IPS`` or with ``METRICS_TOKEN``."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    header = request.headers.get('Authorization', '')
+    if token and hmac.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network) for network in getattr(settings, 'METRICS_ALLOWED_IPS', ()))
+
+
+def expose():
+    from . import response_cache
+
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.expose())
+    cache_stats = response_cache.stats.snapshot()
+    for kind in ('hits', 'misses'):
+        name = f'swap_response_cache_{kind}_total'
+        lines.append(f'# HELP {name} Public response cache {kind}.')
+        lines.append(f'# TYPE {name} counter')
+        for namespace, values in cache_stats.items():
+            lines.append(f'{name}{_labels(("namespace",), (namespace,))} {values[kind]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,140 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+slow_logger = logging.getLogger('core.slow_requests')
+
+
+class _QueryTimer:
+    """``connection.execute_wrapper`` hook that counts and times queries on any alias."""
+
+    def __init__(self, keep_sql):
+        self.count = 0
+        self.seconds = 0.0
+        self.keep_sql = keep_sql
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.seconds += elapsed
+            if self.keep_sql:
+                self.queries.append((elapsed, sql, params, many, context['connection'].alias))
+
+
+class RequestMetricsMiddleware:
+    """
+    Record wall time, DB query count/time (over every database alias),
+    serialisation and render time for every request, labelled with the
+    resolved view name, and log requests slower than
+    ``SLOW_REQUEST_THRESHOLD_MS`` together with their SQL and the EXPLAIN of
+    the slowest query.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        threshold = getattr(settings, 'SLOW_REQUEST_THRESHOLD_MS', None)
+        self.slow_threshold = threshold / 1000 if threshold else None
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = _QueryTimer(keep_sql=self.slow_threshold is not None)
+        request._metrics_render_seconds = 0.0
+        serialized, token = metrics.begin_request()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(timer))
+                response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        self.record(request, response, time.perf_counter() - start, timer, serialized[0])
+        return response
+
+    async def __acall__(self, request):
+        # Async ORM calls run on this request's thread-sensitive worker
+        # thread, which has its own connection, so install the hook there.
+        timer = _QueryTimer(keep_sql=self.slow_threshold is not None)
+        request._metrics_render_seconds = 0.0
+        serialized, token = metrics.begin_request()
+
+        def install():
+            for conn in connections.all():
+                conn.execute_wrappers.append(timer)
+
+        def remove():
+            for conn in connections.all():
+                conn.execute_wrappers.remove(timer)
+
+        await sync_to_async(install)()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(remove)()
+            metrics.end_request(token)
+        elapsed = time.perf_counter() - start
+        if self.slow_threshold is not None and elapsed >= self.slow_threshold:
+            await sync_to_async(self.record)(request, response, elapsed, timer, serialized[0])
+        else:
+            self.record(request, response, elapsed, timer, serialized[0])
+        return response
+
+    def record(self, request, response, elapsed, timer, serialize_seconds=0.0):
+        match = request.resolver_match
+        view = match.view_name if match else '<unresolved>'
+        method = request.method
+        metrics.requests_total.inc(view, method, response.status_code)
+        metrics.request_seconds.observe(elapsed, view, method)
+        metrics.db_queries.observe(timer.count, view, method)
+        metrics.db_seconds.observe(timer.seconds, view, method)
+        metrics.render_seconds.observe(request._metrics_render_seconds, view, method)
+        metrics.serialize_seconds.observe(serialize_seconds, view, method)
+
+        if self.slow_threshold is not None and elapsed >= self.slow_threshold:
+            self.log_slow_request(request, view, elapsed, timer)
+
+    def process_template_response(self, request, response):
+        # DRF responses render after the view returns; time that separately.
+        start = time.perf_counter()
+
+        def done(rendered):
+            request._metrics_render_seconds = time.perf_counter() - start
+
+        response.add_post_render_callback(done)
+        return response
+
+    def log_slow_request(self, request, view, elapsed, timer):
+        queries = sorted(timer.queries, key=lambda q: q[0], reverse=True)
+        plan = None
+        slowest = next((q for q in queries if not q[3] and q[1].lstrip().upper().startswith('SELECT')), None)
+        if slowest is not None:
+            try:
+                with connections[slowest[4]].cursor() as cursor:
+                    cursor.execute(f'EXPLAIN {slowest[1]}', slowest[2])
+                    plan = '\n'.join(row[0] for row in cursor.fetchall())
+            except Exception as exc:
+                plan = f'EXPLAIN failed: {exc}'
+        slow_logger.warning(
+            "Slow request %s %s (%s): %.1fms, %d queries, %.1fms in DB\n%s\nEXPLAIN of slowest query:\n%s",
+            request.method, request.get_full_path(), view, elapsed * 1000, timer.count, timer.seconds * 1000,
+            '\n'.join(f'  {q[0] * 1000:.1f}ms {q[1]} {q[2]!r}' for q in queries),
+            plan or '  (no SELECT to explain)',
+        )
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_remove_clothinglisting_category_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='clothinglisting',
+            index=models.Index(fields=['is_public', '-created_at', '-id'], name='listing_public_feed_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+import math
+
+from django.db import migrations, models
+
+
+CELL_DEGREES = 0.1
+
+
+def backfill_grid_cells(apps, schema_editor):
+    # Frozen copy of core.geo.cell_for_point so later changes to the grid
+    # don't silently rewrite what this migration produced.
+    ClothingListing = apps.get_model('core', 'ClothingListing')
+    rows, cols = int(round(180 / CELL_DEGREES)), int(round(360 / CELL_DEGREES))
+    batch = []
+    for listing in ClothingListing.objects.exclude(location=None).only('id', 'location').iterator(chunk_size=2000):
+        row = min(int(math.floor((listing.location.y + 90) / CELL_DEGREES)), rows - 1)
+        col = int(math.floor((listing.location.x + 180) / CELL_DEGREES)) % cols
+        listing.grid_cell = f'{row}:{col}'
+        batch.append(listing)
+        if len(batch) >= 2000:
+            ClothingListing.objects.bulk_update(batch, ['grid_cell'])
+            batch = []
+    if batch:
+        ClothingListing.objects.bulk_update(batch, ['grid_cell'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_clothinglisting_listing_public_feed_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clothinglisting',
+            name='grid_cell',
+            field=models.CharField(blank=True, editable=False, max_length=16, null=True),
+        ),
+        migrations.RunPython(backfill_grid_cells, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='clothinglisting',
+            index=models.Index(fields=['grid_cell', 'is_public'], name='listing_grid_cell_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+SEARCH_CONFIG = 'english'
+
+CREATE_TRIGGER = f"""
+CREATE FUNCTION core_listing_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(NEW.description, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_listing_search_vector
+    BEFORE INSERT OR UPDATE OF title, description ON core_clothinglisting
+    FOR EACH ROW EXECUTE FUNCTION core_listing_search_vector_update();
+
+UPDATE core_clothinglisting SET title = title;
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS core_listing_search_vector ON core_clothinglisting;
+DROP FUNCTION IF EXISTS core_listing_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_clothinglisting_grid_cell'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clothinglisting',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+        migrations.AddIndex(
+            model_name='clothinglisting',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='listing_search_vector_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_clothinglisting_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clothinglisting',
+            name='image_thumbnail',
+            field=models.ImageField(blank=True, editable=False, upload_to='listings/renditions/'),
+        ),
+        migrations.AddField(
+            model_name='clothinglisting',
+            name='image_medium',
+            field=models.ImageField(blank=True, editable=False, upload_to='listings/renditions/'),
+        ),
+        migrations.AddField(
+            model_name='clothinglisting',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='clothinglisting',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='clothinglisting',
+            name='image_blurhash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='clothinglisting',
+            name='image_processed_for',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+    ]
@@ -0,0 +1,103 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+
+
+def backfill_conversations(apps, schema_editor):
+    """One conversation per (listing, user pair), filled in with set-based updates."""
+    Conversation = apps.get_model('core', 'Conversation')
+    ConversationParticipant = apps.get_model('core', 'ConversationParticipant')
+    Message = apps.get_model('core', 'Message')
+
+    # order_by() drops Message's default ordering, which would otherwise be
+    # added to the DISTINCT and return one row per message.
+    pairs = Message.objects.order_by().values_list(
+        'listing_id', Least('sender_id', 'receiver_id'), Greatest('sender_id', 'receiver_id'),
+    ).distinct()
+    Conversation.objects.bulk_create(
+        [Conversation(listing_id=listing_id, user_low_id=low, user_high_id=high) for listing_id, low, high in pairs],
+        batch_size=1000,
+    )
+
+    conversation = Conversation.objects.filter(
+        listing_id=OuterRef('listing_id'),
+        user_low_id=Least(OuterRef('sender_id'), OuterRef('receiver_id')),
+        user_high_id=Greatest(OuterRef('sender_id'), OuterRef('receiver_id')),
+    )
+    Message.objects.update(conversation=Subquery(conversation.values('pk')[:1]))
+
+    last = Message.objects.filter(conversation=OuterRef('pk')).order_by('-created_at', '-id')
+    Conversation.objects.update(
+        last_message=Subquery(last.values('pk')[:1]),
+        last_message_at=Subquery(last.values('created_at')[:1]),
+    )
+
+    ConversationParticipant.objects.bulk_create(
+        [
+            ConversationParticipant(conversation_id=pk, user_id=user_id, last_message_at=last_message_at)
+            for pk, low, high, last_message_at in Conversation.objects.values_list(
+                'pk', 'user_low_id', 'user_high_id', 'last_message_at',
+            )
+            for user_id in (low, high)
+        ],
+        batch_size=1000,
+    )
+    unread = (
+        Message.objects.filter(conversation=OuterRef('conversation'), receiver=OuterRef('user'), is_read=False)
+        .order_by().values('conversation').annotate(n=Count('pk')).values('n')
+    )
+    ConversationParticipant.objects.update(
+        unread_count=Coalesce(Subquery(unread, output_field=models.IntegerField()), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_clothinglisting_image_renditions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations', to='core.clothinglisting')),
+                ('user_low', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user_high', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.message')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('listing', 'user_low', 'user_high'), name='conversation_unique_pair')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ConversationParticipant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participants', to='core.conversation')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('conversation', 'user'), name='participant_unique_user')],
+                'indexes': [models.Index(fields=['user', '-last_message_at', '-id'], name='participant_thread_list_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='conversation',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='core.conversation'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', '-created_at', '-id'], name='message_thread_history_idx'),
+        ),
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,83 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+CREATE_TRIGGERS = """
+CREATE FUNCTION core_listing_change_xid_update() RETURNS trigger AS $$
+BEGIN
+    NEW.change_xid := pg_current_xact_id()::text::bigint;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_listing_change_xid
+    BEFORE INSERT OR UPDATE ON core_clothinglisting
+    FOR EACH ROW EXECUTE FUNCTION core_listing_change_xid_update();
+
+CREATE FUNCTION core_listing_tombstone_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO core_listingtombstone (listing_id, wardrobe_id, deleted_at, change_xid)
+    VALUES (OLD.id, OLD.wardrobe_id, now(), pg_current_xact_id()::text::bigint);
+    RETURN OLD;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_listing_tombstone
+    AFTER DELETE ON core_clothinglisting
+    FOR EACH ROW EXECUTE FUNCTION core_listing_tombstone_insert();
+
+UPDATE core_clothinglisting SET updated_at = created_at;
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS core_listing_tombstone ON core_clothinglisting;
+DROP FUNCTION IF EXISTS core_listing_tombstone_insert();
+DROP TRIGGER IF EXISTS core_listing_change_xid ON core_clothinglisting;
+DROP FUNCTION IF EXISTS core_listing_change_xid_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_message_message_unread_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clothinglisting',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='clothinglisting',
+            name='change_xid',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='ListingTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('listing_id', models.BigIntegerField()),
+                ('wardrobe_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField()),
+                ('change_xid', models.BigIntegerField()),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['change_xid', 'id'], name='tombstone_change_idx'),
+                    models.Index(fields=['wardrobe_id', 'change_xid', 'id'], name='tombstone_wardrobe_change_idx'),
+                ],
+            },
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+        migrations.AddIndex(
+            model_name='clothinglisting',
+            index=models.Index(fields=['change_xid', 'id'], name='listing_change_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clothinglisting',
+            index=models.Index(fields=['wardrobe', 'change_xid', 'id'], name='listing_wardrobe_change_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations, models
+
+
+BACKFILL_COUNTS = """
+INSERT INTO core_listingfacetcount (grid_cell, condition, is_public, count)
+SELECT COALESCE(grid_cell, ''), condition, is_public, COUNT(*)
+FROM core_clothinglisting
+GROUP BY COALESCE(grid_cell, ''), condition, is_public
+UNION ALL
+SELECT '*', condition, is_public, COUNT(*)
+FROM core_clothinglisting
+GROUP BY condition, is_public;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_nearby_feeds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingFacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grid_cell', models.CharField(max_length=16)),
+                ('condition', models.CharField(max_length=10)),
+                ('is_public', models.BooleanField()),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [
+                    models.UniqueConstraint(fields=('grid_cell', 'condition', 'is_public'), name='listing_facet_unique'),
+                ],
+            },
+        ),
+        migrations.RunSQL(BACKFILL_COUNTS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,111 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Rebuild core_message as a table range-partitioned by month on created_at;
+# see core.partitions. The primary key has to include the partition key, so
+# it becomes (id, created_at) and ids come from a plain sequence (identity
+# columns on partitioned tables need PostgreSQL 17). No unique index on id
+# alone can exist, so conversation.last_message loses its FK constraint.
+PARTITION_MESSAGES = """
+ALTER TABLE core_message RENAME TO core_message_legacy;
+
+CREATE SEQUENCE core_message_pk_seq;
+SELECT setval('core_message_pk_seq', COALESCE((SELECT max(id) FROM core_message_legacy), 0) + 1, false);
+
+CREATE TABLE core_message (LIKE core_message_legacy INCLUDING DEFAULTS) PARTITION BY RANGE (created_at);
+ALTER TABLE core_message ALTER COLUMN id SET DEFAULT nextval('core_message_pk_seq');
+ALTER SEQUENCE core_message_pk_seq OWNED BY core_message.id;
+
+DO $$
+DECLARE
+    month date;
+    last_month date := (date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months')::date;
+BEGIN
+    SELECT date_trunc('month', COALESCE(min(created_at), now()) AT TIME ZONE 'UTC')::date
+    INTO month FROM core_message_legacy;
+    WHILE month <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF core_message FOR VALUES FROM (%L) TO (%L)',
+            'core_message_p' || to_char(month, 'YYYY_MM'),
+            month::timestamp AT TIME ZONE 'UTC',
+            (month + interval '1 month')::timestamp AT TIME ZONE 'UTC'
+        );
+        month := (month + interval '1 month')::date;
+    END LOOP;
+END
+$$;
+CREATE TABLE core_message_default PARTITION OF core_message DEFAULT;
+
+INSERT INTO core_message SELECT * FROM core_message_legacy;
+DROP TABLE core_message_legacy;
+
+ALTER TABLE core_message ADD CONSTRAINT core_message_pkey PRIMARY KEY (id, created_at);
+ALTER TABLE core_message ADD CONSTRAINT core_message_sender_id_fk
+    FOREIGN KEY (sender_id) REFERENCES auth_user (id) DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE core_message ADD CONSTRAINT core_message_receiver_id_fk
+    FOREIGN KEY (receiver_id) REFERENCES auth_user (id) DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE core_message ADD CONSTRAINT core_message_listing_id_fk
+    FOREIGN KEY (listing_id) REFERENCES core_clothinglisting (id) DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE core_message ADD CONSTRAINT core_message_conversation_id_fk
+    FOREIGN KEY (conversation_id) REFERENCES core_conversation (id) DEFERRABLE INITIALLY DEFERRED;
+CREATE INDEX core_message_sender_id_idx ON core_message (sender_id);
+CREATE INDEX core_message_receiver_id_idx ON core_message (receiver_id);
+CREATE INDEX core_message_listing_id_idx ON core_message (listing_id);
+CREATE INDEX core_message_conversation_id_idx ON core_message (conversation_id);
+CREATE INDEX message_thread_history_idx ON core_message (conversation_id, created_at DESC, id DESC);
+CREATE INDEX message_unread_idx ON core_message (receiver_id, created_at DESC) WHERE NOT is_read;
+
+-- Conversation reads are bounded below by the conversation's created_at;
+-- threads backfilled in 0009 were stamped later than their first message.
+UPDATE core_conversation c SET created_at = m.first_at
+FROM (
+    SELECT conversation_id, min(created_at) AS first_at FROM core_message
+    WHERE conversation_id IS NOT NULL GROUP BY conversation_id
+) m
+WHERE m.conversation_id = c.id AND m.first_at < c.created_at;
+"""
+
+UNPARTITION_MESSAGES = """
+CREATE TABLE core_message_flat (LIKE core_message INCLUDING DEFAULTS);
+INSERT INTO core_message_flat SELECT * FROM core_message;
+ALTER SEQUENCE core_message_pk_seq OWNED BY core_message_flat.id;
+DROP TABLE core_message;
+ALTER TABLE core_message_flat RENAME TO core_message;
+
+ALTER TABLE core_message ADD CONSTRAINT core_message_pkey PRIMARY KEY (id);
+ALTER TABLE core_message ADD CONSTRAINT core_message_sender_id_fk
+    FOREIGN KEY (sender_id) REFERENCES auth_user (id) DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE core_message ADD CONSTRAINT core_message_receiver_id_fk
+    FOREIGN KEY (receiver_id) REFERENCES auth_user (id) DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE core_message ADD CONSTRAINT core_message_listing_id_fk
+    FOREIGN KEY (listing_id) REFERENCES core_clothinglisting (id) DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE core_message ADD CONSTRAINT core_message_conversation_id_fk
+    FOREIGN KEY (conversation_id) REFERENCES core_conversation (id) DEFERRABLE INITIALLY DEFERRED;
+CREATE INDEX core_message_sender_id_idx ON core_message (sender_id);
+CREATE INDEX core_message_receiver_id_idx ON core_message (receiver_id);
+CREATE INDEX core_message_listing_id_idx ON core_message (listing_id);
+CREATE INDEX core_message_conversation_id_idx ON core_message (conversation_id);
+CREATE INDEX message_thread_history_idx ON core_message (conversation_id, created_at DESC, id DESC);
+CREATE INDEX message_unread_idx ON core_message (receiver_id, created_at DESC) WHERE NOT is_read;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_listing_facet_counts'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='message',
+            options={},
+        ),
+        migrations.AlterField(
+            model_name='conversation',
+            name='last_message',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.message'),
+        ),
+        migrations.RunSQL(PARTITION_MESSAGES, UNPARTITION_MESSAGES),
+    ]
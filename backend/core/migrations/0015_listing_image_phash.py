@@ -0,0 +1,38 @@
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+import core.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_partition_messages'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='clothinglisting',
+            name='image',
+            field=models.ImageField(blank=True, storage=core.storage.listing_image_storage, upload_to='listings/'),
+        ),
+        migrations.AddField(
+            model_name='clothinglisting',
+            name='image_phash',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='clothinglisting',
+            name='image_phash_chunks',
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.IntegerField(), blank=True, editable=False, null=True, size=None,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='clothinglisting',
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=['image_phash_chunks'], name='listing_image_phash_idx',
+            ),
+        ),
+    ]
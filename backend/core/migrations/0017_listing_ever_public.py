@@ -0,0 +1,71 @@
+from django.db import migrations, models
+
+
+# The public change feed reports listings made private, and deleted ones, by
+# id; only do that for listings that were public at some point. Existing rows
+# count as ever public if they are public now, and existing tombstones keep
+# being reported as before.
+UPDATE_TRIGGERS = """
+CREATE OR REPLACE FUNCTION core_listing_change_xid_update() RETURNS trigger AS $$
+BEGIN
+    NEW.change_xid := pg_current_xact_id()::text::bigint;
+    IF TG_OP = 'INSERT' THEN
+        NEW.ever_public := NEW.is_public;
+    ELSE
+        NEW.ever_public := OLD.ever_public OR NEW.is_public;
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION core_listing_tombstone_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO core_listingtombstone (listing_id, wardrobe_id, deleted_at, change_xid, was_public)
+    VALUES (OLD.id, OLD.wardrobe_id, now(), pg_current_xact_id()::text::bigint, OLD.ever_public);
+    RETURN OLD;
+END
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE core_clothinglisting DISABLE TRIGGER core_listing_change_xid;
+UPDATE core_clothinglisting SET ever_public = is_public;
+ALTER TABLE core_clothinglisting ENABLE TRIGGER core_listing_change_xid;
+UPDATE core_listingtombstone SET was_public = true;
+"""
+
+RESTORE_TRIGGERS = """
+CREATE OR REPLACE FUNCTION core_listing_change_xid_update() RETURNS trigger AS $$
+BEGIN
+    NEW.change_xid := pg_current_xact_id()::text::bigint;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION core_listing_tombstone_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO core_listingtombstone (listing_id, wardrobe_id, deleted_at, change_xid)
+    VALUES (OLD.id, OLD.wardrobe_id, now(), pg_current_xact_id()::text::bigint);
+    RETURN OLD;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_message_sent_received_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clothinglisting',
+            name='ever_public',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listingtombstone',
+            name='was_public',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunSQL(UPDATE_TRIGGERS, RESTORE_TRIGGERS),
+    ]
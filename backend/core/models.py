@@ -1,8 +1,13 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.contrib.auth.models import User
 from django.contrib.gis.db import models as gis_models
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.gis.measure import D
 from django.contrib.gis.geos import Point
+from .geo import cell_for_point
+from .storage import listing_image_storage
 
 class Wardrobe(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -21,14 +26,106 @@ class ClothingListing(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField()
     condition = models.CharField(max_length=10, choices=CONDITION_CHOICES)
-    image = models.ImageField(upload_to='listings/', blank=True)
+    # Stored by content hash: identical uploads share one file (core.storage).
+    image = models.ImageField(upload_to='listings/', storage=listing_image_storage, blank=True)
+    # Renditions and metadata written by core.images.process_listing_image.
+    image_thumbnail = models.ImageField(upload_to='listings/renditions/', blank=True, editable=False)
+    image_medium = models.ImageField(upload_to='listings/renditions/', blank=True, editable=False)
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_blurhash = models.CharField(max_length=64, blank=True, editable=False)
+    image_processed_for = models.CharField(max_length=255, blank=True, editable=False)
+    # Perceptual hash and its multi-index chunk keys; see core.duplicates.
+    image_phash = models.BigIntegerField(null=True, blank=True, editable=False)
+    image_phash_chunks = ArrayField(models.IntegerField(), null=True, blank=True, editable=False)
     location = gis_models.PointField(null=True, blank=True)
+    grid_cell = models.CharField(max_length=16, null=True, blank=True, editable=False)
+    # Maintained by the core_listing_search_vector trigger (migration 0007).
+    search_vector = SearchVectorField(null=True, editable=False)
     is_public = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Id of the last transaction that wrote the row, set by the
+    # core_listing_change_xid trigger (migration 0011); see core.sync.
+    change_xid = models.BigIntegerField(null=True, editable=False)
+    # Whether the listing has ever been public, kept by the same trigger
+    # (migration 0017); the public change feed only mentions those.
+    ever_public = models.BooleanField(default=False, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_public', '-created_at', '-id'], name='listing_public_feed_idx'),
+            models.Index(fields=['grid_cell', 'is_public'], name='listing_grid_cell_idx'),
+            GinIndex(fields=['search_vector'], name='listing_search_vector_idx'),
+            models.Index(fields=['change_xid', 'id'], name='listing_change_idx'),
+            models.Index(fields=['wardrobe', 'change_xid', 'id'], name='listing_wardrobe_change_idx'),
+            GinIndex(fields=['image_phash_chunks'], name='listing_image_phash_idx'),
+        ]
 
     def __str__(self):
-           return self.title   
+           return self.title
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_location = instance.__dict__.get('location')
+        instance._saved_facet = instance.facet_key()
+        return instance
+
+    def facet_key(self):
+        """``(grid_cell, condition, is_public)`` as counted by ``core.facets``, or ``None`` if deferred."""
+        values = self.__dict__
+        if not {'grid_cell', 'condition', 'is_public'} <= values.keys():
+            return None
+        return values['grid_cell'] or '', values['condition'], values['is_public']
+
+    def save(self, *args, **kwargs):
+        self._previous_grid_cell = self.grid_cell
+        self._previous_location = getattr(self, '_saved_location', None)
+        self._previous_facet = getattr(self, '_saved_facet', None)
+        self.grid_cell = cell_for_point(self.location)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'location' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'grid_cell'}
+        # One transaction with the post_save handlers, so the facet counts
+        # (core.signals) commit or roll back with the row even in autocommit.
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(type(self), instance=self)):
+            super().save(*args, **kwargs)
+        self._saved_location = self.location
+        self._saved_facet = self.facet_key()
     
+class ListingTombstone(models.Model):
+    """A deleted listing, written by the core_listing_tombstone trigger (migration 0011)."""
+    listing_id = models.BigIntegerField()
+    wardrobe_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField()
+    change_xid = models.BigIntegerField()
+    was_public = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['change_xid', 'id'], name='tombstone_change_idx'),
+            models.Index(fields=['wardrobe_id', 'change_xid', 'id'], name='tombstone_wardrobe_change_idx'),
+        ]
+
+    def __str__(self):
+        return f"Deleted listing {self.listing_id}"
+
+class ListingFacetCount(models.Model):
+    """Listings per grid cell, condition and visibility; maintained by ``core.facets``."""
+    grid_cell = models.CharField(max_length=16)
+    condition = models.CharField(max_length=10)
+    is_public = models.BooleanField()
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['grid_cell', 'condition', 'is_public'], name='listing_facet_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.grid_cell} {self.condition} {'public' if self.is_public else 'private'}: {self.count}"
+
 class UserLocation(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     location = gis_models.PointField(null=True, blank=True)
@@ -37,16 +134,101 @@ class UserLocation(models.Model):
     def __str__(self):
         return f"{self.user.username}'s Location"
 
+class NearbyFeed(models.Model):
+    """
+    A user's materialised nearby feed, centred on their stored location.
+    Entries are kept current by core.nearby_feeds while the feed is read.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='nearby_feed')
+    location = gis_models.PointField()
+    grid_cell = models.CharField(max_length=16)
+    built_at = models.DateTimeField()
+    last_read_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['grid_cell', 'last_read_at'], name='nearby_feed_cell_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}'s Nearby Feed"
+
+class NearbyFeedEntry(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    listing = models.ForeignKey(ClothingListing, on_delete=models.CASCADE, related_name='nearby_entries')
+    distance_km = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'listing'], name='nearby_entry_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'distance_km'], name='nearby_entry_feed_idx'),
+        ]
+
+class Conversation(models.Model):
+    """
+    One thread per (listing, pair of users). ``user_low``/``user_high`` hold
+    the pair ordered by id so the pair has a single canonical key.
+    """
+    listing = models.ForeignKey(ClothingListing, on_delete=models.CASCADE, related_name='conversations')
+    user_low = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    user_high = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    # No database constraint: core_message is partitioned (migration 0014) and
+    # can't have a unique index on id alone. See core.partitions.
+    last_message = models.ForeignKey(
+        'Message', on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_constraint=False,
+    )
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['listing', 'user_low', 'user_high'], name='conversation_unique_pair'),
+        ]
+
+    def __str__(self):
+        return f"Conversation about {self.listing_id} between {self.user_low_id} and {self.user_high_id}"
+
+class ConversationParticipant(models.Model):
+    """A user's view of a conversation: their unread count and sort key for the thread list."""
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='participants')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversations')
+    unread_count = models.PositiveIntegerField(default=0)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'user'], name='participant_unique_user'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-last_message_at', '-id'], name='participant_thread_list_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} in conversation {self.conversation_id}"
+
 class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_messages')
     listing = models.ForeignKey(ClothingListing, on_delete=models.CASCADE, related_name='messages')  # Context: About this listing
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages', null=True, blank=True)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
 
+    # Stored in monthly partitions on created_at (migration 0014, core.partitions).
+    # No default ordering, so counts and aggregates don't carry a sort.
     class Meta:
-        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['conversation', '-created_at', '-id'], name='message_thread_history_idx'),
+            models.Index(
+                fields=['receiver', '-created_at'], condition=models.Q(is_read=False), name='message_unread_idx',
+            ),
+            # The two halves of a user's message list (UnionKeysetPagination).
+            models.Index(fields=['sender', '-created_at', '-id'], name='message_sent_idx'),
+            models.Index(fields=['receiver', '-created_at', '-id'], name='message_received_idx'),
+        ]
 
     def __str__(self):
         return f"{self.sender.username} to {self.receiver.username}: {self.content[:50]}"
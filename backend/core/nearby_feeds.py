@@ -0,0 +1,117 @@
+"""
+Materialised "near me" feeds for users with a stored location.
+
+A feed is the ``FEED_SIZE`` nearest public listings within
+``FEED_RADIUS_KM`` of the user's location, stored as ``NearbyFeedEntry``
+rows, so reading it is one index range scan on ``(user, distance_km)``.
+
+Feeds are built on first read and rebuilt when the user has moved more
+than ``FEED_MOVE_KM`` or hasn't read theirs for ``FEED_ACTIVE_DAYS``. While
+a feed is active, listing changes are pushed into it: a changed listing is
+only matched against feeds centred in the grid cells around it (see
+``core.geo``), never against every user.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from . import geo
+from .db_router import pin_primary
+from .models import ClothingListing, NearbyFeed, NearbyFeedEntry
+
+FEED_RADIUS_KM = 10
+FEED_SIZE = 200
+FEED_MOVE_KM = 1.0
+FEED_ACTIVE_DAYS = 14
+READ_TOUCH_INTERVAL = timedelta(hours=1)
+
+
+def load_candidates(cells):
+    rows = ClothingListing.objects.filter(
+        is_public=True, grid_cell__in=cells,
+    ).values_list('id', 'location')
+    return [(pk, point.x, point.y) for pk, point in rows]
+
+
+def build_feed(user_id, point):
+    candidates = geo.nearby_candidates(point.x, point.y, FEED_RADIUS_KM, load_candidates)
+    ranked = geo.rank_by_distance(candidates, point.x, point.y, FEED_RADIUS_KM, FEED_SIZE)
+    now = timezone.now()
+    with transaction.atomic():
+        NearbyFeed.objects.update_or_create(user_id=user_id, defaults={
+            'location': point, 'grid_cell': geo.cell_for_point(point), 'built_at': now, 'last_read_at': now,
+        })
+        NearbyFeedEntry.objects.filter(user_id=user_id).delete()
+        NearbyFeedEntry.objects.bulk_create(
+            NearbyFeedEntry(user_id=user_id, listing_id=pk, distance_km=distance) for distance, pk in ranked
+        )
+
+
+def ensure_feed(user_id, point):
+    """
+    Build or rebuild the user's feed if it is missing, stale or centred
+    elsewhere. Returns True if it did: the new entries are only on the
+    primary, so read them there (``db_router.pin_primary``).
+    """
+    # From the primary: a lagging replica would miss a feed built moments
+    # ago and have it rebuilt on every request.
+    with pin_primary():
+        feed = NearbyFeed.objects.filter(user_id=user_id).values_list('location', 'last_read_at').first()
+    now = timezone.now()
+    if feed is not None:
+        center, last_read_at = feed
+        moved = geo.haversine_km(center.x, center.y, point.x, point.y)
+        if moved <= FEED_MOVE_KM and last_read_at >= now - timedelta(days=FEED_ACTIVE_DAYS):
+            if last_read_at < now - READ_TOUCH_INTERVAL:
+                NearbyFeed.objects.filter(user_id=user_id).update(last_read_at=now)
+            return False
+    build_feed(user_id, point)
+    return True
+
+
+def feed_listings(user_id, radius_km):
+    """The feed's listings within ``radius_km``, nearest first; slice it."""
+    return ClothingListing.objects.filter(
+        nearby_entries__user_id=user_id, nearby_entries__distance_km__lte=radius_km, is_public=True,
+    ).order_by('nearby_entries__distance_km')
+
+
+def refresh_listings(*listing_ids):
+    """Re-place changed listings in every active feed within range of them."""
+    with transaction.atomic():
+        NearbyFeedEntry.objects.filter(listing_id__in=listing_ids).delete()
+        listings = list(ClothingListing.objects.filter(
+            pk__in=listing_ids, is_public=True, location__isnull=False,
+        ).values_list('id', 'location'))
+        if not listings:
+            return
+        cells = {pk: geo.covering_cells(point.x, point.y, FEED_RADIUS_KM) for pk, point in listings}
+        feeds_by_cell = {}
+        active = NearbyFeed.objects.filter(
+            grid_cell__in={cell for covering in cells.values() for cell in covering},
+            last_read_at__gte=timezone.now() - timedelta(days=FEED_ACTIVE_DAYS),
+        ).values_list('grid_cell', 'user_id', 'location')
+        for cell, user_id, center in active:
+            feeds_by_cell.setdefault(cell, []).append((user_id, center))
+        entries = []
+        for pk, point in listings:
+            for cell in cells[pk]:
+                for user_id, center in feeds_by_cell.get(cell, ()):
+                    distance = geo.haversine_km(center.x, center.y, point.x, point.y)
+                    if distance <= FEED_RADIUS_KM:
+                        entries.append(NearbyFeedEntry(user_id=user_id, listing_id=pk, distance_km=distance))
+        NearbyFeedEntry.objects.bulk_create(entries, ignore_conflicts=True)
+        trim_feeds({entry.user_id for entry in entries})
+
+
+def trim_feeds(user_ids):
+    """Drop each feed's entries beyond its ``FEED_SIZE`` nearest."""
+    if not user_ids:
+        return
+    overflow = NearbyFeedEntry.objects.filter(user_id__in=user_ids).annotate(position=Window(
+        RowNumber(), partition_by=F('user_id'), order_by=(F('distance_km').asc(), F('listing_id').asc()),
+    )).filter(position__gt=FEED_SIZE).values('pk')
+    NearbyFeedEntry.objects.filter(pk__in=overflow).delete()
@@ -0,0 +1,144 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset pagination over ``key_fields`` descending, ``(created_at, id)`` by
+    default.
+
+    The cursor is the position of the last row on the page, so every page is
+    a single index range scan of ``page_size + 1`` rows no matter how deep
+    the client has scrolled.
+    """
+    key_fields = ('created_at', 'id')
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request):
+        return self.set_page([row async for row in self.page_queryset(queryset, request)])
+
+    def page_queryset(self, queryset, request):
+        """The lazy ``page_size + 1`` slice after the cursor; evaluate it and pass the rows to ``set_page``."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        return self.page_slice(queryset, self.decode_cursor(request))
+
+    def page_slice(self, queryset, position):
+        if position is not None:
+            first, second = self.key_fields
+            queryset = queryset.filter(
+                Q(**{f'{first}__lt': position[0]})
+                | Q(**{first: position[0], f'{second}__lt': position[1]})
+            )
+        return queryset.order_by(*[f'-{f}' for f in self.key_fields])[:self.page_size + 1]
+
+    def set_page(self, rows):
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            key, pk = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            key, pk = self.parse_key(key), int(pk)
+        except (TypeError, ValueError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if key is None:
+            raise NotFound(self.invalid_cursor_message)
+        return key, pk
+
+    def encode_cursor(self, obj):
+        if isinstance(obj, dict):
+            key, pk = obj[self.key_fields[0]], obj[self.key_fields[1]]
+        else:
+            key, pk = getattr(obj, self.key_fields[0]), obj.pk
+        payload = json.dumps([self.dump_key(key), pk])
+        return base64.urlsafe_b64encode(payload.encode('ascii')).decode('ascii')
+
+    def parse_key(self, value):
+        return parse_datetime(value)
+
+    def dump_key(self, value):
+        return value.isoformat()
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class UnionKeysetPagination(KeysetPagination):
+    """
+    Keyset pagination for rows matching any of several separately indexed
+    conditions, such as "sent or received by me". The view's
+    ``get_page_branches()`` returns them as ``Q`` objects; each branch is
+    paged on its own index and the page is cut from their ``UNION ALL``,
+    where a single ``OR`` filter would scan every row matching either.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.branches = view.get_page_branches()
+        return super().paginate_queryset(queryset, request, view)
+
+    def page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        first, *rest = [
+            self.page_slice(queryset.filter(branch).values('pk'), position) for branch in self.branches
+        ]
+        return self.page_slice(queryset.filter(pk__in=first.union(*rest, all=True)), None)
+
+
+class RankedKeysetPagination(KeysetPagination):
+    """Keyset pagination over a float ``rank`` annotation, ties broken by id."""
+    key_fields = ('rank', 'id')
+
+    def parse_key(self, value):
+        return float(value)
+
+    def dump_key(self, value):
+        return value
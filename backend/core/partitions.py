@@ -0,0 +1,272 @@
+"""
+Monthly range partitions of the message table.
+
+``core_message`` is partitioned by ``created_at`` (migration 0014), one
+partition per calendar month (UTC) named ``core_message_pYYYY_MM``, plus a
+default partition that catches rows for months nobody created yet.
+``ensure_partitions`` creates the coming months ahead of time;
+``archive_partition`` writes an old month to a gzipped JSON Lines file under
+``MESSAGE_ARCHIVE_DIR`` and drops it, and ``restore_partition`` loads it
+back. The ``message_partitions`` command drives all three.
+
+Dropping a month is a catalogue operation instead of a ``DELETE``, and
+queries bounded on ``created_at`` (see
+``core.conversations.message_window_start``) only open the partitions in range, so index size and latency of recent reads
+don't grow with history.
+"""
+import gzip
+import os
+import re
+from datetime import date, datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .conversations import refresh_unread_counts
+from .models import ClothingListing, Conversation, Message
+
+TABLE = Message._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+BATCH_SIZE = 1000
+
+_NAME_RE = re.compile(rf'^{TABLE}_p(\d{{4}})_(\d{{2}})$')
+
+
+def month_of(value):
+    """The first day of ``value``'s month in UTC."""
+    if isinstance(value, datetime):
+        value = value.astimezone(dt_timezone.utc)
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def parse_month(value):
+    """``'YYYY-MM'`` -> first day of that month; raises ``ValueError``."""
+    return datetime.strptime(value, '%Y-%m').date()
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y_%m}'
+
+
+def month_bounds(month):
+    start = datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+    end = datetime(*add_months(month, 1).timetuple()[:3], tzinfo=dt_timezone.utc)
+    return start, end
+
+
+def archive_dir(directory=None):
+    return Path(directory or settings.MESSAGE_ARCHIVE_DIR)
+
+
+def archive_path(month, directory=None):
+    return archive_dir(directory) / f'{partition_name(month)}.jsonl.gz'
+
+
+def partitions():
+    """``[(month or None, name, rows, index_bytes, total_bytes)]``, oldest month first, default last."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname, c.reltuples::bigint, pg_indexes_size(c.oid), pg_total_relation_size(c.oid)
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass
+            """,
+            [TABLE],
+        )
+        rows = cursor.fetchall()
+    result = []
+    for name, tuples, index_bytes, total_bytes in rows:
+        match = _NAME_RE.match(name)
+        month = date(int(match[1]), int(match[2]), 1) if match else None
+        result.append((month, name, max(tuples, 0), index_bytes, total_bytes))
+    return sorted(result, key=lambda row: (row[0] is None, row[0] or date.min))
+
+
+def _exists(name):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [name])
+        return cursor.fetchone()[0]
+
+
+def create_partition(month):
+    """
+    Create ``month``'s partition, moving any rows for it out of the default
+    partition first. Returns False if it already existed.
+    """
+    name = partition_name(month)
+    if _exists(name):
+        return False
+    start, end = month_bounds(month)
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Built detached and attached afterwards: attaching a range the
+        # default partition still has rows for would fail.
+        cursor.execute(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s RETURNING *) '
+            f'INSERT INTO {name} SELECT * FROM moved',
+            [start, end],
+        )
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+    return True
+
+
+def ensure_partitions(months_ahead=3, now=None):
+    """Create partitions from the current month to ``months_ahead`` months on. Returns the new names."""
+    current = month_of(now or timezone.now())
+    return [
+        partition_name(month) for month in (add_months(current, n) for n in range(months_ahead + 1))
+        if create_partition(month)
+    ]
+
+
+def _unread_pairs(cursor, table, where='TRUE', params=()):
+    cursor.execute(
+        f'SELECT DISTINCT receiver_id, conversation_id FROM {table} '
+        f'WHERE NOT is_read AND conversation_id IS NOT NULL AND {where}',
+        params,
+    )
+    return cursor.fetchall()
+
+
+def _refresh_unread(pairs):
+    by_receiver = {}
+    for receiver_id, conversation_id in pairs:
+        by_receiver.setdefault(receiver_id, set()).add(conversation_id)
+    for receiver_id, conversation_ids in by_receiver.items():
+        refresh_unread_counts(receiver_id, conversation_ids)
+
+
+def archive_partition(month, directory=None):
+    """
+    Write ``month``'s messages to a gzipped JSON Lines file, then drop the
+    partition and recount unread messages in the conversations it touched.
+    Returns ``(path, rows)``.
+    """
+    if month >= month_of(timezone.now()):
+        raise ValueError("Only past months can be archived.")
+    name = partition_name(month)
+    if not _exists(name):
+        raise LookupError(f"No partition for {month:%Y-%m}.")
+    path = archive_path(month, directory)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + '.partial')
+    rows = 0
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # Block writes to the month while it is copied and dropped.
+            cursor.execute(f'LOCK TABLE {name} IN SHARE MODE')
+        with gzip.open(partial, 'wt', encoding='utf-8') as archive, connection.chunked_cursor() as cursor:
+            cursor.execute(f'SELECT row_to_json(m)::text FROM {name} m ORDER BY created_at, id')
+            while batch := cursor.fetchmany(BATCH_SIZE):
+                archive.writelines(line + '\n' for line, in batch)
+                rows += len(batch)
+        with open(partial, 'rb') as written:
+            os.fsync(written.fileno())
+        os.replace(partial, path)
+        with connection.cursor() as cursor:
+            # last_message has no database constraint (a partitioned table
+            # can't back one); don't leave threads pointing at dropped rows.
+            cursor.execute(
+                f'UPDATE {Conversation._meta.db_table} SET last_message_id = NULL '
+                f'WHERE last_message_id IN (SELECT id FROM {name})'
+            )
+            unread = _unread_pairs(cursor, name)
+            cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+            cursor.execute(f'DROP TABLE {name}')
+        _refresh_unread(unread)
+    return path, rows
+
+
+def restore_partition(month, directory=None):
+    """
+    Load an archived month back into its partition and recount unread
+    messages in its conversations. Rows already present are skipped, so a
+    restore can be repeated, and so are rows whose sender, receiver,
+    listing or conversation no longer exists. Returns the rows inserted.
+    """
+    path = archive_path(month, directory)
+    if not path.exists():
+        raise FileNotFoundError(f"No archive for {month:%Y-%m} at {path}.")
+    inserted = 0
+    with transaction.atomic():
+        create_partition(month)
+        with gzip.open(path, 'rt', encoding='utf-8') as archive, connection.cursor() as cursor:
+            batch = []
+            for line in archive:
+                batch.append(line.strip())
+                if len(batch) == BATCH_SIZE:
+                    inserted += _insert(cursor, batch)
+                    batch = []
+            if batch:
+                inserted += _insert(cursor, batch)
+            start, end = month_bounds(month)
+            cursor.execute(
+                f"""
+                UPDATE {Conversation._meta.db_table} c SET last_message_id = (
+                    SELECT m.id FROM {TABLE} m WHERE m.conversation_id = c.id
+                    ORDER BY m.created_at DESC, m.id DESC LIMIT 1
+                )
+                WHERE c.last_message_id IS NULL AND c.id IN (
+                    SELECT conversation_id FROM {TABLE} WHERE created_at >= %s AND created_at < %s
+                )
+                """,
+                [start, end],
+            )
+            unread = _unread_pairs(cursor, TABLE, 'created_at >= %s AND created_at < %s', [start, end])
+        _refresh_unread(unread)
+    return inserted
+
+
+def _insert(cursor, lines):
+    # Rows whose user, listing or conversation was deleted after archiving
+    # would have been cascaded away with it; skip them.
+    cursor.execute(
+        f"""
+        INSERT INTO {TABLE}
+        SELECT r.* FROM json_populate_recordset(NULL::{TABLE}, %s::json) r
+        WHERE EXISTS (SELECT 1 FROM {User._meta.db_table} u WHERE u.id = r.sender_id)
+          AND EXISTS (SELECT 1 FROM {User._meta.db_table} u WHERE u.id = r.receiver_id)
+          AND EXISTS (SELECT 1 FROM {ClothingListing._meta.db_table} l WHERE l.id = r.listing_id)
+          AND (r.conversation_id IS NULL
+               OR EXISTS (SELECT 1 FROM {Conversation._meta.db_table} c WHERE c.id = r.conversation_id))
+        ON CONFLICT DO NOTHING
+        """,
+        ['[' + ','.join(lines) + ']'],
+    )
+    return cursor.rowcount
+
+
+def _default_partition_months(before):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT DISTINCT date_trunc('month', created_at AT TIME ZONE 'UTC')::date "
+            f"FROM {DEFAULT_PARTITION} WHERE created_at < %s",
+            [month_bounds(before)[0]],
+        )
+        return [month for month, in cursor.fetchall()]
+
+
+def archive_older_than(keep_months, directory=None, now=None):
+    """
+    Archive every month older than the last ``keep_months`` months,
+    including months whose rows are still in the default partition (they
+    get a partition first). Returns ``[(path, rows)]``.
+    """
+    cutoff = add_months(month_of(now or timezone.now()), -keep_months)
+    for month in _default_partition_months(cutoff):
+        create_partition(month)
+    return [
+        archive_partition(month, directory)
+        for month, _, _, _, _ in partitions() if month is not None and month < cutoff
+    ]
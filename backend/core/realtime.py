@@ -0,0 +1,70 @@
+"""
+Push delivery of messages and read receipts over WebSockets.
+
+Every connected user joins one channel-layer group; views publish to that
+group after their transaction commits, so clients no longer need to poll
+``/api/inbox/``.
+"""
+from urllib.parse import parse_qs
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.exceptions import AuthenticationFailed
+
+from .authentication import CachedTokenAuthentication
+
+
+def user_group(user_id):
+    return f'user.{user_id}'
+
+
+def _send(user_id, event):
+    layer = get_channel_layer()
+    if layer is not None:
+        async_to_sync(layer.group_send)(user_group(user_id), event)
+
+
+def publish_message(message):
+    from .serializers import MessageSerializer
+    _send(message.receiver_id, {
+        'type': 'message.new',
+        'message': MessageSerializer(message).data,
+    })
+
+
+def publish_read_receipts(reader_id, sender_ids, **receipt):
+    """
+    Tell each sender that ``reader`` has read their messages. ``receipt``
+    describes what was read: ``message_ids``, or an ``up_to`` watermark
+    optionally scoped to a ``listing``/``sender``.
+    """
+    for sender_id in sender_ids:
+        _send(sender_id, {'type': 'message.read', 'reader': reader_id, **receipt})
+
+
+@database_sync_to_async
+def _user_for_token(key):
+    try:
+        user, _ = CachedTokenAuthentication().authenticate_credentials(key)
+    except AuthenticationFailed:
+        return AnonymousUser()
+    return user
+
+
+class TokenAuthMiddleware:
+    """
+    Authenticate WebSocket handshakes from ``?token=<key>``, since browsers
+    can't set an Authorization header on a WebSocket. Falls back to whatever
+    the session middleware already put in the scope.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        token = parse_qs(scope.get('query_string', b'').decode()).get('token')
+        if token:
+            scope = dict(scope, user=await _user_for_token(token[0]))
+        return await self.app(scope, receive, send)
@@ -0,0 +1,298 @@
+"""
+Suggested swaps, scored with NumPy over an in-memory feature matrix.
+
+Every public listing is one row of a compact matrix: position (radians),
+creation time, a condition score, its owner and a hashed bag-of-words
+vector of title and description. Scoring a user against every row is a
+handful of vectorised array operations, so one request ranks tens of
+thousands of candidates without touching the ORM per candidate.
+
+Each process builds the matrix once and then keeps it current
+incrementally: listing changes are appended (after commit) to a short
+change log in ``RECOMMENDATIONS_SHARED_CACHE``, and ``refresh()`` re-reads
+only the ids logged since the last refresh. If the log has expired or been
+cleared the matrix is rebuilt from scratch. Without a shared cache the log
+only reaches the process that wrote it, so each matrix is also rebuilt once
+it is ``LOCAL_MATRIX_MAX_AGE`` seconds old, and suggestions aren't
+precomputed.
+
+Precomputed suggestions record the change sequence they were scored at;
+listings changed since then are dropped from them when they are served.
+"""
+import math
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache, caches
+
+from .models import ClothingListing, Message, UserLocation
+from .geo import EARTH_RADIUS_KM
+from .locations import buffer as location_buffer
+
+TEXT_DIMENSIONS = 64
+CONDITION_SCORES = {'new': 1.0, 'like_new': 0.8, 'good': 0.55, 'fair': 0.3}
+DISTANCE_SCALE_KM = 10.0
+RECENCY_DAYS = 14.0
+WEIGHTS = {'distance': 0.35, 'recency': 0.2, 'condition': 0.15, 'text': 0.3}
+CHANGE_LOG_TIMEOUT = 3600
+# No longer than the change log, so a precomputed list's changes can be replayed.
+PRECOMPUTED_TIMEOUT = CHANGE_LOG_TIMEOUT
+MAX_REPLAYED_CHANGES = 256
+LOCAL_MATRIX_MAX_AGE = 300
+MAX_PROFILE_LISTINGS = 50
+
+_SEQ_KEY = 'recommendations:change-seq'
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _change_key(seq):
+    return f'recommendations:change:{seq}'
+
+
+def precomputed_key(user_id):
+    return f'recommendations:suggestions:{user_id}'
+
+
+def shared_cache():
+    """The cache alias shared by every process, or ``None`` if none is configured."""
+    alias = getattr(settings, 'RECOMMENDATIONS_SHARED_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def _cache():
+    return shared_cache() or cache
+
+
+def text_vector(*texts):
+    """Unit-length hashed term counts; crc32 keeps buckets stable across processes."""
+    vector = np.zeros(TEXT_DIMENSIONS, dtype=np.float32)
+    for text in texts:
+        for term in _TERM_RE.findall(text.lower()):
+            vector[zlib.crc32(term.encode('utf-8')) % TEXT_DIMENSIONS] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def record_changes(*listing_ids):
+    """Log changed listings for every process's matrix. Call after commit."""
+    if not listing_ids:
+        return
+    log = _cache()
+    log.add(_SEQ_KEY, 0, None)
+    seq = log.incr(_SEQ_KEY)
+    log.set(_change_key(seq), list(listing_ids), CHANGE_LOG_TIMEOUT)
+
+
+def changes_since(seq, current, limit=None):
+    """Ids logged after ``seq`` up to ``current``, or ``None`` if the log can't cover them."""
+    if limit is not None and current - seq > limit:
+        return None
+    keys = [_change_key(n) for n in range(seq + 1, current + 1)]
+    logged = _cache().get_many(keys)
+    if len(logged) != len(keys):
+        return None
+    return {pk for ids in logged.values() for pk in ids}
+
+
+class FeatureMatrix:
+    _columns = (
+        ('ids', np.int64, ()),
+        ('owners', np.int64, ()),
+        ('coords', np.float64, (2,)),
+        ('has_location', bool, ()),
+        ('created', np.float64, ()),
+        ('condition', np.float32, ()),
+        ('text', np.float32, (TEXT_DIMENSIONS,)),
+        ('active', bool, ()),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.seq = None
+        self.built = 0.0
+        self._allocate(0)
+
+    def _allocate(self, capacity):
+        self.size = 0
+        self.rows = {}
+        self.free = []
+        for name, dtype, shape in self._columns:
+            setattr(self, name, np.zeros((capacity, *shape), dtype=dtype))
+
+    def _grow(self):
+        capacity = max(1024, len(self.ids) * 2)
+        for name, dtype, shape in self._columns:
+            old = getattr(self, name)
+            new = np.zeros((capacity, *shape), dtype=dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    @staticmethod
+    def _load(queryset):
+        return queryset.filter(is_public=True).values_list(
+            'id', 'wardrobe__user_id', 'location', 'created_at', 'condition', 'title', 'description',
+        ).iterator(chunk_size=2000)
+
+    def _upsert(self, record):
+        pk, owner, location, created_at, condition, title, description = record
+        row = self.rows.get(pk)
+        if row is None:
+            if self.free:
+                row = self.free.pop()
+            else:
+                if self.size == len(self.ids):
+                    self._grow()
+                row, self.size = self.size, self.size + 1
+            self.rows[pk] = row
+        self.ids[row] = pk
+        self.owners[row] = owner
+        if location is not None:
+            self.coords[row] = math.radians(location.x), math.radians(location.y)
+        self.has_location[row] = location is not None
+        self.created[row] = created_at.timestamp()
+        self.condition[row] = CONDITION_SCORES.get(condition, 0.0)
+        self.text[row] = text_vector(title, description)
+        self.active[row] = True
+
+    def _remove(self, pk):
+        row = self.rows.pop(pk, None)
+        if row is not None:
+            self.active[row] = False
+            self.free.append(row)
+
+    def clear(self):
+        """Force a full rebuild on the next ``refresh()``."""
+        self.seq = None
+
+    def _rebuild(self, seq):
+        records = list(self._load(ClothingListing.objects.all()))
+        with self._lock:
+            self._allocate(0)
+            for record in records:
+                self._upsert(record)
+            self.seq = seq
+            self.built = time.monotonic()
+
+    def refresh(self):
+        """Apply logged changes since the last refresh, or rebuild if the log can't be replayed."""
+        with self._refresh_lock:
+            current = _cache().get(_SEQ_KEY, 0)
+            if self.seq is None or current < self.seq:
+                return self._rebuild(current)
+            if shared_cache() is None and time.monotonic() - self.built > LOCAL_MATRIX_MAX_AGE:
+                return self._rebuild(current)
+            if current == self.seq:
+                return
+            changed = changes_since(self.seq, current)
+            if changed is None:
+                return self._rebuild(current)
+            records = list(self._load(ClothingListing.objects.filter(pk__in=changed)))
+            with self._lock:
+                for pk in changed:
+                    self._remove(pk)
+                for record in records:
+                    self._upsert(record)
+                self.seq = current
+
+    def top_k(self, profiles, k):
+        """
+        Best ``k`` ``(listing_id, score)`` pairs for each profile, scored in
+        one batch. A profile is ``(user_id, (lon, lat) or None, text_vector)``.
+        """
+        with self._lock:
+            n = self.size
+            if not n or not profiles:
+                return [[] for _ in profiles]
+            users = np.array([user_id for user_id, _, _ in profiles], dtype=np.int64)[:, None]
+            text = np.stack([vector for _, _, vector in profiles]) @ self.text[:n].T
+            scores = WEIGHTS['text'] * text
+            scores += WEIGHTS['condition'] * self.condition[:n]
+            age_days = np.maximum(time.time() - self.created[:n], 0) / 86400
+            scores += WEIGHTS['recency'] * np.exp(-age_days / RECENCY_DAYS)
+            scores += WEIGHTS['distance'] * self._proximity(profiles, n)
+            scores[:, ~self.active[:n]] = -np.inf
+            scores[self.owners[:n][None, :] == users] = -np.inf
+            results = []
+            for row in scores:
+                k_row = min(k, n)
+                best = np.argpartition(-row, k_row - 1)[:k_row]
+                best = best[np.argsort(-row[best])]
+                results.append([
+                    (int(self.ids[i]), float(row[i])) for i in best if np.isfinite(row[i])
+                ])
+            return results
+
+    def _proximity(self, profiles, n):
+        proximity = np.zeros((len(profiles), n), dtype=np.float64)
+        lon2, lat2 = self.coords[:n, 0], self.coords[:n, 1]
+        for i, (_, position, _) in enumerate(profiles):
+            if position is None:
+                continue
+            lon1, lat1 = map(math.radians, position)
+            a = (np.sin((lat2 - lat1) / 2) ** 2
+                 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+            distance = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+            proximity[i] = np.where(self.has_location[:n], np.exp(-distance / DISTANCE_SCALE_KM), 0.0)
+        return proximity
+
+
+matrix = FeatureMatrix()
+
+
+def build_profiles(user_ids):
+    """
+    ``top_k`` profiles for ``user_ids``: stored location plus the text of
+    the user's own listings and the listings they've messaged about.
+    """
+    locations = {
+        user_id: (point.x, point.y) for user_id, point in
+        UserLocation.objects.filter(user_id__in=user_ids, location__isnull=False).values_list('user_id', 'location')
+    }
+    locations.update({user_id: (lon, lat) for user_id, (lon, lat, _) in location_buffer.pending(user_ids).items()})
+    texts = {user_id: [] for user_id in user_ids}
+    own = ClothingListing.objects.filter(wardrobe__user_id__in=user_ids).order_by('-created_at')
+    for user_id, title, description in own.values_list('wardrobe__user_id', 'title', 'description'):
+        if len(texts[user_id]) < MAX_PROFILE_LISTINGS:
+            texts[user_id] += (title, description)
+    asked = Message.objects.filter(sender_id__in=user_ids).order_by().distinct()
+    for user_id, title in asked.values_list('sender_id', 'listing__title'):
+        if len(texts[user_id]) < 2 * MAX_PROFILE_LISTINGS:
+            texts[user_id].append(title)
+    return [
+        (user_id, locations.get(user_id), text_vector(*texts[user_id]))
+        for user_id in user_ids
+    ]
+
+
+def suggestions_for(user_id, k):
+    """Precomputed suggestions when available, otherwise scored now."""
+    store = _cache()
+    precomputed = store.get(precomputed_key(user_id))
+    if precomputed is not None:
+        seq, suggested = precomputed
+        changed = changes_since(seq, store.get(_SEQ_KEY, 0), MAX_REPLAYED_CHANGES)
+        if changed is not None:
+            suggested = [row for row in suggested if row[0] not in changed]
+            if len(suggested) >= k:
+                return suggested[:k]
+    matrix.refresh()
+    return matrix.top_k(build_profiles([user_id]), k)[0]
+
+
+def precompute(user_ids, k, batch_size=64):
+    """Score ``user_ids`` in batches and cache each user's top ``k``. Returns the number stored."""
+    matrix.refresh()
+    seq = matrix.seq
+    stored = 0
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        results = matrix.top_k(build_profiles(batch), k)
+        _cache().set_many({precomputed_key(user_id): (seq, result) for user_id, result in zip(batch, results)},
+                          PRECOMPUTED_TIMEOUT)
+        stored += len(batch)
+    return stored
@@ -0,0 +1,66 @@
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speed-up
+    orjson = None
+
+
+def _escape_separators(content):
+    # Match JSONRenderer, which escapes these so the output is valid JavaScript.
+    if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+        content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return content
+
+
+_fallback_encoder = JSONEncoder()
+# Hand datetimes and friends to DRF's encoder so they format exactly as before.
+_ORJSON_OPTIONS = (
+    orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+) if orjson is not None else 0
+
+
+def dumps(data):
+    """Compact JSON bytes, byte-for-byte what ``JSONRenderer`` would produce."""
+    if orjson is not None:
+        return _escape_separators(orjson.dumps(
+            data, default=_fallback_encoder.default, option=_ORJSON_OPTIONS,
+        ))
+    return JSONRenderer().render(data)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """``JSONRenderer`` that encodes with orjson when it is installed."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+def stream_json_list(rows, chunk_size=500):
+    """
+    Stream an iterable of already-serialised rows as a JSON array, encoding
+    ``chunk_size`` rows at a time so large lists are never held in memory.
+    """
+    def generate():
+        yield b'['
+        first = True
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                encoded = dumps(chunk)[1:-1]
+                yield encoded if first else b',' + encoded
+                first, chunk = False, []
+        if chunk:
+            encoded = dumps(chunk)[1:-1]
+            yield encoded if first else b',' + encoded
+        yield b']'
+
+    return StreamingHttpResponse(generate(), content_type='application/json')
+
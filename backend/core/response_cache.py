@@ -0,0 +1,148 @@
+"""
+Shared response cache for read-only public endpoints.
+
+Rendered JSON bodies are cached under a key built from the namespace's
+version counter, the path, the negotiated media type and the query string.
+Other formats (the browsable API) embed the requesting user and a CSRF
+token, so they are never cached. Writes bump the
+version (see ``core.signals``), so stale entries are never read again and
+simply age out. Hits carry ``ETag``/``Last-Modified`` and conditional
+requests are answered with ``304 Not Modified`` without touching the ORM.
+"""
+import hashlib
+import threading
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+TIMEOUT = 300
+
+
+class CacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = {}
+        self.misses = {}
+
+    def record(self, namespace, hit):
+        with self._lock:
+            counter = self.hits if hit else self.misses
+            counter[namespace] = counter.get(namespace, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            namespaces = set(self.hits) | set(self.misses)
+            result = {}
+            for namespace in sorted(namespaces):
+                hits, misses = self.hits.get(namespace, 0), self.misses.get(namespace, 0)
+                result[namespace] = {
+                    'hits': hits,
+                    'misses': misses,
+                    'hit_ratio': hits / (hits + misses),
+                }
+            return result
+
+
+stats = CacheStats()
+
+
+def _cache():
+    return caches[getattr(settings, 'PUBLIC_RESPONSE_CACHE', 'default')]
+
+
+def _version_key(namespace):
+    return f'response:{namespace}:version'
+
+
+def current_version(namespace):
+    return _cache().get(_version_key(namespace), 0)
+
+
+def bump_version(namespace):
+    cache = _cache()
+    try:
+        cache.incr(_version_key(namespace))
+    except ValueError:
+        cache.set(_version_key(namespace), 1, None)
+
+
+def key_for(namespace, request):
+    params = sorted(request.query_params.lists())
+    digest = hashlib.md5(
+        f'{request.path}|{request.accepted_media_type}|{urlencode(params, doseq=True)}'.encode(),
+        usedforsecurity=False,
+    ).hexdigest()
+    return f'response:{namespace}:{current_version(namespace)}:{digest}'
+
+
+def get(key):
+    return _cache().get(key)
+
+
+def store(key, response):
+    entry = {
+        'content': response.content,
+        'content_type': response['Content-Type'],
+        'etag': quote_etag(hashlib.md5(response.content, usedforsecurity=False).hexdigest()),
+        'last_modified': int(time.time()),
+    }
+    _cache().set(key, entry, TIMEOUT)
+    return entry
+
+
+def not_modified(request, entry):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return entry['etag'] in {tag.strip() for tag in if_none_match.split(',')} or if_none_match.strip() == '*'
+    since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return since is not None and entry['last_modified'] <= since
+
+
+def add_headers(response, entry, hit):
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    response['X-Cache'] = 'HIT' if hit else 'MISS'
+    patch_vary_headers(response, ('Accept',))
+    return response
+
+
+def respond(request, entry, hit):
+    if not_modified(request, entry):
+        return add_headers(HttpResponseNotModified(), entry, hit)
+    return add_headers(HttpResponse(entry['content'], content_type=entry['content_type']), entry, hit)
+
+
+class PublicResponseCacheMixin:
+    """
+    Cache successful GET responses of a public, user-independent view under
+    ``response_cache_namespace``.
+    """
+    response_cache_namespace = None
+
+    def get(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return super().get(request, *args, **kwargs)
+        namespace = self.response_cache_namespace
+        key = key_for(namespace, request)
+        entry = get(key)
+        stats.record(namespace, hit=entry is not None)
+        if entry is not None:
+            return respond(request, entry, hit=True)
+        self._response_cache_key = key
+        return super().get(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, '_response_cache_key', None)
+        if key is None or response.status_code != 200:
+            return response
+        response.render()
+        entry = store(key, response)
+        if not_modified(request, entry):
+            return respond(request, entry, hit=False)
+        return add_headers(response, entry, hit=False)
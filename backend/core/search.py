@@ -0,0 +1,53 @@
+import re
+
+from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import D
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+
+from . import geo
+from .models import ClothingListing
+
+# Must match the configuration used by the search vector trigger (migration 0007).
+SEARCH_CONFIG = 'english'
+MAX_TERMS = 8
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def build_query(text):
+    """
+    Turn free text into a prefix-matching tsquery: every term must match,
+    and the last one may be a partial word (``"denim jack"`` finds
+    "denim jacket"). Returns ``None`` when nothing searchable is left.
+    """
+    terms = _TERM_RE.findall(text.lower())[:MAX_TERMS]
+    if not terms:
+        return None
+    raw = ' & '.join(f"'{term}':*" for term in terms)
+    return SearchQuery(raw, config=SEARCH_CONFIG, search_type='raw')
+
+
+def search_listings(text, condition=None, near=None):
+    """
+    Public listings matching ``text``, annotated with ``rank``. The match is
+    answered by the GIN index on ``search_vector``; ``near`` is an optional
+    ``(lon, lat, radius_km)`` narrowed through the listing grid first.
+    """
+    query = build_query(text)
+    if query is None:
+        return ClothingListing.objects.none()
+    listings = ClothingListing.objects.filter(is_public=True, search_vector=query)
+    if condition:
+        listings = listings.filter(condition=condition)
+    if near is not None:
+        lon, lat, radius_km = near
+        radius_km = min(max(radius_km, 0), geo.MAX_RADIUS_KM)
+        listings = listings.filter(
+            grid_cell__in=geo.covering_cells(lon, lat, radius_km),
+            location__distance_lte=(Point(lon, lat, srid=4326), D(km=radius_km)),
+        )
+    # ts_rank is a real; as a double it survives the JSON cursor exactly, so
+    # the next page's ``rank = cursor`` still finds the tied rows.
+    return listings.annotate(rank=Cast(SearchRank('search_vector', query), FloatField()))
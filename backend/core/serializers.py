@@ -1,8 +1,50 @@
+import math
+
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from rest_framework.authtoken.models import Token
-from .models import Wardrobe, ClothingListing, UserLocation, Message
+from django.contrib.gis.geos import Point
+from .geo import MAX_RADIUS_KM
+from .models import Wardrobe, ClothingListing, Message, ConversationParticipant
+
+
+def parse_location(value):
+    """Accept ``"lon,lat"`` or ``[lon, lat]`` and return a WGS84 point."""
+    if isinstance(value, Point):
+        return value
+    try:
+        if isinstance(value, str):
+            value = value.split(',')
+        lon, lat = map(float, value)
+    except (TypeError, ValueError):
+        raise serializers.ValidationError("Expected 'lon,lat'.")
+    if not (-180 <= lon <= 180 and -90 <= lat <= 90):
+        raise serializers.ValidationError("Coordinates out of range.")
+    return Point(lon, lat, srid=4326)
+
+
+def query_position(params):
+    """``(lon, lat)`` from ``?lon=&lat=``, or ``None`` unless both are given."""
+    if not (params.get('lat') and params.get('lon')):
+        return None
+    try:
+        point = parse_location([params['lon'], params['lat']])
+    except serializers.ValidationError:
+        # NaN and infinities parse as floats but fail the range check.
+        raise serializers.ValidationError("lat and lon must be coordinates in range.")
+    return point.x, point.y
+
+
+def query_radius(params, default=10):
+    """``?radius=`` in km, clamped to ``[0, geo.MAX_RADIUS_KM]``."""
+    try:
+        radius = float(params.get('radius', default))
+    except ValueError:
+        radius = math.nan
+    if not math.isfinite(radius):
+        raise serializers.ValidationError({'radius': "Expected a number of km."})
+    return min(max(radius, 0), MAX_RADIUS_KM)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -37,30 +79,57 @@ class WardrobeSerializer(serializers.ModelSerializer):
 class ClothingListingSerializer(serializers.ModelSerializer):
     owner_username = serializers.CharField(source='wardrobe.user.username', read_only=True)
     location_coords = serializers.SerializerMethodField()
+    images = serializers.SerializerMethodField()
 
     class Meta:
         model = ClothingListing
-        fields = '__all__'
+        exclude = (
+            'grid_cell', 'search_vector', 'image_thumbnail', 'image_medium',
+            'image_width', 'image_height', 'image_blurhash', 'image_processed_for', 'image_phash',
+            'image_phash_chunks', 'change_xid', 'ever_public',
+        )
         read_only_fields = ('id', 'created_at')
+        extra_kwargs = {'image': {'write_only': True}}
+
+    def validate_location(self, value):
+        if value in (None, ''):
+            return None
+        return parse_location(value)
 
-    def create(self, validated_data):
-        location_str = validated_data.pop('location', None)
-        instance = super().create(validated_data)
-        if location_str:
-            try:
-                lon, lat = map(float, location_str.split(','))
-                from django.contrib.gis.geos import Point
-                instance.location = Point(lon, lat, srid=4326)
-                instance.save()
-            except ValueError:
-                pass
-        return instance
-    
     def get_location_coords(self, obj):
         if obj.location:
             return f"{obj.location.x}, {obj.location.y}"
         return None
 
+    def get_images(self, obj):
+        request = self.context.get('request')
+
+        def url(field):
+            if not field:
+                return None
+            return request.build_absolute_uri(field.url) if request else field.url
+
+        # Until the image job has run, both point at the original.
+        return {
+            'thumbnail': url(obj.image_thumbnail or obj.image),
+            'medium': url(obj.image_medium or obj.image),
+            'width': obj.image_width,
+            'height': obj.image_height,
+            'blurhash': obj.image_blurhash or None,
+        }
+
+class ListingImportSerializer(serializers.ModelSerializer):
+    """Validates one row of a bulk listing import; see core.importer."""
+
+    class Meta:
+        model = ClothingListing
+        fields = ('title', 'description', 'condition', 'location', 'is_public')
+
+    def validate_location(self, value):
+        if value in (None, ''):
+            return None
+        return parse_location(value)
+
 class MessageSerializer(serializers.ModelSerializer):
     sender_username = serializers.CharField(source='sender.username', read_only=True)
     receiver_username = serializers.CharField(source='receiver.username', read_only=True) 
@@ -68,10 +137,46 @@ class MessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Message
         fields = '__all__'
-        read_only_fields = ('id', 'created_at', 'is_read', 'sender_username', 'receiver_username')  
-
-class UserLocationSerializer(serializers.ModelSerializer):
+        read_only_fields = ('id', 'created_at', 'is_read', 'sender_username', 'receiver_username', 'conversation')
+
+class MessageReadSerializer(serializers.Serializer):
+    up_to = serializers.DateTimeField(required=False)
+    listing = serializers.IntegerField(required=False)
+    sender = serializers.IntegerField(required=False)
+    message_ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=500)
+
+class ConversationSerializer(serializers.ModelSerializer):
+    """Thread list entry, serialised from the requesting user's participant row."""
+    id = serializers.IntegerField(source='conversation_id', read_only=True)
+    listing = serializers.IntegerField(source='conversation.listing_id', read_only=True)
+    listing_title = serializers.CharField(source='conversation.listing.title', read_only=True)
+    other_user = serializers.SerializerMethodField()
+    last_message = serializers.SerializerMethodField()
 
     class Meta:
-        model = UserLocation
-        fields = '__all__'             
\ No newline at end of file
+        model = ConversationParticipant
+        fields = ('id', 'listing', 'listing_title', 'other_user', 'last_message', 'last_message_at', 'unread_count')
+
+    def get_other_user(self, obj):
+        conversation = obj.conversation
+        other = conversation.user_high if obj.user_id == conversation.user_low_id else conversation.user_low
+        return {'id': other.id, 'username': other.username}
+
+    def get_last_message(self, obj):
+        message = obj.conversation.last_message
+        if message is None:
+            return None
+        return {
+            'id': message.id,
+            'sender': message.sender_id,
+            'content': message.content,
+            'created_at': serializers.DateTimeField().to_representation(message.created_at),
+            'is_read': message.is_read,
+        }
+
+class UserLocationSerializer(serializers.Serializer):
+    """A location report; ``location`` is ``"lon,lat"`` or ``[lon, lat]``."""
+    location = serializers.JSONField(write_only=True)
+
+    def validate_location(self, value):
+        return parse_location(value)             
\ No newline at end of file
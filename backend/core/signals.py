@@ -0,0 +1,103 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_token
+from . import facets
+from .geo import bump_cell_versions
+from .response_cache import bump_version
+from .images import process_listing_image, release_rendition
+from .models import ClothingListing
+from .nearby_feeds import refresh_listings
+from .recommendations import record_changes
+from .tasks import enqueue
+from .tiles import bump_tiles
+
+
+@receiver(post_save, sender=ClothingListing)
+@receiver(post_delete, sender=ClothingListing)
+def evict_nearby_cells(sender, instance, **kwargs):
+    # After commit, or a nearby read in between caches the old candidates
+    # under the new cell version.
+    cells = (instance.grid_cell, getattr(instance, '_previous_grid_cell', None))
+    transaction.on_commit(lambda: bump_cell_versions(*cells))
+
+
+@receiver(post_save, sender=ClothingListing)
+@receiver(post_delete, sender=ClothingListing)
+def evict_map_tiles(sender, instance, **kwargs):
+    # After commit, or a tile read in between caches the old clusters under
+    # the new token.
+    points = (instance.location, getattr(instance, '_previous_location', None))
+    transaction.on_commit(lambda: bump_tiles(*points))
+
+
+@receiver(post_save, sender=ClothingListing)
+def count_saved_listing(sender, instance, created, **kwargs):
+    # ClothingListing.save wraps the write and this handler in one
+    # transaction, so a failure here rolls back the row too.
+    # An instance that wasn't loaded from the database has no known previous
+    # key; reconcile_facets repairs the counts for those.
+    previous = None if created else getattr(instance, '_previous_facet', None)
+    if created or previous is not None:
+        facets.record_change(previous, instance.facet_key())
+
+
+@receiver(post_delete, sender=ClothingListing)
+def count_deleted_listing(sender, instance, **kwargs):
+    facets.record_change(getattr(instance, '_saved_facet', None) or instance.facet_key(), None)
+
+
+@receiver(post_save, sender=ClothingListing)
+@receiver(post_delete, sender=ClothingListing)
+def bump_public_listings_version(sender, instance, **kwargs):
+    # After commit: a read between the bump and the commit would otherwise
+    # cache the old page under the new version.
+    transaction.on_commit(lambda: bump_version('listings'))
+
+
+@receiver(post_save, sender=ClothingListing)
+@receiver(post_delete, sender=ClothingListing)
+def log_recommendation_change(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: record_changes(pk))
+
+
+@receiver(post_save, sender=ClothingListing)
+def queue_nearby_feed_refresh(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not {'location', 'is_public'} & set(update_fields):
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: enqueue(refresh_listings, pk))
+
+
+@receiver(post_save, sender=ClothingListing)
+def queue_image_renditions(sender, instance, **kwargs):
+    if instance.image and instance.image.name != instance.image_processed_for:
+        pk = instance.pk
+        transaction.on_commit(lambda: enqueue(process_listing_image, pk))
+
+
+@receiver(post_delete, sender=ClothingListing)
+def delete_image_renditions(sender, instance, **kwargs):
+    # The original is a shared content-addressed blob and is left alone;
+    # renditions are deleted unless a listing with the same blob reuses them.
+    for field in (instance.image_thumbnail, instance.image_medium):
+        release_rendition(instance.pk, field)
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def evict_user_tokens(sender, instance, update_fields=None, **kwargs):
+    # login() saves last_login on every sign-in; that can't change auth state.
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    for key in Token.objects.filter(user=instance).values_list('key', flat=True):
+        invalidate_token(key)
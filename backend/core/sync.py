@@ -0,0 +1,84 @@
+"""
+Change feed for listings, so clients can keep a local copy in sync.
+
+Every insert or update stamps the row with the id of the writing
+transaction (``change_xid``) and every delete leaves a ``ListingTombstone``
+stamped the same way (both by triggers, migration 0011). A page of changes
+is a keyset range scan over ``(change_xid, id)`` on each table.
+
+Transaction ids are handed out at first write but commit in any order, so
+a plain sequence could hand a client cursor 12 while 11 is still in flight
+and 11 would never be sent. Reads therefore stop below the snapshot's
+``xmin``, the oldest transaction still running: everything below it has
+committed or rolled back and nothing new can appear there.
+
+The public feed only reports deletions of listings that were public at some
+point (``ever_public``, ``ListingTombstone.was_public``), so anonymous
+clients never learn the ids of listings that were always private.
+"""
+import base64
+import json
+
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from rest_framework.exceptions import NotFound
+
+PAGE_SIZE = 500
+START = ((0, 0), (0, 0))
+INVALID_CURSOR = 'Invalid cursor'
+
+
+def _horizon():
+    return RawSQL('pg_snapshot_xmin(pg_current_snapshot())::text::bigint', ())
+
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode('ascii')).decode('ascii')
+
+
+def decode_cursor(encoded):
+    if not encoded:
+        return START
+    try:
+        listings, tombstones = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+        position = tuple(tuple(int(part) for part in pair) for pair in (listings, tombstones))
+    except (TypeError, ValueError, UnicodeEncodeError):
+        raise NotFound(INVALID_CURSOR)
+    if any(len(pair) != 2 for pair in position):
+        raise NotFound(INVALID_CURSOR)
+    return position
+
+
+def _after(queryset, position, limit):
+    xid, pk = position
+    return queryset.filter(
+        Q(change_xid__gt=xid) | Q(change_xid=xid, id__gt=pk), change_xid__lt=_horizon(),
+    ).order_by('change_xid', 'id')[:limit + 1]
+
+
+def changes(listings, tombstones, cursor, serializer, public=False, limit=PAGE_SIZE):
+    """
+    The next page of changes after ``cursor`` among ``listings`` and
+    ``tombstones``. With ``public`` set, listings that are no longer
+    public are reported as deleted, and only listings that were ever public
+    are reported at all.
+    """
+    listing_position, tombstone_position = decode_cursor(cursor)
+    if public:
+        tombstones = tombstones.filter(was_public=True)
+    projected = serializer.project(listings, 'change_xid', 'id', 'is_public', 'ever_public')
+    rows = list(_after(projected, listing_position, limit))
+    removed = list(_after(tombstones.values_list('change_xid', 'id', 'listing_id'), tombstone_position, limit))
+    has_more = len(rows) > limit or len(removed) > limit
+    rows, removed = rows[:limit], removed[:limit]
+    if rows:
+        listing_position = (rows[-1]['change_xid'], rows[-1]['id'])
+    if removed:
+        tombstone_position = removed[-1][:2]
+    return {
+        'upserted': [serializer.to_representation(row) for row in rows if row['is_public'] or not public],
+        'deleted': [row['id'] for row in rows if public and not row['is_public'] and row['ever_public']]
+                   + [listing_id for _, _, listing_id in removed],
+        'cursor': encode_cursor([listing_position, tombstone_position]),
+        'has_more': has_more,
+    }
@@ -0,0 +1,51 @@
+"""
+Minimal in-process background task runner.
+
+Jobs run on a bounded thread pool so request threads return as soon as the
+work is queued. With ``TASKS_ALWAYS_EAGER`` enabled (tests, management
+commands) jobs run inline instead.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+from .db_router import pin_primary
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'TASK_WORKERS', 2),
+                    thread_name_prefix='core-task',
+                )
+    return _executor
+
+
+def _run(func, args):
+    try:
+        # Jobs are queued right after a commit; a replica may not have it yet.
+        with pin_primary():
+            func(*args)
+    except Exception:
+        logger.exception("Background task %s%r failed", func.__name__, args)
+    finally:
+        # Worker threads outlive requests, so close their connections explicitly.
+        connections.close_all()
+
+
+def enqueue(func, *args):
+    if getattr(settings, 'TASKS_ALWAYS_EAGER', False):
+        func(*args)
+        return None
+    return _get_executor().submit(_run, func, args)
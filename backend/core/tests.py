@@ -1,3 +1,1514 @@
-from django.test import TestCase
+import contextvars
+import json
+import math
+import tempfile
+from importlib import import_module
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from PIL import Image
+
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.http import HttpResponse
+from django.db import connection, transaction
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from . import (
+    authentication, db_router, duplicates, facets, geo, importer, locations, metrics, nearby_feeds, partitions,
+    recommendations, response_cache, search, sync, throttling, tiles,
+)
+from .conversations import get_or_create_conversation
+from .db_router import ReplicaRouter, is_pinned, pin_primary
+from .images import phash, process_listing_image
+from .middleware import RequestMetricsMiddleware
+from .fast_serializers import ListingRowSerializer, MessageRowSerializer
+from .models import Wardrobe, ClothingListing, Conversation, ConversationParticipant, Message, NearbyFeed, NearbyFeedEntry, UserLocation
+from .realtime import TokenAuthMiddleware
+from .renderers import FastJSONRenderer
+from .routing import websocket_urlpatterns
+from .storage import is_blob_name
+from .tiles import CLUSTER_MAX_ZOOM, tile_for_point
+from .urls import urlpatterns
+from .serializers import ClothingListingSerializer, MessageSerializer
+from .views import ClothingListingListCreateView
+
+
+def make_listings(count, is_public=True, prefix='seller'):
+    listings = []
+    for i in range(count):
+        user = User.objects.create_user(username=f'{prefix}{i}', password='pass12345')
+        wardrobe = Wardrobe.objects.create(user=user)
+        listings.append(ClothingListing.objects.create(
+            wardrobe=wardrobe,
+            title=f'Item {i}',
+            description='Gently used',
+            condition='good',
+            is_public=is_public,
+        ))
+    return listings
+
+
+def destination(lon, lat, bearing, km):
+    """The point ``km`` from (lon, lat) along ``bearing`` degrees."""
+    lon, lat, bearing = map(math.radians, (lon, lat, bearing))
+    angle = km / geo.EARTH_RADIUS_KM
+    lat2 = math.asin(math.sin(lat) * math.cos(angle) + math.cos(lat) * math.sin(angle) * math.cos(bearing))
+    lon2 = lon + math.atan2(
+        math.sin(bearing) * math.sin(angle) * math.cos(lat), math.cos(angle) - math.sin(lat) * math.sin(lat2),
+    )
+    return (math.degrees(lon2) + 540) % 360 - 180, math.degrees(lat2)
+
+
+class GeoGridTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_covering_cells_contain_every_point_in_range(self):
+        # Mid-latitudes, both sides of the antimeridian and next to the poles.
+        for lon, lat in ((-0.12, 51.5), (179.97, -16.5), (-179.95, 65.0), (10.0, 89.93), (-45.0, -89.96)):
+            for radius_km in (1, 10, geo.MAX_RADIUS_KM):
+                cells = set(geo.covering_cells(lon, lat, radius_km))
+                for bearing in range(0, 360, 15):
+                    for fraction in (0.5, 1.0):
+                        point = destination(lon, lat, bearing, radius_km * fraction)
+                        self.assertIn(geo.cell_key(*geo.cell_index(*point)), cells, (lon, lat, radius_km, bearing))
+
+    def test_cells_wrap_at_the_antimeridian_and_clamp_at_the_poles(self):
+        self.assertEqual(geo.cell_index(180.0, 0)[1], geo.cell_index(-180.0, 0)[1])
+        self.assertEqual(geo.cell_index(0, 90.0)[0], geo.cell_index(0, 89.95)[0])
+        cells = geo.covering_cells(10.0, 89.99, geo.MAX_RADIUS_KM)
+        self.assertEqual(len(cells), len(set(cells)))
+
+    def test_candidates_are_evicted_only_by_their_own_cells(self):
+        calls = []
+
+        def loader(cells):
+            calls.append(cells)
+            return [(1, -0.12, 51.5)]
+
+        cells = geo.covering_cells(-0.12, 51.5, 1)
+        geo.cell_candidates(cells, loader)
+        geo.cell_candidates(cells, loader)
+        self.assertEqual(len(calls), 1)
+        geo.bump_cell_versions(geo.cell_key(*geo.cell_index(2.35, 48.85)))
+        geo.cell_candidates(cells, loader)
+        self.assertEqual(len(calls), 1)
+        geo.bump_cell_versions(cells[0])
+        geo.cell_candidates(cells, loader)
+        self.assertEqual(len(calls), 2)
+
+
+class CoordinateParamTests(TestCase):
+    def test_non_finite_coordinates_are_rejected(self):
+        user = User.objects.create_user(username='coordinates', password='pass12345')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+        for url, params in (
+            (reverse('nearby-listings'), {'lat': 'nan', 'lon': '0'}),
+            (reverse('nearby-listings'), {'lat': '51.5', 'lon': '0', 'radius': 'inf'}),
+            (reverse('listing-facets'), {'lat': 'inf', 'lon': '0'}),
+            (reverse('listing-search'), {'q': 'coat', 'lat': '51.5', 'lon': '-inf'}),
+            (reverse('async-nearby-listings'), {'lat': 'nan', 'lon': 'nan'}),
+        ):
+            response = client.get(url, params)
+            self.assertEqual(response.status_code, 400, (url, params))
+
+
+class PublicListingsFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.listings = make_listings(30)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse('public-listings')
+
+    def test_query_count_is_independent_of_page_size(self):
+        for page_size in (1, 10, 30):
+            with self.assertNumQueries(1):
+                response = self.client.get(self.url, {'page_size': page_size})
+            self.assertEqual(len(response.data['results']), page_size)
+            self.assertTrue(all(row['owner_username'] for row in response.data['results']))
+
+    def test_cursor_walks_every_listing_once_newest_first(self):
+        seen = []
+        response = self.client.get(self.url, {'page_size': 7})
+        while True:
+            seen.extend(row['id'] for row in response.data['results'])
+            if not response.data['next']:
+                break
+            with self.assertNumQueries(1):
+                response = self.client.get(response.data['next'])
+        expected = [
+            listing.id for listing in
+            sorted(self.listings, key=lambda l: (l.created_at, l.id), reverse=True)
+        ]
+        self.assertEqual(seen, expected)
+
+    def test_private_listings_are_excluded(self):
+        hidden = make_listings(1, is_public=False, prefix='private')[0]
+        response = self.client.get(self.url, {'page_size': 100})
+        self.assertNotIn(hidden.id, [row['id'] for row in response.data['results']])
+
+    def test_repeat_requests_are_served_from_cache(self):
+        first = self.client.get(self.url, {'page_size': 5})
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url, {'page_size': 5})
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+        with self.assertNumQueries(0):
+            conditional = self.client.get(self.url, {'page_size': 5}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(conditional.status_code, 304)
+
+    def test_cache_is_per_path_and_json_only(self):
+        self.client.get(self.url, {'q': 'Item'})
+        response = self.client.get(reverse('listing-search'), {'q': 'Item'})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn('Accept', response['Vary'])
+        for _ in range(2):
+            html = self.client.get(self.url, {'q': 'Item'}, HTTP_ACCEPT='text/html')
+            self.assertNotIn('X-Cache', html)
+
+    def test_listing_change_invalidates_cache(self):
+        self.client.get(self.url, {'page_size': 5})
+        with self.captureOnCommitCallbacks() as callbacks:
+            make_listings(1, prefix='fresh')
+        self.assertEqual(self.client.get(self.url, {'page_size': 5})['X-Cache'], 'HIT')
+        for callback in callbacks:
+            callback()
+        response = self.client.get(self.url, {'page_size': 5})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['title'], 'Item 0')
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class ListingSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.wardrobe = Wardrobe.objects.create(user=User.objects.create_user(username='searcher', password='pass12345'))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def listing(self, title, description='Gently used'):
+        return ClothingListing.objects.create(
+            wardrobe=self.wardrobe, title=title, description=description, condition='good', is_public=True,
+        )
+
+    def search(self, q, **params):
+        response = self.client.get(reverse('listing-search'), {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data['results']]
+
+    def test_title_matches_rank_above_description_matches(self):
+        title = self.listing('Denim jacket')
+        description = self.listing('Wool scarf', 'Goes with any denim outfit')
+        self.listing('Silk dress')
+        self.assertEqual(self.search('denim'), [title.id, description.id])
+
+    def test_every_term_matches_as_a_prefix(self):
+        denim = self.listing('Denim jacket')
+        wool = self.listing('Wool jacket')
+        self.assertEqual(self.search('denim jack'), [denim.id])
+        self.assertEqual(sorted(self.search('jack')), [denim.id, wool.id])
+        self.assertEqual(self.search('de ja'), [denim.id])
+        self.assertEqual(sorted(self.search('jackets')), [denim.id, wool.id])
+
+    def test_punctuation_is_not_tsquery_syntax(self):
+        denim = self.listing('Denim jacket')
+        for query in ('!!!', "'&|:*", '() <->'):
+            self.assertIsNone(search.build_query(query))
+            self.assertEqual(self.search(query), [], query)
+        self.assertEqual(self.search("denim' & (jack!"), [denim.id])
+        self.assertEqual(self.client.get(reverse('listing-search')).status_code, 400)
+
+    def test_search_vector_follows_edits(self):
+        listing = self.listing('Denim jacket')
+        listing.title = 'Silk scarf'
+        listing.save()
+        self.assertEqual(self.search('scarf'), [listing.id])
+        self.assertEqual(self.search('jacket'), [])
+
+    def test_cursor_walks_tied_ranks_once_each(self):
+        titled = [self.listing('Red coat').id for _ in range(5)]
+        described = [self.listing('Red scarf', 'Matches a long coat').id for _ in range(3)]
+        seen = []
+        response = self.client.get(reverse('listing-search'), {'q': 'coat', 'page_size': 2})
+        while True:
+            seen.extend(row['id'] for row in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(seen, sorted(titled, reverse=True) + sorted(described, reverse=True))
+
+
+@override_settings(AUTH_TOKEN_SHARED_CACHE='default', AUTH_TOKEN_TTL=3600)
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        authentication.local_cache.clear()
+        self.addCleanup(authentication.local_cache.clear)
+        self.user = User.objects.create_user(username='token-user', password='pass12345')
+        self.key = Token.objects.create(user=self.user).key
+        self.auth = authentication.CachedTokenAuthentication()
+
+    def assertRejected(self, key, message):
+        with self.assertRaisesMessage(AuthenticationFailed, message):
+            self.auth.authenticate_credentials(key)
+
+    def test_cached_tokens_skip_the_database_and_copy_the_user(self):
+        first, _ = self.auth.authenticate_credentials(self.key)
+        with self.assertNumQueries(0):
+            second, token = self.auth.authenticate_credentials(self.key)
+        self.assertEqual(second.pk, self.user.pk)
+        self.assertIsNot(second, first)
+        self.assertEqual(token.key, self.key)
+
+    @override_settings(AUTH_TOKEN_SHARED_CACHE=None)
+    def test_nothing_is_cached_without_a_shared_cache(self):
+        self.auth.authenticate_credentials(self.key)
+        with self.assertNumQueries(1):
+            self.auth.authenticate_credentials(self.key)
+
+    def test_rotated_token_is_rejected(self):
+        self.auth.authenticate_credentials(self.key)
+        new_key = authentication.rotate_token(self.user).key
+        self.assertRejected(self.key, 'Invalid token.')
+        self.assertEqual(self.auth.authenticate_credentials(new_key)[0].pk, self.user.pk)
+
+    def test_deactivated_user_is_rejected(self):
+        self.auth.authenticate_credentials(self.key)
+        self.user.is_active = False
+        self.user.save()
+        self.assertRejected(self.key, 'User inactive or deleted.')
+
+    def test_other_processes_drop_entries_after_invalidation(self):
+        self.auth.authenticate_credentials(self.key)
+        stale = authentication.local_cache.get(self.key)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        authentication.invalidate_all()
+        # Another worker's LRU still holds the entry; the generation retires it.
+        authentication.local_cache.set(self.key, stale)
+        self.assertRejected(self.key, 'User inactive or deleted.')
+
+    def test_expired_token_is_rejected(self):
+        self.auth.authenticate_credentials(self.key)
+        Token.objects.filter(key=self.key).update(created=timezone.now() - timedelta(hours=2))
+        authentication.invalidate_all()
+        self.assertRejected(self.key, 'Token has expired.')
+        self.assertIsNone(authentication.local_cache.get(self.key))
+
+
+class MarkMessagesReadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        listing = make_listings(1)[0]
+        cls.seller = listing.wardrobe.user
+        cls.buyers = [User.objects.create_user(username=f'buyer{i}', password='pass12345') for i in range(2)]
+        cls.conversations = {
+            buyer.pk: get_or_create_conversation(listing, buyer, cls.seller) for buyer in cls.buyers
+        }
+        cls.listing = listing
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+        self.url = reverse('message-read')
+
+    def send(self, buyer, count):
+        Message.objects.bulk_create(
+            Message(
+                sender=buyer, receiver=self.seller, listing=self.listing,
+                conversation=self.conversations[buyer.pk], content=f'Still available? {i}',
+            )
+            for i in range(count)
+        )
+        ConversationParticipant.objects.filter(
+            conversation=self.conversations[buyer.pk], user=self.seller,
+        ).update(unread_count=count)
+
+    def mark_read(self, **data):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_query_count_is_constant_in_rows_updated(self):
+        small, large = self.buyers
+        self.send(small, 10)
+        _, small_queries = self.mark_read(sender=small.pk)
+        self.send(large, 10_000)
+        response, large_queries = self.mark_read(sender=large.pk)
+        self.assertEqual(response.data['updated'], 10_000)
+        self.assertEqual(small_queries, large_queries)
+        self.assertFalse(Message.objects.filter(receiver=self.seller, is_read=False).exists())
+        self.assertEqual(self.client.get(self.url).data['unread'], 0)
+
+    def test_scoped_to_sender(self):
+        first, second = self.buyers
+        self.send(first, 3)
+        self.send(second, 2)
+        response, _ = self.mark_read(sender=first.pk)
+        self.assertEqual(response.data['updated'], 3)
+        self.assertEqual(self.client.get(self.url).data['unread'], 2)
+
+
+class ConversationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.listing, other = make_listings(2, prefix='thread')
+        cls.seller, cls.other_seller = cls.listing.wardrobe.user, other.wardrobe.user
+        cls.other_listing = other
+        cls.buyer = User.objects.create_user(username='thread-buyer', password='pass12345')
+
+    def setUp(self):
+        cache.clear()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def send(self, sender, listing, content='Still available?'):
+        response = self.client_for(sender).post(reverse('message-list'), {'listing': listing.pk, 'content': content})
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def test_get_or_create_conversation_is_per_listing_and_pair(self):
+        first = get_or_create_conversation(self.listing, self.buyer, self.seller)
+        self.assertEqual(get_or_create_conversation(self.listing, self.seller, self.buyer), first)
+        self.assertNotEqual(get_or_create_conversation(self.other_listing, self.buyer, self.other_seller), first)
+        self.assertEqual(
+            set(first.participants.values_list('user_id', flat=True)), {self.buyer.pk, self.seller.pk},
+        )
+
+    def test_unread_counters_follow_sends_and_reads(self):
+        for _ in range(3):
+            self.send(self.buyer, self.listing)
+        self.send(self.seller, self.listing)
+        seller, buyer = self.client_for(self.seller), self.client_for(self.buyer)
+        self.assertEqual(seller.get(reverse('message-read')).data['unread'], 3)
+        self.assertEqual(buyer.get(reverse('message-read')).data['unread'], 1)
+        seller.post(reverse('message-read'), {'sender': self.buyer.pk}, format='json')
+        self.assertEqual(seller.get(reverse('message-read')).data['unread'], 0)
+        self.assertEqual(buyer.get(reverse('message-read')).data['unread'], 1)
+
+    def test_message_list_pages_through_sent_and_received(self):
+        ids = [
+            self.send(self.buyer, self.listing),
+            self.send(self.seller, self.listing),
+            self.send(self.buyer, self.other_listing),
+            self.send(self.other_seller, self.other_listing),
+            self.send(self.buyer, self.listing),
+        ]
+        unrelated = self.send(self.other_seller, self.listing)
+        client, seen, url = self.client_for(self.buyer), [], reverse('message-list')
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url, {'page_size': 2})
+        self.assertTrue(any('UNION ALL' in query['sql'] for query in queries))
+        while True:
+            seen += [row['id'] for row in response.data['results']]
+            if not response.data['next']:
+                break
+            response = client.get(response.data['next'])
+        self.assertEqual(seen, ids[::-1])
+        self.assertNotIn(unrelated, seen)
+
+    def test_message_reads_are_bounded_by_the_first_conversation(self):
+        self.send(self.seller, self.listing)
+        token = Token.objects.create(user=self.buyer)
+        client = self.client_for(self.buyer)
+        for url, headers in (
+            (reverse('message-list'), {}),
+            (reverse('inbox'), {}),
+            (reverse('async-inbox'), {'HTTP_AUTHORIZATION': f'Token {token.key}'}),
+        ):
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url, **headers)
+            self.assertEqual(response.status_code, 200, url)
+            reads = [query['sql'] for query in queries if 'FROM "core_message"' in query['sql']]
+            self.assertTrue(reads, url)
+            self.assertTrue(all('"core_message"."created_at" >= ' in sql for sql in reads), url)
+
+        nobody = User.objects.create_user(username='thread-nobody', password='pass12345')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client_for(nobody).get(reverse('inbox'))
+        self.assertEqual(b''.join(response.streaming_content), b'[]')
+        self.assertFalse([query for query in queries if 'FROM "core_message"' in query['sql']])
+
+    def test_backfill_builds_conversations_from_messages(self):
+        backfill = import_module('core.migrations.0009_conversations').backfill_conversations
+        Message.objects.bulk_create([
+            Message(sender=self.buyer, receiver=self.seller, listing=self.listing, content='Hi'),
+            Message(sender=self.seller, receiver=self.buyer, listing=self.listing, content='Hello', is_read=True),
+            Message(sender=self.buyer, receiver=self.seller, listing=self.listing, content='Swap?'),
+            Message(sender=self.buyer, receiver=self.other_seller, listing=self.other_listing, content='Hi'),
+        ])
+        last = Message.objects.create(sender=self.seller, receiver=self.buyer, listing=self.listing, content='Sure')
+        with CaptureQueriesContext(connection) as queries:
+            backfill(django_apps, None)
+        self.assertLess(len(queries), 10)
+        conversation = Conversation.objects.get(listing=self.listing)
+        self.assertEqual(Conversation.objects.count(), 2)
+        self.assertFalse(Message.objects.filter(conversation__isnull=True).exists())
+        self.assertEqual(conversation.messages.count(), 4)
+        self.assertEqual(conversation.last_message_id, last.pk)
+        self.assertEqual(
+            dict(conversation.participants.values_list('user_id', 'unread_count')),
+            {self.seller.pk: 2, self.buyer.pk: 1},
+        )
+
+
+class FastSerializerParityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        listings = make_listings(3)
+        listings[0].location = Point(-0.1278, 51.5074, srid=4326)
+        listings[0].image_thumbnail = 'listings/renditions/1-thumbnail.webp'
+        listings[0].image_medium = 'listings/renditions/1-medium.webp'
+        listings[0].image_width, listings[0].image_height = 640, 480
+        listings[0].image_blurhash = 'LEHV6nWB2yk8pyo0adR*.7kCMdnj'
+        listings[0].description = 'Line\u2028separator, "quotes" and émojis 👗'
+        listings[0].save()
+        # Uploaded, renditions not made yet: both fall back to the original.
+        listings[1].image = 'listings/blobs/ab/ab12.jpg'
+        listings[1].save()
+        cls.owner = listings[0].wardrobe.user
+        buyer = listings[1].wardrobe.user
+        conversation = get_or_create_conversation(listings[0], buyer, cls.owner)
+        Message.objects.create(sender=buyer, receiver=cls.owner, listing=listings[0],
+                               conversation=conversation, content='Still available?')
+        Message.objects.create(sender=cls.owner, receiver=buyer, listing=listings[0], content='Yes')
+
+    def setUp(self):
+        self.request = Request(APIRequestFactory().get('/api/listings/'))
+
+    def assertSameBytes(self, queryset, serializer_class, row_serializer, **context):
+        expected = JSONRenderer().render(serializer_class(queryset, many=True, context=context).data)
+        rows = row_serializer.serialize(row_serializer.project(queryset))
+        self.assertEqual(FastJSONRenderer().render(rows), expected)
+
+    def test_listing_rows_match_model_serializer(self):
+        queryset = ClothingListing.objects.select_related('wardrobe__user').order_by('id')
+        self.assertSameBytes(queryset, ClothingListingSerializer, ListingRowSerializer(self.request), request=self.request)
+
+    def test_message_rows_match_model_serializer(self):
+        queryset = Message.objects.select_related('sender', 'receiver').order_by('id')
+        self.assertSameBytes(queryset, MessageSerializer, MessageRowSerializer())
+
+    def test_streamed_list_matches_model_serializer(self):
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        response = client.get(reverse('listing-list'))
+        self.assertTrue(response.streaming)
+        request = response.wsgi_request
+        expected = ClothingListingSerializer(
+            ClothingListing.objects.filter(wardrobe__user=self.owner), many=True, context={'request': request},
+        ).data
+        self.assertEqual(b''.join(response.streaming_content), JSONRenderer().render(expected))
+
+    def test_asgi_list_is_read_inside_the_view(self):
+        request = AsyncRequestFactory().get(reverse('listing-list'))
+        force_authenticate(request, self.owner)
+        with CaptureQueriesContext(connection) as queries:
+            response = ClothingListingListCreateView.as_view()(request)
+        self.assertFalse(response.streaming)
+        self.assertEqual(len(queries), 1)
+        expected = ClothingListingSerializer(
+            ClothingListing.objects.filter(wardrobe__user=self.owner), many=True, context={'request': request},
+        ).data
+        self.assertEqual(response.render().content, JSONRenderer().render(expected))
+
+
+class InboxSocketTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        authentication.local_cache.clear()
+        self.listing = make_listings(1, prefix='socket')[0]
+        self.owner = self.listing.wardrobe.user
+        self.buyers = [User.objects.create_user(username=f'socket-buyer{i}', password='pass12345') for i in range(2)]
+        self.app = TokenAuthMiddleware(URLRouter(websocket_urlpatterns))
+
+    async def connect(self, user):
+        key = (await Token.objects.aget_or_create(user=user))[0].key
+        communicator = WebsocketCommunicator(self.app, f'/ws/inbox/?token={key}')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.addAsyncCleanup(communicator.disconnect)
+        return communicator
+
+    def send(self, sender, content):
+        client = APIClient()
+        client.force_authenticate(sender)
+        response = client.post(reverse('message-list'), {'listing': self.listing.pk, 'content': content})
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    async def test_invalid_token_is_refused(self):
+        communicator = WebsocketCommunicator(self.app, '/ws/inbox/?token=nope')
+        connected, code = await communicator.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4401)
+
+    async def test_new_messages_are_pushed_after_commit(self):
+        inbox = await self.connect(self.owner)
+
+        def send_and_roll_back():
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self.send(self.buyers[0], 'Never sent')
+                raise RuntimeError
+        await sync_to_async(send_and_roll_back)()
+        self.assertTrue(await inbox.receive_nothing())
+
+        message_id = await sync_to_async(self.send)(self.buyers[0], 'Still available?')
+        event = await inbox.receive_json_from()
+        self.assertEqual(event['type'], 'message.new')
+        self.assertEqual(event['message']['id'], message_id)
+
+    async def test_read_receipts_only_carry_the_senders_own_ids(self):
+        first = await sync_to_async(self.send)(self.buyers[0], 'Hi')
+        second = await sync_to_async(self.send)(self.buyers[1], 'Hello')
+        sender_socket = await self.connect(self.buyers[0])
+        reader_socket = await self.connect(self.owner)
+        await reader_socket.send_json_to({'type': 'read', 'message_ids': [first, second]})
+        receipt = await sender_socket.receive_json_from()
+        self.assertEqual(receipt, {'type': 'message.read', 'reader': self.owner.pk, 'message_ids': [first]})
+        self.assertTrue(await Message.objects.filter(pk=second, is_read=True).aexists())
+
+
+class BulkImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='importer', password='pass12345')
+
+    def setUp(self):
+        cache.clear()
+        throttling.local_limiter.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, content, name='listings.csv'):
+        return self.client.post(reverse('listing-bulk-import'), {'file': SimpleUploadedFile(name, content)})
+
+    def test_valid_rows_are_imported_and_invalid_ones_reported(self):
+        response = self.upload(
+            b'title,description,condition,location\n'
+            b'Coat,Warm,good,"-0.12,51.5"\n'
+            b'Scarf,Wool,mint,\n'
+            b'Hat,"Nul\x00byte",good,\n'
+            b'Boots,Leather,fair,\n'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 2))
+        self.assertEqual([error['row'] for error in response.data['errors']], [2, 3])
+        self.assertCountEqual(
+            ClothingListing.objects.filter(wardrobe__user=self.user).values_list('title', flat=True), ['Coat', 'Boots'],
+        )
+
+    def test_unreadable_files_are_rejected(self):
+        for content in (
+            b'title,description,condition\ncaf\xe9,Latin-1,good\n',
+            b'title,description,condition\nCoat,"' + b'x' * (200 * 1024) + b'\n',
+        ):
+            response = self.upload(content)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('Could not read the file', response.data['file'])
+        self.assertFalse(ClothingListing.objects.filter(wardrobe__user=self.user).exists())
+
+    def test_chunks_before_an_unreadable_row_are_kept(self):
+        def rows():
+            for number in range(1, 4):
+                yield number, {'title': f'Item {number}', 'description': 'Bulk', 'condition': 'good'}
+            raise UnicodeDecodeError('utf-8', b'\xe9', 0, 1, 'invalid continuation byte')
+
+        wardrobe = Wardrobe.objects.create(user=self.user)
+        result = importer.import_listings(wardrobe, rows(), chunk_size=2)
+        self.assertEqual(result.created, 3)
+        self.assertIn('invalid continuation byte', result.read_error)
+        self.assertEqual(wardrobe.listings.count(), 3)
+
+
+@override_settings(TASKS_ALWAYS_EAGER=True)
+class LoadToolTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def seed(self, **options):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command(
+                'seed_load', users=4, listings_per_user=3, threads=4, messages_per_thread=2, prefix='seed',
+                stdout=StringIO(), **options,
+            )
+
+    def test_seed_load_runs_the_import_hooks(self):
+        version = response_cache.current_version('listings')
+        self.seed()
+        ids = set(ClothingListing.objects.values_list('id', flat=True))
+        self.assertEqual(len(ids), 12)
+        self.assertEqual(sum(facets.totals()['visibility'].values()), 12)
+        self.assertEqual(recommendations.changes_since(0, cache.get(recommendations._SEQ_KEY)), ids)
+        self.assertGreater(response_cache.current_version('listings'), version)
+
+        self.seed(clear=True)
+        self.assertEqual(sum(facets.totals()['visibility'].values()), 12)
+
+    def test_bench_routes_covers_every_route(self):
+        self.seed()
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/baseline.json'
+            call_command('bench_routes', prefix='seed', requests=2, save_baseline=path, stdout=StringIO())
+            with open(path) as fh:
+                results = json.load(fh)
+        self.assertLessEqual({pattern.name for pattern in urlpatterns if pattern.name}, set(results))
+        for name, result in results.items():
+            self.assertFalse([code for code in result['statuses'] if int(code) >= 500], name)
+
+
+class SparseFieldsetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_listings(5, prefix='sparse')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse('public-listings')
+
+    def get(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params)
+        return response, queries
+
+    def test_fields_narrow_output_and_projection(self):
+        response, queries = self.get(fields='id,title,images.thumbnail,location_coords')
+        self.assertEqual(response.status_code, 200)
+        row = response.data['results'][0]
+        self.assertEqual(list(row), ['id', 'location_coords', 'images', 'title'])
+        self.assertEqual(list(row['images']), ['thumbnail'])
+        sql = queries[0]['sql']
+        self.assertNotIn('"description"', sql)
+        self.assertNotIn('"image_medium"', sql)
+        self.assertNotIn('auth_user', sql)
+
+    def test_expand_adds_nested_object(self):
+        response, _ = self.get(fields='id', expand='wardrobe')
+        row = response.data['results'][0]
+        self.assertEqual(list(row), ['id', 'wardrobe'])
+        self.assertEqual(list(row['wardrobe']), ['id', 'created_at', 'user'])
+
+    def test_query_count_does_not_grow_with_fields(self):
+        counts = {
+            len(self.get(**params)[1]) for params in (
+                {'fields': 'id'},
+                {'fields': 'id,title,owner_username,images'},
+                {'expand': 'wardrobe'},
+                {},
+            )
+        }
+        self.assertEqual(counts, {1})
+
+    def test_unknown_fields_are_rejected(self):
+        for params in ({'fields': 'id,password'}, {'fields': 'images.original'}, {'expand': 'owner'}):
+            response, _ = self.get(**params)
+            self.assertEqual(response.status_code, 400)
+
+
+class ListingTileTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.listings = make_listings(4, prefix='tile')
+        for i, listing in enumerate(cls.listings):
+            listing.location = Point(-0.1278 + i * 0.0001, 51.5074, srid=4326)
+            listing.save()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def url(self, z, point=(-0.1278, 51.5074)):
+        x, y = tile_for_point(z, *point)
+        return reverse('listing-tile', kwargs={'z': z, 'x': x, 'y': y})
+
+    def test_low_zoom_tiles_are_clustered(self):
+        response = self.client.get(self.url(3))
+        self.assertTrue(response.data['clustered'])
+        self.assertEqual([f['count'] for f in response.data['features']], [4])
+
+    def test_high_zoom_tiles_return_points(self):
+        response = self.client.get(self.url(CLUSTER_MAX_ZOOM + 1))
+        self.assertFalse(response.data['clustered'])
+        self.assertEqual(
+            sorted(f['id'] for f in response.data['features']), sorted(l.id for l in self.listings),
+        )
+
+    def test_repeat_requests_are_cached_until_a_listing_in_the_tile_changes(self):
+        url, elsewhere = self.url(10), self.url(10, point=(2.3522, 48.8566))
+        self.client.get(url)
+        self.client.get(elsewhere)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        listing = self.listings[0]
+        listing.is_public = False
+        with self.captureOnCommitCallbacks() as callbacks:
+            listing.save()
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.client.get(url).data['features'][0]['count'], 3)
+        with self.assertNumQueries(0):
+            self.client.get(elsewhere)
+
+    def test_version_tokens_are_only_kept_for_viewed_tiles(self):
+        url = self.url(10)
+        self.client.get(url)
+        version_key = tiles._version_key(10, *tile_for_point(10, -0.1278, 51.5074))
+        self.assertIsNotNone(cache.get(version_key))
+        tiles.bump_tiles(Point(2.3522, 48.8566, srid=4326))
+        self.assertIsNone(cache.get(tiles._version_key(10, *tile_for_point(10, 2.3522, 48.8566))))
+        # A lost token (evicted or expired) re-renders instead of serving a stale tile.
+        cache.delete(version_key)
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+    def test_out_of_range_tile_is_not_found(self):
+        self.assertEqual(self.client.get(reverse('listing-tile', kwargs={'z': 2, 'x': 4, 'y': 0})).status_code, 404)
+
+
+class SuggestedSwapsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        near, far, own = make_listings(3, prefix='swap')
+        near.title, near.location = 'Vintage denim jacket', Point(-0.12, 51.50, srid=4326)
+        far.title, far.location = 'Wool scarf', Point(2.35, 48.85, srid=4326)
+        own.title = 'Denim jeans'
+        for listing in (near, far, own):
+            listing.save()
+        cls.near, cls.far, cls.user = near, far, own.wardrobe.user
+        UserLocation.objects.create(user=cls.user, location=Point(-0.13, 51.51, srid=4326))
+
+    def setUp(self):
+        cache.clear()
+        recommendations.matrix.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('suggested-swaps')
+
+    def test_ranks_nearby_similar_listings_first_and_skips_own(self):
+        response = self.client.get(self.url)
+        self.assertEqual([row['id'] for row in response.data], [self.near.id, self.far.id])
+        self.assertGreater(response.data[0]['score'], response.data[1]['score'])
+
+    def test_matrix_picks_up_changes_incrementally(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            fresh = make_listings(1, prefix='swap-new')[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.far.delete()
+        ids = [row['id'] for row in self.client.get(self.url).data]
+        self.assertIn(fresh.id, ids)
+        self.assertNotIn(self.far.id, ids)
+
+    def test_precomputed_suggestions_are_served(self):
+        recommendations.precompute([self.user.pk], k=5)
+        with mock.patch.object(recommendations.matrix, 'top_k') as top_k:
+            response = self.client.get(self.url, {'limit': 1})
+        top_k.assert_not_called()
+        self.assertEqual([row['id'] for row in response.data], [self.near.id])
+
+    def test_precomputed_suggestions_drop_listings_changed_since(self):
+        recommendations.precompute([self.user.pk], k=5)
+        self.near.is_public = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.near.save()
+        with mock.patch.object(recommendations.matrix, 'top_k') as top_k:
+            response = self.client.get(self.url, {'limit': 1})
+        top_k.assert_not_called()
+        self.assertEqual([row['id'] for row in response.data], [self.far.id])
+
+    def test_precompute_command_needs_a_shared_cache(self):
+        self.user.last_login = timezone.now()
+        self.user.save(update_fields=['last_login'])
+        with self.assertRaises(CommandError):
+            call_command('precompute_suggestions', stdout=StringIO())
+        with override_settings(RECOMMENDATIONS_SHARED_CACHE='default'):
+            call_command('precompute_suggestions', stdout=StringIO(), stderr=StringIO())
+        self.assertIsNotNone(cache.get(recommendations.precomputed_key(self.user.pk)))
+
+
+class ListingChangeFeedTests(TransactionTestCase):
+    # The feed only reads below the oldest running transaction, so the
+    # writes must really commit; TestCase would keep them in its own.
+
+    def setUp(self):
+        cache.clear()
+        self.listings = make_listings(3, prefix='sync')
+        self.client = APIClient()
+        self.client.force_authenticate(self.listings[0].wardrobe.user)
+
+    def changes(self, name, since=None):
+        return self.client.get(reverse(name), {'since': since} if since else {}).data
+
+    def test_public_feed_returns_only_changes_after_cursor(self):
+        first = self.changes('public-listing-changes')
+        self.assertEqual({row['id'] for row in first['upserted']}, {l.id for l in self.listings})
+        self.assertFalse(first['has_more'])
+        self.assertEqual(self.changes('public-listing-changes', first['cursor'])['upserted'], [])
+
+        edited, hidden, deleted = self.listings
+        edited.title = 'Edited'
+        edited.save()
+        hidden.is_public = False
+        hidden.save()
+        deleted_id = deleted.id
+        deleted.delete()
+        delta = self.changes('public-listing-changes', first['cursor'])
+        self.assertEqual([(row['id'], row['title']) for row in delta['upserted']], [(edited.id, 'Edited')])
+        self.assertEqual(sorted(delta['deleted']), sorted([hidden.id, deleted_id]))
+
+    def test_own_feed_is_scoped_to_wardrobe(self):
+        own = self.listings[0]
+        first = self.changes('listing-changes')
+        self.assertEqual([row['id'] for row in first['upserted']], [own.id])
+        self.listings[1].delete()
+        own.delete()
+        delta = self.changes('listing-changes', first['cursor'])
+        self.assertEqual(delta['deleted'], [own.id])
+
+    def test_public_feed_never_mentions_always_private_listings(self):
+        start = self.changes('public-listing-changes')['cursor']
+        private = make_listings(1, is_public=False, prefix='sync-private')[0]
+        private.title = 'Still private'
+        private.save()
+        delta = self.changes('public-listing-changes', start)
+        self.assertEqual((delta['upserted'], delta['deleted']), ([], []))
+        private.delete()
+        delta = self.changes('public-listing-changes', delta['cursor'])
+        self.assertEqual(delta['deleted'], [])
+
+        once_public = self.listings[1]
+        once_public.is_public = False
+        once_public.save()
+        self.assertEqual(self.changes('public-listing-changes', delta['cursor'])['deleted'], [once_public.id])
+
+    def test_invalid_cursor_is_rejected(self):
+        self.assertEqual(self.client.get(reverse('listing-changes'), {'since': 'nope'}).status_code, 404)
+        malformed = sync.encode_cursor([[1], [2]])
+        self.assertEqual(self.client.get(reverse('public-listing-changes'), {'since': malformed}).status_code, 404)
+
+
+@override_settings(LOCATION_FLUSH_INTERVAL=60, LOCATION_MIN_MOVE_METERS=25)
+class LocationReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(username=f'walker{i}', password='pass12345') for i in range(3)]
+
+    def setUp(self):
+        for patcher in (
+            mock.patch.object(locations, 'buffer', locations.LocationBuffer()),
+            mock.patch.object(locations.LocationBuffer, '_ensure_flusher'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.url = reverse('user-location')
+
+    def report(self, user, lon, lat):
+        self.client.force_authenticate(user)
+        return self.client.post(self.url, {'location': f'{lon},{lat}'}, format='json')
+
+    def test_reports_are_buffered_and_readable_before_flush(self):
+        user = self.users[0]
+        with self.assertNumQueries(0):
+            self.assertTrue(self.report(user, -0.1278, 51.5074).data['accepted'])
+        self.assertFalse(UserLocation.objects.filter(user=user).exists())
+        self.assertEqual(self.client.get(self.url).data['lon'], -0.1278)
+
+    def test_small_moves_are_dropped(self):
+        user = self.users[0]
+        self.report(user, -0.1278, 51.5074)
+        self.assertFalse(self.report(user, -0.12781, 51.50741).data['accepted'])
+        self.assertTrue(self.report(user, -0.1378, 51.5074).data['accepted'])
+
+    def test_flush_upserts_latest_positions_in_one_query(self):
+        UserLocation.objects.create(user=self.users[0], location=Point(0, 0, srid=4326))
+        for i, user in enumerate(self.users):
+            self.report(user, i, i)
+            self.report(user, i + 1, i + 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(locations.buffer.flush(), 3)
+        self.assertEqual(
+            sorted((l.user_id, l.location.x) for l in UserLocation.objects.all()),
+            [(user.pk, i + 1.0) for i, user in enumerate(self.users)],
+        )
+
+
+@override_settings(TASKS_ALWAYS_EAGER=True)
+class StoredLocationNearbyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.close, cls.far = make_listings(2, prefix='nearby')
+        cls.close.location = Point(-0.12, 51.50, srid=4326)
+        cls.far.location = Point(2.35, 48.85, srid=4326)
+        cls.close.save()
+        cls.far.save()
+        cls.user = User.objects.create_user(username='nearby-reader', password='pass12345')
+        UserLocation.objects.create(user=cls.user, location=Point(-0.13, 51.51, srid=4326))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('nearby-listings')
+
+    def test_falls_back_to_stored_location(self):
+        response = self.client.get(self.url)
+        self.assertEqual([row['id'] for row in response.data], [self.close.id])
+
+    def test_cell_candidates_are_evicted_after_commit(self):
+        params = {'lat': 51.51, 'lon': -0.13, 'radius': 5}
+        self.assertEqual([row['id'] for row in self.client.get(self.url, params).data], [self.close.id])
+        self.far.location = Point(-0.13, 51.51, srid=4326)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.far.save()
+        self.assertEqual([row['id'] for row in self.client.get(self.url, params).data], [self.close.id])
+        for callback in callbacks:
+            callback()
+        self.assertEqual([row['id'] for row in self.client.get(self.url, params).data], [self.far.id, self.close.id])
+
+    @override_settings(DATABASE_REPLICAS=['replica_0'])
+    def test_feed_is_read_from_the_primary_right_after_a_build(self):
+        point = Point(-0.13, 51.51, srid=4326)
+        routed = []
+
+        def db_for_read(router, model, **hints):
+            routed.append((model, is_pinned()))
+            return 'default'
+
+        with mock.patch.object(ReplicaRouter, 'db_for_read', db_for_read):
+            self.assertTrue(nearby_feeds.ensure_feed(self.user.pk, point))
+            self.assertFalse(nearby_feeds.ensure_feed(self.user.pk, point))
+            response = self.client.get(self.url)
+        self.assertEqual([row['id'] for row in response.data], [self.close.id])
+        self.assertTrue(all(pinned for model, pinned in routed if model is NearbyFeed))
+
+    def test_feed_read_is_indexed_lookup_after_first_build(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertFalse(any('ST_' in q['sql'] or 'grid_cell' in q['sql'] for q in queries))
+
+    def test_new_listing_is_pushed_only_into_feeds_in_range(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            nearby, remote = make_listings(2, prefix='fresh-nearby')
+            nearby.location = Point(-0.125, 51.505, srid=4326)
+            remote.location = Point(139.69, 35.68, srid=4326)
+            nearby.save()
+            remote.save()
+        self.assertTrue(NearbyFeedEntry.objects.filter(user=self.user, listing=nearby).exists())
+        self.assertFalse(NearbyFeedEntry.objects.filter(listing=remote).exists())
+        # Stored location, feed freshness check, feed rows.
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertEqual([row['id'] for row in response.data], [nearby.id, self.close.id])
+
+
+    def test_pushed_listings_keep_the_feed_at_its_size(self):
+        self.client.get(self.url)
+        with mock.patch.object(nearby_feeds, 'FEED_SIZE', 2), self.captureOnCommitCallbacks(execute=True):
+            fresh = make_listings(3, prefix='crowded')
+            for i, listing in enumerate(fresh):
+                listing.location = Point(-0.13 + (i + 1) * 0.001, 51.51, srid=4326)
+                listing.save()
+        entries = NearbyFeedEntry.objects.filter(user=self.user).order_by('distance_km')
+        self.assertEqual(list(entries.values_list('listing', flat=True)), [fresh[0].id, fresh[1].id])
+
+class ListingFacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.close, cls.town, cls.hidden = make_listings(3, prefix='facets')
+        cls.close.location = Point(-0.125, 51.505, srid=4326)
+        cls.town.location = Point(-0.03, 51.51, srid=4326)
+        cls.town.condition = 'new'
+        cls.hidden.is_public = False
+        for listing in (cls.close, cls.town, cls.hidden):
+            listing.save()
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('listing-facets')
+
+    def test_counters_follow_writes_and_match_a_recount(self):
+        response = APIClient().get(self.url)
+        self.assertEqual(response.data['condition'], {'new': 1, 'like_new': 0, 'good': 1, 'fair': 0})
+        self.assertEqual(response.data['visibility'], {'public': 2, 'private': 1})
+        self.assertNotIn('distance', response.data)
+
+        self.town.condition = 'fair'
+        self.town.save()
+        self.hidden.is_public = True
+        self.hidden.save(update_fields=['is_public'])
+        self.close.delete()
+        self.assertEqual(facets.totals()['condition'], {'new': 0, 'like_new': 0, 'good': 1, 'fair': 1})
+        self.assertEqual(facets.totals()['visibility'], {'public': 2, 'private': 0})
+        self.assertEqual(facets.reconcile(), 0)
+
+    def test_failed_count_rolls_back_the_save(self):
+        self.town.condition = 'fair'
+        with mock.patch.object(facets, 'record', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            self.town.save()
+        self.assertEqual(ClothingListing.objects.get(pk=self.town.pk).condition, 'new')
+        self.assertEqual(facets.reconcile(), 0)
+
+    def test_distance_bands(self):
+        response = APIClient().get(self.url, {'lat': 51.50, 'lon': -0.12})
+        self.assertEqual(response.data['distance'], [
+            {'km': 1, 'count': 1}, {'km': 5, 'count': 1}, {'km': 10, 'count': 2}, {'km': 25, 'count': 2},
+        ])
+
+
+class MessagePartitionTests(TestCase):
+    def setUp(self):
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        settings_override = override_settings(MESSAGE_ARCHIVE_DIR=archive_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        listing = make_listings(1, prefix='partition')[0]
+        buyer = User.objects.create_user(username='partition-buyer', password='pass12345')
+        self.month = partitions.add_months(partitions.month_of(timezone.now()), -14)
+        sent_at = partitions.month_bounds(self.month)[0] + timedelta(days=3)
+        self.conversation = get_or_create_conversation(listing, buyer, listing.wardrobe.user)
+        self.message = Message.objects.create(
+            sender=buyer, receiver=listing.wardrobe.user, listing=listing,
+            conversation=self.conversation, content='Still available?',
+        )
+        # Lands in the default partition: no partition exists for that month yet.
+        Message.objects.filter(pk=self.message.pk).update(created_at=sent_at)
+        Conversation.objects.filter(pk=self.conversation.pk).update(
+            created_at=sent_at, last_message=self.message, last_message_at=sent_at,
+        )
+
+    def partition_rows(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {name}')
+            return cursor.fetchone()[0]
+
+    def test_create_archive_and_restore(self):
+        name = partitions.partition_name(self.month)
+        self.assertTrue(partitions.create_partition(self.month))
+        self.assertEqual(self.partition_rows(name), 1)
+        self.assertEqual(self.partition_rows(partitions.DEFAULT_PARTITION), 0)
+
+        path, rows = partitions.archive_partition(self.month)
+        self.assertEqual(rows, 1)
+        self.assertTrue(path.exists())
+        self.assertFalse(Message.objects.filter(pk=self.message.pk).exists())
+        self.assertIsNone(Conversation.objects.get(pk=self.conversation.pk).last_message_id)
+
+        self.assertEqual(partitions.restore_partition(self.month), 1)
+        self.assertEqual(partitions.restore_partition(self.month), 0)
+        restored = Message.objects.get(pk=self.message.pk)
+        self.assertEqual(restored.content, 'Still available?')
+        self.assertEqual(Conversation.objects.get(pk=self.conversation.pk).last_message_id, self.message.pk)
+
+    def test_archive_and_restore_recount_unread_messages(self):
+        participant = ConversationParticipant.objects.filter(
+            conversation=self.conversation, user=self.message.receiver,
+        )
+        participant.update(unread_count=1)
+        partitions.create_partition(self.month)
+        partitions.archive_partition(self.month)
+        self.assertEqual(participant.get().unread_count, 0)
+        partitions.restore_partition(self.month)
+        self.assertEqual(participant.get().unread_count, 1)
+
+    def test_archive_older_than_drains_the_default_partition(self):
+        archived = partitions.archive_older_than(12)
+        self.assertEqual([rows for _, rows in archived], [1])
+        self.assertFalse(Message.objects.filter(pk=self.message.pk).exists())
+        self.assertEqual(self.partition_rows(partitions.DEFAULT_PARTITION), 0)
+
+    def test_current_month_is_not_archived(self):
+        current = partitions.month_of(timezone.now())
+        with self.assertRaises(ValueError):
+            partitions.archive_partition(current)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def count(self, name, view, method='GET'):
+        prefix = f'{name}_count{{view="{view}",method="{method}"}} '
+        lines = [line for line in metrics.expose().splitlines() if line.startswith(prefix)]
+        return int(lines[0][len(prefix):]) if lines else 0
+
+    def test_requests_record_queries_and_serialisation_separately(self):
+        make_listings(3, prefix='metrics')
+        before = {
+            name: self.count(name, 'public-listings')
+            for name in ('swap_http_request_duration_seconds', 'swap_http_request_serialize_seconds')
+        }
+        queries_before = metrics.db_queries._series.get(('public-listings', 'GET'), [None, 0.0])[1]
+        self.assertEqual(APIClient().get(reverse('public-listings')).status_code, 200)
+        for name, count in before.items():
+            self.assertEqual(self.count(name, 'public-listings'), count + 1)
+        self.assertGreaterEqual(metrics.db_queries._series[('public-listings', 'GET')][1], queries_before + 1)
+
+    def test_async_requests_count_queries(self):
+        make_listings(2, prefix='metrics-async')
+
+        async def view(request):
+            return HttpResponse(str(await ClothingListing.objects.acount()))
+
+        request = AsyncRequestFactory().get('/metrics-async/')
+        request.resolver_match = None
+        series = ('<unresolved>', 'GET')
+        queries_before = metrics.db_queries._series.get(series, [None, 0.0])[1]
+        response = async_to_sync(RequestMetricsMiddleware(view))(request)
+        self.assertEqual(response.content, b'2')
+        self.assertEqual(metrics.db_queries._series[series][1], queries_before + 1)
+
+    def test_exposition_format(self):
+        histogram = metrics.Histogram('test_seconds', 'Test histogram.', (1, 2), ('view',))
+        for value in (0.5, 2, 3):
+            histogram.observe(value, 'a"b')
+        self.assertEqual(histogram.expose(), [
+            '# HELP test_seconds Test histogram.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{view="a\\"b",le="1"} 1',
+            'test_seconds_bucket{view="a\\"b",le="2"} 2',
+            'test_seconds_bucket{view="a\\"b",le="+Inf"} 3',
+            'test_seconds_sum{view="a\\"b"} 5.5',
+            'test_seconds_count{view="a\\"b"} 3',
+        ])
+        counter = metrics.Counter('test_total', 'Test counter.', ('status',))
+        counter.inc(200)
+        counter.inc(200, amount=2)
+        self.assertEqual(counter.expose()[2:], ['test_total{status="200"} 3'])
+
+    @override_settings(METRICS_ALLOWED_IPS=['127.0.0.1', '10.1.0.0/16'], METRICS_TOKEN='scrape-secret')
+    def test_metrics_endpoint_is_restricted(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='10.1.2.3').status_code, 200)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='203.0.113.9').status_code, 403)
+        self.assertEqual(
+            self.client.get(url, REMOTE_ADDR='203.0.113.9', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403,
+        )
+        response = self.client.get(url, REMOTE_ADDR='203.0.113.9', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE swap_http_requests_total counter', response.content.decode())
+
+
+class RateLimitTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='limited', password='pass12345')
+
+    def setUp(self):
+        cache.clear()
+        throttling.local_limiter.clear()
+
+    @override_settings(RATE_LIMITS={'login': {'username': '2/min'}})
+    def test_login_attempts_are_limited_per_username(self):
+        url = reverse('login')
+        for _ in range(2):
+            self.assertEqual(APIClient().post(url, {'username': 'Limited', 'password': 'wrong'}).status_code, 400)
+        response = APIClient().post(url, {'username': 'limited', 'password': 'pass12345'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        other = APIClient().post(url, {'username': 'someone-else', 'password': 'wrong'})
+        self.assertEqual(other.status_code, 400)
+
+    @override_settings(RATE_LIMITS={'login': {'ip': '2/min'}})
+    def test_forwarded_for_header_does_not_reset_the_ip_limit(self):
+        url = reverse('login')
+        statuses = [
+            APIClient().post(
+                url, {'username': 'limited', 'password': 'wrong'}, HTTP_X_FORWARDED_FOR=f'10.0.0.{i}',
+            ).status_code
+            for i in range(3)
+        ]
+        self.assertEqual(statuses, [400, 400, 429])
+
+    def check_writes_limited_per_user(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = reverse('listing-list')
+        self.assertEqual(client.post(url, {}).status_code, 400)
+        response = client.post(url, {})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(client.get(url).status_code, 200)
+
+    @override_settings(RATE_LIMITS={'listing-create': {'user': '1/min'}})
+    def test_listing_writes_are_limited_per_user(self):
+        self.check_writes_limited_per_user()
+
+    @override_settings(RATE_LIMITS={'listing-create': {'user': '1/min'}}, RATE_LIMIT_SHARED_CACHE='default')
+    def test_shared_cache_backend(self):
+        self.check_writes_limited_per_user()
+
+
+class AsyncReadEndpointTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.listings = make_listings(5, prefix='async')
+        cls.token = Token.objects.create(user=cls.listings[0].wardrobe.user)
+
+    def setUp(self):
+        cache.clear()
+        throttling.local_limiter.clear()
+        self.auth = {'Authorization': f'Token {self.token.key}'}
+
+    def add_listing(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_listings(1, prefix='async-fresh')
+
+    async def test_only_safe_methods_are_allowed(self):
+        for name in ('async-public-listings', 'async-nearby-listings', 'async-inbox'):
+            response = await self.async_client.post(reverse(name), headers=self.auth)
+            self.assertEqual(response.status_code, 405, name)
+            self.assertEqual((await self.async_client.head(reverse(name), headers=self.auth)).status_code, 200, name)
+
+    async def test_public_listings_share_the_response_cache(self):
+        url = reverse('async-public-listings')
+        first = await self.async_client.get(url, {'page_size': 3})
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(len(json.loads(first.content)['results']), 3)
+        second = await self.async_client.get(url, {'page_size': 3})
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+        conditional = await self.async_client.get(url, {'page_size': 3}, headers={'If-None-Match': first['ETag']})
+        self.assertEqual(conditional.status_code, 304)
+
+        await sync_to_async(self.add_listing)()
+        response = await self.async_client.get(url, {'page_size': 3})
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+    @override_settings(RATE_LIMITS={'listing-read': {'ip': '2/min'}})
+    async def test_sync_and_async_reads_share_a_rate_limit(self):
+        self.assertEqual((await sync_to_async(self.client.get)(reverse('public-listings'))).status_code, 200)
+        self.assertEqual((await self.async_client.get(reverse('async-public-listings'))).status_code, 200)
+        response = await self.async_client.get(reverse('async-nearby-listings'), headers=self.auth)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+
+    @override_settings(RATE_LIMITS={'inbox': {'user': '1/min'}})
+    async def test_inbox_requires_a_token_and_is_limited_per_user(self):
+        url = reverse('async-inbox')
+        self.assertEqual((await self.async_client.get(url)).status_code, 401)
+        response = await self.async_client.get(url, headers=self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), [])
+        self.assertEqual((await self.async_client.get(url, headers=self.auth)).status_code, 429)
+
+
+def photo(seed, size=256):
+    # Smooth random blobs, so a resized copy looks the same to the hash.
+    pixels = np.random.default_rng(seed).integers(0, 256, (8, 8, 3), dtype=np.uint8)
+    return Image.fromarray(pixels).resize((size, size), Image.BILINEAR)
+
+
+def upload(image, name='photo.jpg'):
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=90)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class ListingImageDuplicateTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.original, self.copy, self.resized, self.other = make_listings(4, prefix='dupes')
+        for listing, image, name in (
+            (self.original, photo(1), 'a.jpg'),
+            (self.copy, photo(1), 'b.jpg'),
+            (self.resized, photo(1, size=180), 'c.jpg'),
+            (self.other, photo(2), 'd.jpg'),
+        ):
+            listing.image = upload(image, name)
+            listing.save()
+            process_listing_image(listing.pk)
+            listing.refresh_from_db()
+
+    def test_render_command_processes_pending_listings(self):
+        ClothingListing.objects.filter(pk=self.other.pk).update(image_processed_for='', image_phash=None)
+        out = StringIO()
+        call_command('render_listing_images', stdout=out)
+        self.assertIn('rendered 1 listings (0 failed)', out.getvalue())
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.image_processed_for, self.other.image.name)
+        self.assertIsNotNone(self.other.image_phash)
+
+    def test_phash_distance(self):
+        self.assertLessEqual(duplicates.hamming(phash(photo(1)), phash(photo(1, size=180))), 2)
+        self.assertGreater(duplicates.hamming(phash(photo(1)), phash(photo(2))), duplicates.MAX_DISTANCE)
+
+    def test_identical_uploads_share_blob_and_renditions(self):
+        self.assertTrue(is_blob_name(self.original.image.name))
+        self.assertEqual(self.copy.image.name, self.original.image.name)
+        self.assertEqual(self.copy.image_thumbnail.name, self.original.image_thumbnail.name)
+        self.assertEqual(self.copy.image_phash, self.original.image_phash)
+        thumbnail, blob = self.original.image_thumbnail, self.original.image
+        with self.captureOnCommitCallbacks(execute=True):
+            self.copy.delete()
+        self.assertTrue(thumbnail.storage.exists(thumbnail.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.original.delete()
+        self.assertFalse(thumbnail.storage.exists(thumbnail.name))
+        self.assertTrue(blob.storage.exists(blob.name))
+
+    def test_sweep_deletes_only_old_unreferenced_files(self):
+        blob, medium = self.other.image, self.other.image_medium
+        ClothingListing.objects.filter(pk=self.other.pk).update(image='', image_thumbnail='', image_medium='')
+        call_command('sweep_listing_images', stdout=StringIO())
+        self.assertTrue(blob.storage.exists(blob.name))
+        out = StringIO()
+        call_command('sweep_listing_images', '--grace-hours=0', '--dry-run', stdout=out)
+        self.assertIn('would delete 3 unreferenced files', out.getvalue())
+        call_command('sweep_listing_images', '--grace-hours=0', stdout=StringIO())
+        self.assertFalse(blob.storage.exists(blob.name))
+        self.assertFalse(medium.storage.exists(medium.name))
+        self.assertTrue(self.original.image.storage.exists(self.original.image.name))
+        self.assertTrue(self.original.image_thumbnail.storage.exists(self.original.image_thumbnail.name))
+
+    def test_photos_use_the_default_storage_backend(self):
+        with override_settings(STORAGES={
+            'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        }):
+            self.other.image = upload(photo(3), 'e.jpg')
+            self.other.save()
+            self.assertTrue(default_storage.exists(self.other.image.name))
+        self.assertFalse(default_storage.exists(self.other.image.name))
+
+    def test_similar_listings_use_the_chunk_index(self):
+        found = [pk for _, pk in duplicates.similar_listings(self.original.image_phash)]
+        self.assertCountEqual(found, [self.original.pk, self.copy.pk, self.resized.pk])
+
+    def test_duplicates_endpoint_is_staff_only(self):
+        url = reverse('listing-duplicates')
+        client = APIClient()
+        client.force_authenticate(self.other.wardrobe.user)
+        self.assertEqual(client.get(url).status_code, 403)
+
+        staff = User.objects.create_user(username='dupes-staff', password='pass12345', is_staff=True)
+        client.force_authenticate(staff)
+        response = client.get(url)
+        self.assertEqual([cluster['size'] for cluster in response.data], [3])
+        self.assertCountEqual(
+            [row['id'] for row in response.data[0]['listings']],
+            [self.original.pk, self.copy.pk, self.resized.pk],
+        )
+        response = client.get(url, {'listing': self.original.pk})
+        self.assertEqual([row['id'] for row in response.data], [self.copy.pk, self.resized.pk])
+        self.assertEqual(response.data[0]['distance'], 0)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0', 'replica_1'], REPLICA_MAX_LAG=5)
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.lags = {'replica_0': 0.0, 'replica_1': 0.0}
+        patcher = mock.patch('core.db_router.lag_monitor.lag', side_effect=lambda alias: self.lags[alias])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reads_go_to_replicas_and_writes_to_primary(self):
+        reads = {self.router.db_for_read(Message) for _ in range(4)}
+        self.assertEqual(reads, {'replica_0', 'replica_1'})
+        self.assertEqual(self.router.db_for_write(Message), 'default')
+
+    def test_pinned_reads_go_to_primary(self):
+        with pin_primary():
+            self.assertEqual(self.router.db_for_read(Message), 'default')
+        self.assertNotEqual(self.router.db_for_read(Message), 'default')
+
+    def test_lagging_or_unreachable_replicas_are_skipped(self):
+        self.lags['replica_0'] = 30.0
+        self.assertEqual({self.router.db_for_read(Message) for _ in range(4)}, {'replica_1'})
+        self.lags['replica_1'] = None
+        self.assertEqual(self.router.db_for_read(Message), 'default')
+
+
+class ReadYourWritesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        authentication.local_cache.clear()
+
+    def pinned_after_auth(self, key):
+        # A fresh context, as for a new request with no pin cookie.
+        def authenticate():
+            authentication.CachedTokenAuthentication().authenticate_credentials(key)
+            return is_pinned()
+        return contextvars.Context().run(authenticate)
+
+    def test_rotated_token_is_pinned_by_user(self):
+        user = User.objects.create_user(username='rotating', password='pass12345')
+        old_key = Token.objects.create(user=user).key
+        response = APIClient().post(reverse('token-rotate'), HTTP_AUTHORIZATION=f'Token {old_key}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(self.pinned_after_auth(response.data['token']))
+
+    def test_registered_user_is_pinned(self):
+        response = APIClient().post(reverse('register'), {
+            'username': 'newcomer', 'email': 'newcomer@example.com', 'password': 'pass12345',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(self.pinned_after_auth(response.data['token']))
+
+    @override_settings(DATABASE_REPLICAS=['replica_0'])
+    def test_replicas_refuse_a_process_local_pin_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            db_router.check_pin_cache()
+        with tempfile.TemporaryDirectory() as directory:
+            shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}
+            with override_settings(CACHES={**settings.CACHES, 'pins': shared}, REPLICA_PIN_SHARED_CACHE='pins'):
+                db_router.check_pin_cache()
+                db_router.remember_writer(7)
+                self.assertIsNone(cache.get(db_router._writer_key(7)))
+
+                def pinned():
+                    db_router.pin_if_recent_writer(7)
+                    return is_pinned()
+                self.assertTrue(contextvars.Context().run(pinned))
+
+    def test_readers_who_did_not_write_are_not_pinned(self):
+        user = User.objects.create_user(username='reader', password='pass12345')
+        key = Token.objects.create(user=user).key
+        APIClient().get(reverse('wardrobe-list'), HTTP_AUTHORIZATION=f'Token {key}')
+        self.assertFalse(self.pinned_after_auth(key))
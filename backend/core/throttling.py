@@ -0,0 +1,194 @@
+"""
+Rate limiting for login and write endpoints.
+
+A view opts in with ``throttle_classes = [RateLimitThrottle]`` and a
+``rate_limit_scope``; ``RATE_LIMITS[scope]`` maps key kinds to rates, e.g.
+``{'user': '30/min', 'ip': '120/min'}``. A request is admitted only if
+every key it has is under its rate, and a refused request consumes nothing.
+Refusals surface as DRF's ``Throttled``: a 429 with ``Retry-After``.
+
+Key kinds are ``user`` (authenticated user id), ``ip`` (client address:
+``REMOTE_ADDR``, or with ``NUM_PROXIES`` set, the address that many proxies
+back in ``X-Forwarded-For``) and ``username`` (the submitted username,
+so one account can't be brute-forced from many addresses).
+
+By default limits are kept per process by ``LocalRateLimiter``, a GCRA
+token bucket holding one float per key in a plain dict. It takes no lock:
+concurrent requests for the same key can occasionally both be admitted,
+which is an acceptable error for a rate limiter and keeps a check to a few
+microseconds. With ``RATE_LIMIT_SHARED_CACHE`` set to a cache alias, limits
+are shared across processes with ``CacheRateLimiter`` instead, a sliding
+window counter built on the cache's atomic ``incr``: it increments first
+and checks the returned count, so concurrent workers can't all pass.
+"""
+import hashlib
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+MAX_LOCAL_KEYS = 100_000
+
+_PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate):
+    """``'30/min'`` -> ``(30, 60.0)``; the unit is read from its first letter, as DRF does."""
+    count, _, unit = rate.partition('/')
+    return int(count), float(_PERIODS[unit.strip()[0]])
+
+
+class LocalRateLimiter:
+    """
+    In-process GCRA. Each key stores its theoretical arrival time: the
+    moment the bucket would be full again. A request is admitted while that
+    stays within one period of now.
+    """
+
+    def __init__(self, max_keys=MAX_LOCAL_KEYS, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._tat = {}
+
+    def acquire(self, checks):
+        """``checks`` is ``[(key, limit, period)]``; returns 0 if admitted, else seconds to wait."""
+        now = self.clock()
+        tats = self._tat
+        updates = []
+        wait = 0.0
+        for key, limit, period in checks:
+            tat = tats.get(key, now)
+            tat = (tat if tat > now else now) + period / limit
+            if tat - now > period:
+                wait = max(wait, tat - now - period)
+            updates.append((key, tat))
+        if wait:
+            return wait
+        if len(tats) >= self.max_keys:
+            self._prune(now)
+        for key, tat in updates:
+            tats[key] = tat
+        return 0.0
+
+    def _prune(self, now):
+        for key, tat in list(self._tat.items()):
+            if tat <= now:
+                self._tat.pop(key, None)
+        if len(self._tat) >= self.max_keys:
+            # Every key is still limited; forgetting them is the safe side
+            # of running out of memory.
+            self._tat.clear()
+
+    def clear(self):
+        self._tat.clear()
+
+
+class CacheRateLimiter:
+    """
+    Sliding window counter in a shared cache: the estimate is this fixed
+    window's count plus the previous window's, weighted by how much of it
+    still overlaps the sliding window.
+    """
+
+    def __init__(self, cache, clock=time.time):
+        self.cache = cache
+        self.clock = clock
+
+    @staticmethod
+    def _key(key, window):
+        digest = hashlib.md5(repr(key).encode(), usedforsecurity=False).hexdigest()
+        return f'ratelimit:{digest}:{window}'
+
+    def acquire(self, checks):
+        now = self.clock()
+        windows = []
+        for key, limit, period in checks:
+            window = int(now // period)
+            windows.append((self._key(key, window), self._key(key, window - 1), limit, period, now - window * period))
+        previous_counts = self.cache.get_many([previous for _, previous, *_ in windows])
+        # Count first, then check the returned total: concurrent requests in
+        # other workers each see the others' increments. A refused request
+        # takes its increments back.
+        counted = []
+        wait = 0.0
+        for current, previous, limit, period, elapsed in windows:
+            this = self._increment(current, period)
+            counted.append(current)
+            last = previous_counts.get(previous, 0)
+            if last * (1 - elapsed / period) + this <= limit:
+                continue
+            before = this - 1
+            if this > limit:
+                # Not before the next window, and then until this one has slid far enough out.
+                retry = period - elapsed + max(0.0, period * (1 - (limit - 1) / max(before, 1)))
+            else:
+                retry = period * (1 - (limit - 1 - before) / last) - elapsed
+            wait = max(retry, 0.001)
+            break
+        if wait:
+            for key in counted:
+                try:
+                    self.cache.decr(key)
+                except ValueError:
+                    pass
+        return wait
+
+    def _increment(self, key, period):
+        timeout = int(2 * period) + 1
+        if self.cache.add(key, 1, timeout):
+            return 1
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # Expired between add and incr.
+            self.cache.set(key, 1, timeout)
+            return 1
+
+
+local_limiter = LocalRateLimiter()
+
+
+def limiter():
+    alias = getattr(settings, 'RATE_LIMIT_SHARED_CACHE', None)
+    return CacheRateLimiter(caches[alias]) if alias else local_limiter
+
+
+def _key_value(kind, request, throttle):
+    if kind == 'user':
+        user = request.user
+        return user.pk if user.is_authenticated else None
+    if kind == 'ip':
+        return throttle.get_ident(request)
+    if kind == 'username':
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        return username.strip().lower() if isinstance(username, str) and username.strip() else None
+    raise ValueError(f"Unknown rate limit key {kind!r}; expected 'user', 'ip' or 'username'.")
+
+
+class RateLimitThrottle(BaseThrottle):
+    """Applies ``RATE_LIMITS[view.rate_limit_scope]`` to ``view.rate_limit_methods`` (default POST)."""
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        scope = getattr(view, 'rate_limit_scope', None)
+        if scope is None or request.method not in getattr(view, 'rate_limit_methods', ('POST',)):
+            return True
+        policy = getattr(settings, 'RATE_LIMITS', {}).get(scope)
+        if not policy:
+            return True
+        checks = []
+        for kind, rate in policy.items():
+            value = _key_value(kind, request, self)
+            if value is not None:
+                checks.append(((scope, kind, value), *parse_rate(rate)))
+        wait = limiter().acquire(checks) if checks else 0.0
+        if wait:
+            self.retry_after = wait
+            return False
+        return True
+
+    def wait(self):
+        return self.retry_after
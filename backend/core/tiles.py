@@ -0,0 +1,135 @@
+"""
+Web Mercator (XYZ) map tiles of public listing points.
+
+Below ``CLUSTER_MAX_ZOOM`` each tile is split into ``CLUSTER_BINS`` x
+``CLUSTER_BINS`` bins and the points in a bin are collapsed into one
+cluster (centroid + count) by the database, so a zoomed-out tile costs one
+aggregate query however many listings it covers. From ``CLUSTER_MAX_ZOOM``
+up the individual points are returned.
+
+Rendered tiles are cached under a per-tile version token. Saving or
+deleting a listing drops the token of the tile containing its old and new
+position at every zoom level, so panning costs cache hits and a change only
+invalidates the tiles it actually shows up in. A missing token (dropped,
+expired or evicted) is replaced by a fresh one on the next read, so tokens
+are only stored for tiles being viewed and expire with the tiles.
+"""
+import math
+import uuid
+
+from django.contrib.gis.geos import Polygon
+from django.core.cache import cache
+from django.db.models import Avg, Count, F, FloatField, Func, IntegerField, Min, Value
+from django.db.models.functions import Cast, Cos, Floor, Greatest, Least, Ln, Radians, Tan
+
+from .models import ClothingListing
+
+MAX_ZOOM = 20
+CLUSTER_MAX_ZOOM = 15
+CLUSTER_BINS = 8
+MAX_LATITUDE = 85.0511287798
+TILE_CACHE_TIMEOUT = 3600
+
+
+def valid_tile(z, x, y):
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def tile_for_point(z, lon, lat):
+    n = 2 ** z
+    lat = max(min(lat, MAX_LATITUDE), -MAX_LATITUDE)
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bounds(z, x, y):
+    """``(west, south, east, north)`` in degrees."""
+    n = 2 ** z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360 - 180, lat(y + 1), (x + 1) / n * 360 - 180, lat(y)
+
+
+def _version_key(z, x, y):
+    return f'tiles:version:{z}/{x}/{y}'
+
+
+def bump_tiles(*points):
+    """Evict every cached tile, at every zoom, that contains one of ``points``."""
+    keys = {
+        _version_key(z, *tile_for_point(z, point.x, point.y))
+        for point in points if point is not None
+        for z in range(MAX_ZOOM + 1)
+    }
+    if keys:
+        cache.delete_many(keys)
+
+
+def _tile_version(z, x, y):
+    key = _version_key(z, x, y)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, TILE_CACHE_TIMEOUT):
+            version = cache.get(key, version)
+    return version
+
+
+def _lon():
+    return Func(F('location'), function='ST_X', output_field=FloatField())
+
+
+def _lat():
+    return Func(F('location'), function='ST_Y', output_field=FloatField())
+
+
+def _bin(position, origin):
+    return Cast(Least(Greatest(Floor(position - Value(float(origin))), Value(0.0)), Value(CLUSTER_BINS - 1.0)),
+                IntegerField())
+
+
+def _clusters(queryset, z, x, y):
+    scale = 2 ** z * CLUSTER_BINS
+    lat = Radians(_lat())
+    column = (_lon() + Value(180.0)) / Value(360.0) * Value(float(scale))
+    row = (Value(1.0) - Ln(Tan(lat) + Value(1.0) / Cos(lat)) / Value(math.pi)) / Value(2.0) * Value(float(scale))
+    rows = queryset.annotate(
+        bin_x=_bin(column, x * CLUSTER_BINS), bin_y=_bin(row, y * CLUSTER_BINS),
+    ).values('bin_x', 'bin_y').annotate(
+        count=Count('id'), lon=Avg(_lon()), lat=Avg(_lat()), first=Min('id'),
+    ).order_by('bin_y', 'bin_x')
+    features = []
+    for bin_ in rows:
+        feature = {'lon': round(bin_['lon'], 6), 'lat': round(bin_['lat'], 6), 'count': bin_['count']}
+        if bin_['count'] == 1:
+            feature['id'] = bin_['first']
+        features.append(feature)
+    return features
+
+
+def _points(queryset):
+    return [
+        {'id': pk, 'lon': point.x, 'lat': point.y, 'count': 1}
+        for pk, point in queryset.order_by('id').values_list('id', 'location')
+    ]
+
+
+def render_tile(z, x, y):
+    bbox = Polygon.from_bbox(tile_bounds(z, x, y))
+    bbox.srid = 4326
+    queryset = ClothingListing.objects.filter(is_public=True, location__intersects=bbox)
+    features = _points(queryset) if z >= CLUSTER_MAX_ZOOM else _clusters(queryset, z, x, y)
+    return {'z': z, 'x': x, 'y': y, 'clustered': z < CLUSTER_MAX_ZOOM, 'features': features}
+
+
+def get_tile(z, x, y):
+    """The tile's payload, from cache when its version hasn't changed."""
+    key = f'tiles:tile:{z}/{x}/{y}:{_tile_version(z, x, y)}'
+    tile = cache.get(key)
+    if tile is None:
+        tile = render_tile(z, x, y)
+        cache.set(key, tile, TILE_CACHE_TIMEOUT)
+    return tile
@@ -1,13 +1,29 @@
 from django.urls import path
-from .views import RegisterView, CustomLoginView, WardrobeListCreateView, ClothingListingListCreateView, PublicListingsView, NearbyListingsView, MessageListCreateView, UserMessagesView, UserLocationCreateView
+from . import async_views
+from .views import RegisterView, CustomLoginView, TokenRotateView, WardrobeListCreateView, ClothingListingListCreateView, ClothingListingBulkImportView, ListingChangesView, PublicListingsView, PublicListingChangesView, ListingSearchView, NearbyListingsView, ListingTileView, ListingFacetsView, ListingDuplicatesView, SuggestedSwapsView, MessageListCreateView, MessageReadView, ConversationListView, ConversationMessagesView, UserMessagesView, UserLocationView
 urlpatterns = [
     path('auth/register/', RegisterView.as_view(), name='register'),
     path('auth/login/', CustomLoginView.as_view(), name='login'),
+    path('auth/token/rotate/', TokenRotateView.as_view(), name='token-rotate'),
     path('wardrobes/', WardrobeListCreateView.as_view(), name='wardrobe-list'),
     path('listings/', ClothingListingListCreateView.as_view(), name='listing-list'),
+    path('listings/bulk/', ClothingListingBulkImportView.as_view(), name='listing-bulk-import'),
+    path('listings/changes/', ListingChangesView.as_view(), name='listing-changes'),
     path('public-listings/', PublicListingsView.as_view(), name='public-listings'),
+    path('public-listings/changes/', PublicListingChangesView.as_view(), name='public-listing-changes'),
+    path('search/', ListingSearchView.as_view(), name='listing-search'),
     path('nearby-listings/', NearbyListingsView.as_view(), name='nearby-listings'),
+    path('tiles/<int:z>/<int:x>/<int:y>', ListingTileView.as_view(), name='listing-tile'),
+    path('listing-facets/', ListingFacetsView.as_view(), name='listing-facets'),
+    path('listing-duplicates/', ListingDuplicatesView.as_view(), name='listing-duplicates'),
+    path('suggested-swaps/', SuggestedSwapsView.as_view(), name='suggested-swaps'),
     path('messages/', MessageListCreateView.as_view(), name='message-list'),
+    path('messages/read/', MessageReadView.as_view(), name='message-read'),
+    path('conversations/', ConversationListView.as_view(), name='conversation-list'),
+    path('conversations/<int:pk>/messages/', ConversationMessagesView.as_view(), name='conversation-messages'),
     path('inbox/', UserMessagesView.as_view(), name='inbox'),
-    path('user-location/', UserLocationCreateView(many=False).as_view(), name='user-location'),
+    path('async/public-listings/', async_views.public_listings, name='async-public-listings'),
+    path('async/nearby-listings/', async_views.nearby_listings, name='async-nearby-listings'),
+    path('async/inbox/', async_views.user_messages, name='async-inbox'),
+    path('user-location/', UserLocationView.as_view(), name='user-location'),
 ]
\ No newline at end of file
@@ -1,16 +1,42 @@
+import contextlib
+import io
+
 from rest_framework import generics, status
 from rest_framework.response import Response
+from rest_framework.parsers import MultiPartParser
+from rest_framework.exceptions import NotFound
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from django.contrib.auth import login
 from django.contrib.auth.models import User
-from .serializers import UserSerializer, LoginSerializer, WardrobeSerializer, ClothingListingSerializer, MessageSerializer, UserLocationSerializer
-from .models import Wardrobe, ClothingListing, Message
-from django.contrib.gis.geos import Point
-from django.contrib.gis.measure import D
+from .serializers import query_position, query_radius, UserSerializer, LoginSerializer, WardrobeSerializer, ClothingListingSerializer, MessageSerializer, MessageReadSerializer, ConversationSerializer, UserLocationSerializer
+from .models import Wardrobe, ClothingListing, ListingTombstone, Message, ConversationParticipant
+from .pagination import KeysetPagination, RankedKeysetPagination, UnionKeysetPagination
+from .fast_serializers import FastListMixin, ListingRowSerializer, MessageRowSerializer
+from .search import search_listings
+from . import importer
+from .realtime import publish_message
+from .conversations import send_message, mark_read, ids_by_sender, message_window_start
+from .authentication import rotate_token, token_expired
+from .response_cache import PublicResponseCacheMixin
+from .throttling import RateLimitThrottle
+from . import metrics
+from .realtime import publish_read_receipts
+from . import geo
+from . import tiles
+from . import recommendations
+from . import sync
+from . import locations
+from . import nearby_feeds
+from . import db_router
+from . import facets
+from . import duplicates
 from rest_framework import serializers
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from django.http import HttpResponse, HttpResponseForbidden
 
 
 
@@ -24,6 +50,8 @@ class RegisterView(generics.CreateAPIView):
         serializer.is_valid(raise_exception=True)
         user = serializer.save()
         token, created = Token.objects.get_or_create(user=user)
+        # Not signed in on this request, so the pinning middleware can't tell.
+        db_router.remember_writer(user.pk)
         return Response({
             'user': UserSerializer(user).data,
             'token': token.key,
@@ -32,12 +60,16 @@ class RegisterView(generics.CreateAPIView):
 
 class CustomLoginView(ObtainAuthToken):
     serializer_class = LoginSerializer
+    throttle_classes = [RateLimitThrottle]
+    rate_limit_scope = 'login'
 
     def post(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data
         token, created = Token.objects.get_or_create(user=user)
+        if not created and token_expired(token.created):
+            token = rotate_token(user)
         login(request, user)
         return Response({
             'user': UserSerializer(user).data,
@@ -45,6 +77,14 @@ class CustomLoginView(ObtainAuthToken):
         })
 
 
+class TokenRotateView(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        token = rotate_token(request.user)
+        return Response({'token': token.key})
+
+
 class WardrobeListCreateView(generics.ListCreateAPIView):
     serializer_class = WardrobeSerializer
     permission_classes = [IsAuthenticated]
@@ -55,16 +95,74 @@ class WardrobeListCreateView(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class PublicListingsView(generics.ListAPIView):
+class PublicListingsView(PublicResponseCacheMixin, FastListMixin, generics.ListAPIView):
+    serializer_class = ClothingListingSerializer
+    fast_serializer_class = ListingRowSerializer
+    permission_classes = []
+    pagination_class = KeysetPagination
+    response_cache_namespace = 'listings'
+    throttle_classes = [RateLimitThrottle]
+    rate_limit_scope = 'listing-read'
+    rate_limit_methods = ('GET', 'HEAD')
+
+    def get_queryset(self):
+        return ClothingListing.objects.filter(is_public=True).select_related('wardrobe__user')
+
+class ListingSearchView(PublicResponseCacheMixin, FastListMixin, generics.ListAPIView):
     serializer_class = ClothingListingSerializer
+    fast_serializer_class = ListingRowSerializer
     permission_classes = []
-    
+    pagination_class = RankedKeysetPagination
+    response_cache_namespace = 'listings'
+
     def get_queryset(self):
-        return ClothingListing.objects.filter(is_public=True).order_by('-created_at')[:20]
+        params = self.request.query_params
+        query = params.get('q', '').strip()
+        if not query:
+            raise serializers.ValidationError({'q': "This parameter is required."})
+        condition = params.get('condition')
+        if condition and condition not in dict(ClothingListing.CONDITION_CHOICES):
+            raise serializers.ValidationError({'condition': f"Unknown condition '{condition}'."})
+        position = query_position(params)
+        near = (*position, query_radius(params)) if position is not None else None
+        return search_listings(query, condition=condition, near=near).select_related('wardrobe__user')
+
+class ListingTileView(generics.GenericAPIView):
+    """Public listing points in one XYZ map tile, clustered below ``tiles.CLUSTER_MAX_ZOOM``."""
+    permission_classes = []
+
+    def get(self, request, z, x, y):
+        if not tiles.valid_tile(z, x, y):
+            raise NotFound()
+        return Response(tiles.get_tile(z, x, y))
+
+class ListingFacetsView(generics.GenericAPIView):
+    """
+    Counts for the listing filter chips, read from ``core.facets`` counters.
+    Distance bands are included for ``?lat=&lon=``, or the user's stored
+    location when those are omitted.
+    """
+    permission_classes = []
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        position = query_position(params)
+        if position is None and request.user.is_authenticated:
+            stored = locations.buffer.current(request.user.pk)
+            if stored is not None:
+                position = (stored[0].x, stored[0].y)
+        data = facets.totals()
+        if position is not None:
+            bands = facets.distance_bands(*position)
+            data['distance'] = [{'km': km, 'count': count} for km, count in bands.items()]
+        return Response(data)
 
-class ClothingListingListCreateView(generics.ListCreateAPIView):
+class ClothingListingListCreateView(FastListMixin, generics.ListCreateAPIView):
     serializer_class = ClothingListingSerializer
+    fast_serializer_class = ListingRowSerializer
     permission_classes = [IsAuthenticated]
+    throttle_classes = [RateLimitThrottle]
+    rate_limit_scope = 'listing-create'
 
     def get_queryset(self):
         return ClothingListing.objects.filter(wardrobe__user=self.request.user)
@@ -73,48 +171,309 @@ class ClothingListingListCreateView(generics.ListCreateAPIView):
         wardrobe, _ = Wardrobe.objects.get_or_create(user=self.request.user)
         serializer.save(wardrobe=wardrobe)
 
+class ListingChangesView(generics.GenericAPIView):
+    """The requesting user's listings created, updated or deleted after ``?since=``."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        wardrobe_id = Wardrobe.objects.filter(user=request.user).values_list('id', flat=True).first()
+        return Response(sync.changes(
+            ClothingListing.objects.filter(wardrobe_id=wardrobe_id),
+            ListingTombstone.objects.filter(wardrobe_id=wardrobe_id),
+            request.query_params.get('since'),
+            ListingRowSerializer.from_request(request),
+        ))
+
+class PublicListingChangesView(generics.GenericAPIView):
+    """Public feed changes after ``?since=``; listings made private are reported as deleted."""
+    permission_classes = []
+
+    def get(self, request, *args, **kwargs):
+        return Response(sync.changes(
+            ClothingListing.objects.all(),
+            ListingTombstone.objects.all(),
+            request.query_params.get('since'),
+            ListingRowSerializer.from_request(request),
+            public=True,
+        ))
+
+class ClothingListingBulkImportView(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+    throttle_classes = [RateLimitThrottle]
+    rate_limit_scope = 'listing-create'
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise serializers.ValidationError({'file': "Upload a CSV or JSONL file."})
+        fmt = request.data.get('format') or importer.guess_format(upload.name)
+        if fmt not in importer.FORMATS:
+            raise serializers.ValidationError({'format': f"Expected one of {', '.join(importer.FORMATS)}."})
+        wardrobe, _ = Wardrobe.objects.get_or_create(user=request.user)
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        result = importer.import_listings(wardrobe, importer.iter_rows(stream, fmt))
+        data = {
+            'created': result.created,
+            'failed': result.failed,
+            'errors': result.errors,
+        }
+        if result.read_error:
+            return Response({**data, 'file': result.read_error}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data, status=status.HTTP_201_CREATED if result.created else status.HTTP_400_BAD_REQUEST)
+
 class NearbyListingsView(generics.ListAPIView):
+    """
+    Listings nearest ``?lat=&lon=``, or the user's stored location when
+    those are omitted. Stored-location reads within the feed radius come
+    from the user's materialised feed (see ``core.nearby_feeds``).
+    """
     serializer_class = ClothingListingSerializer
     permission_classes = [IsAuthenticated]
+    throttle_classes = [RateLimitThrottle]
+    rate_limit_scope = 'listing-read'
+    rate_limit_methods = ('GET', 'HEAD')
+    max_results = 20
+    load_candidates = staticmethod(nearby_feeds.load_candidates)
 
     def get_queryset(self):
-        user_lat = self.request.query_params.get('lat')
-        user_lon = self.request.query_params.get('lon')
-        radius_km = float(self.request.query_params.get('radius', 10))
-        if user_lat and user_lon:
-            user_point = Point(float(user_lon), float(user_lat), srid=4326)
-            return ClothingListing.objects.filter(
-                is_public=True,
-                location__distance_lte=(user_point, D(km=radius_km))
-            ).distance(user_point).order_by('distance')[:20]   
-        return ClothingListing.objects.none() 
-    
-class MessageListCreateView(generics.ListCreateAPIView):
+        return ClothingListing.objects.all()
+
+    def ranked_ids(self, lon, lat, radius_km):
+        candidates = geo.nearby_candidates(lon, lat, radius_km, self.load_candidates)
+        return [pk for _, pk in geo.rank_by_distance(candidates, lon, lat, radius_km, self.max_results)]
+
+    def list(self, request, *args, **kwargs):
+        serializer = ListingRowSerializer.from_request(request)
+        params = request.query_params
+        radius_km = query_radius(params)
+        position = query_position(params)
+        if position is None:
+            stored = locations.buffer.current(request.user.pk)
+            if stored is None:
+                return Response([])
+            point = stored[0]
+            if radius_km <= nearby_feeds.FEED_RADIUS_KM:
+                built = nearby_feeds.ensure_feed(request.user.pk, point)
+                with db_router.pin_primary() if built else contextlib.nullcontext():
+                    rows = serializer.project(nearby_feeds.feed_listings(request.user.pk, radius_km))
+                    return Response(serializer.serialize(rows[:self.max_results]))
+            position = (point.x, point.y)
+        ids = self.ranked_ids(*position, radius_km)
+        if not ids:
+            return Response([])
+        rows = {row['id']: row for row in serializer.project(self.get_queryset().filter(pk__in=ids), 'id')}
+        return Response(serializer.serialize(rows[pk] for pk in ids if pk in rows))
+
+class SuggestedSwapsView(generics.GenericAPIView):
+    """Public listings ranked for the requesting user; see ``core.recommendations``."""
+    permission_classes = [IsAuthenticated]
+    default_limit = 20
+    max_limit = 100
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = min(max(int(request.query_params.get('limit', self.default_limit)), 1), self.max_limit)
+        except ValueError:
+            raise serializers.ValidationError({'limit': "Must be an integer."})
+        serializer = ListingRowSerializer.from_request(request)
+        suggested = recommendations.suggestions_for(request.user.pk, limit)
+        queryset = ClothingListing.objects.filter(pk__in=[pk for pk, _ in suggested], is_public=True)
+        rows = {row['id']: row for row in serializer.project(queryset, 'id')}
+        return Response([
+            {**serializer.to_representation(rows[pk]), 'score': round(score, 4)}
+            for pk, score in suggested if pk in rows
+        ])
+
+class ListingDuplicatesView(generics.GenericAPIView):
+    """
+    Staff view of listings sharing a photo: clusters of identical or
+    near-identical images (see ``core.duplicates``), largest first. With
+    ``?listing=<id>`` only that listing's near-duplicates are returned,
+    nearest first.
+    """
+    permission_classes = [IsAdminUser]
+    default_limit = 50
+    max_limit = 500
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        try:
+            distance = min(max(int(params.get('distance', duplicates.DEFAULT_DISTANCE)), 0), duplicates.MAX_DISTANCE)
+            limit = min(max(int(params.get('limit', self.default_limit)), 1), self.max_limit)
+            listing_id = int(params['listing']) if params.get('listing') else None
+        except ValueError:
+            raise serializers.ValidationError("distance, limit and listing must be integers.")
+        serializer = ListingRowSerializer.from_request(request)
+        if listing_id is not None:
+            listing = ClothingListing.objects.filter(pk=listing_id).values('image', 'image_phash').first()
+            if listing is None:
+                raise NotFound()
+            found = {}
+            if listing['image_phash'] is not None:
+                found.update((pk, d) for d, pk in duplicates.similar_listings(listing['image_phash'], distance))
+            if listing['image']:
+                found.update(
+                    (pk, 0) for pk in ClothingListing.objects.filter(image=listing['image']).values_list('id', flat=True)
+                )
+            found.pop(listing_id, None)
+            ranked = sorted(found, key=lambda pk: (found[pk], pk))[:limit]
+            rows = {row['id']: row for row in serializer.project(ClothingListing.objects.filter(pk__in=ranked), 'id')}
+            return Response([
+                {**serializer.to_representation(rows[pk]), 'distance': found[pk]} for pk in ranked if pk in rows
+            ])
+        clusters = duplicates.duplicate_clusters(ClothingListing.objects.all(), distance)[:limit]
+        ids = [pk for cluster in clusters for pk in cluster]
+        rows = {row['id']: row for row in serializer.project(ClothingListing.objects.filter(pk__in=ids), 'id')}
+        return Response([
+            {
+                'size': len(cluster),
+                'listings': [serializer.to_representation(rows[pk]) for pk in cluster if pk in rows],
+            }
+            for cluster in clusters
+        ])
+
+class MessageListCreateView(FastListMixin, generics.ListCreateAPIView):
     serializer_class = MessageSerializer
-    permission_classes = [IsAuthenticated] 
+    fast_serializer_class = MessageRowSerializer
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [RateLimitThrottle]
+    rate_limit_scope = 'message-create'
+    pagination_class = UnionKeysetPagination
+
+    def get_page_branches(self):
+        # Paged separately on message_sent_idx and message_received_idx.
+        return [models.Q(sender=self.request.user), models.Q(receiver=self.request.user)]
 
     def get_queryset(self):
+        start = message_window_start(self.request.user)
+        if start is None:
+            return Message.objects.none()
         return Message.objects.filter(
-            models.Q(sender=self.request.user) | models.Q(receiver=self.request.user)
-        ).select_related('sender', 'receiver', 'listing')  
-    
+            models.Q(sender=self.request.user) | models.Q(receiver=self.request.user), created_at__gte=start,
+        ).select_related('sender', 'receiver', 'listing')
+
     def perform_create(self, serializer):
         listing = serializer.validated_data['listing']
         receiver = listing.wardrobe.user if listing.wardrobe.user != self.request.user else None
         if not receiver:
             raise serializers.ValidationError("Invalid receiver for this listing.")
-        serializer.save(sender=self.request.user, receiver=receiver)     
+        message = send_message(serializer, self.request.user, receiver, listing)
+        transaction.on_commit(lambda: publish_message(message))
+
+class MessageReadView(generics.GenericAPIView):
+    """
+    GET: unread totals from the denormalised per-conversation counters.
+    POST: mark everything received up to ``up_to`` (default now) as read,
+    optionally only for one ``listing``, ``sender`` or list of ``message_ids``.
+    """
+    serializer_class = MessageReadSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        totals = ConversationParticipant.objects.filter(user=request.user).aggregate(unread=Sum('unread_count'))
+        return Response({'unread': totals['unread'] or 0})
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        up_to = data.get('up_to') or timezone.now()
+        updated, senders = mark_read(
+            request.user, up_to=up_to, listing_id=data.get('listing'), sender_id=data.get('sender'),
+            message_ids=data.get('message_ids'),
+        )
+        if senders:
+            receipt = {'up_to': up_to.isoformat(), 'listing': data.get('listing')}
+            if 'message_ids' in data:
+                # Each sender only hears about their own messages.
+                own = ids_by_sender(request.user, data['message_ids'], senders)
+
+                def publish():
+                    for sender_id, ids in own.items():
+                        publish_read_receipts(request.user.pk, [sender_id], **receipt, message_ids=ids)
+
+                transaction.on_commit(publish)
+            else:
+                transaction.on_commit(lambda: publish_read_receipts(request.user.pk, senders, **receipt))
+        return Response({'updated': updated, 'up_to': up_to})
+
+class ConversationPagination(KeysetPagination):
+    key_fields = ('last_message_at', 'id')
+
+class ConversationListView(generics.ListAPIView):
+    serializer_class = ConversationSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = ConversationPagination
+
+    def get_queryset(self):
+        return ConversationParticipant.objects.filter(
+            user=self.request.user, last_message_at__isnull=False,
+        ).select_related(
+            'conversation__listing', 'conversation__last_message',
+            'conversation__user_low', 'conversation__user_high',
+        )
 
-class UserMessagesView(generics.ListAPIView):
+class ConversationMessagesView(FastListMixin, generics.ListAPIView):
     serializer_class = MessageSerializer
-    permission_classes = [IsAuthenticated] 
+    fast_serializer_class = MessageRowSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        return Message.objects.filter(receiver=self.request.user, is_read=False).order_by('-created_at')
+        conversation_id = self.kwargs['pk']
+        started = ConversationParticipant.objects.filter(
+            conversation_id=conversation_id, user=self.request.user,
+        ).values_list('conversation__created_at', flat=True).first()
+        if started is None:
+            raise NotFound()
+        # No message predates its conversation; the bound lets PostgreSQL skip
+        # every older monthly partition (see core.partitions).
+        return Message.objects.filter(
+            conversation_id=conversation_id, created_at__gte=started,
+        ).select_related('sender', 'receiver')
+
+class UserMessagesView(FastListMixin, generics.ListAPIView):
+    serializer_class = MessageSerializer
+    fast_serializer_class = MessageRowSerializer
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [RateLimitThrottle]
+    rate_limit_scope = 'inbox'
+    rate_limit_methods = ('GET', 'HEAD')
+
+    def get_queryset(self):
+        start = message_window_start(self.request.user, unread_only=True)
+        if start is None:
+            return Message.objects.none()
+        return Message.objects.filter(
+            receiver=self.request.user, is_read=False, created_at__gte=start,
+        ).order_by('-created_at')
    
-class UserLocationCreateView(generics.CreateAPIView):
+class UserLocationView(generics.GenericAPIView):
+    """
+    GET: the user's latest known position, including one not yet flushed.
+    POST/PUT: report a position; see ``core.locations`` for coalescing.
+    """
     serializer_class = UserLocationSerializer
-    permission_classes = [IsAuthenticated]  
+    permission_classes = [IsAuthenticated]
 
-    def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
\ No newline at end of file
+    def get(self, request, *args, **kwargs):
+        current = locations.buffer.current(request.user.pk)
+        if current is None:
+            raise NotFound("No location reported yet.")
+        point, updated_at = current
+        return Response({'lon': point.x, 'lat': point.y, 'updated_at': updated_at})
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        point = serializer.validated_data['location']
+        accepted = locations.buffer.report(request.user.pk, point.x, point.y)
+        return Response({'lon': point.x, 'lat': point.y, 'accepted': accepted}, status=status.HTTP_202_ACCEPTED)
+
+    put = post
+
+def metrics_view(request):
+    if not metrics.scrape_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.expose(), content_type='text/plain; version=0.0.4; charset=utf-8')
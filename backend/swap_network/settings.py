@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -32,6 +32,8 @@ ALLOWED_HOSTS = []
 # Application definition
 
 INSTALLED_APPS = [
+    # Makes runserver serve ASGI, so WebSockets work in development too.
+    'daphne',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -39,14 +41,18 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.gis',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',
+    'channels',
     'core',
     'rest_framework.authtoken',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'core.db_router.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,6 +62,15 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Requests slower than this are logged to 'core.slow_requests' with their SQL
+# and the EXPLAIN of the slowest query; 0 disables the slow log.
+SLOW_REQUEST_THRESHOLD_MS = config('SLOW_REQUEST_THRESHOLD_MS', default=500, cast=int)
+
+# /metrics answers only clients in METRICS_ALLOWED_IPS (addresses or networks,
+# matched against REMOTE_ADDR) or sending "Authorization: Bearer METRICS_TOKEN".
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='127.0.0.1,::1', cast=Csv())
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
 CORS_ALLOWED_ORIGINS = [
          'http://localhost:5173',
          'http://localhost:3000',
@@ -81,6 +96,21 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'swap_network.wsgi.application'
+ASGI_APPLICATION = 'swap_network.asgi.application'
+
+# Channel layer used to push messages to WebSocket clients. The in-memory
+# layer only reaches sockets in the same process; point CHANNEL_LAYER_BACKEND
+# at e.g. channels_redis.core.RedisChannelLayer (with CHANNEL_LAYER_HOSTS)
+# when running more than one worker.
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': config('CHANNEL_LAYER_BACKEND', default='channels.layers.InMemoryChannelLayer'),
+    }
+}
+if config('CHANNEL_LAYER_HOSTS', default=''):
+    CHANNEL_LAYERS['default']['CONFIG'] = {
+        'hosts': config('CHANNEL_LAYER_HOSTS').split(','),
+    }
 
 
 # Database
@@ -94,8 +124,67 @@ DATABASES = {
         'PASSWORD': config('DB_PASSWORD'),
         'HOST': config('DB_HOST'),
         'PORT': config('DB_PORT'),
+        # Keep connections open between requests instead of paying for a new
+        # PostGIS connection each time; health checks drop dead ones first.
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# Production ASGI serving: persistent connections don't fit async workers,
+# so use a psycopg 3 connection pool instead (DB_POOL_MAX_SIZE connections
+# shared by all requests in the process).
+if config('DB_POOL', default=False, cast=bool):
+    from psycopg_pool import ConnectionPool
+
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX_SIZE', default=20, cast=int),
+            'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),
+            'check': ConnectionPool.check_connection,
+        },
+    }
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory by default; set CACHE_BACKEND/CACHE_LOCATION to share the
+# response, nearby and token caches between workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='swap-network'),
     }
 }
+PUBLIC_RESPONSE_CACHE = 'default'
+
+# Read replicas: DB_REPLICA_HOSTS is a comma-separated list of
+# host[:port][/name] sharing the primary's credentials. core.db_router sends reads
+# there unless the client wrote within REPLICA_PIN_SECONDS or the replica is
+# more than REPLICA_MAX_LAG seconds behind. Test databases mirror the primary.
+DATABASE_REPLICAS = []
+for index, replica in enumerate(filter(None, config('DB_REPLICA_HOSTS', default='').split(','))):
+    address, _, name = replica.strip().partition('/')
+    host, _, port = address.partition(':')
+    alias = f'replica_{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME': name or DATABASES['default']['NAME'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=5, cast=int)
+# Recent writers are remembered here; with replicas it must be a cache alias
+# shared by every worker, or startup fails (see core.db_router).
+REPLICA_PIN_SHARED_CACHE = config('REPLICA_PIN_SHARED_CACHE', default=None)
+REPLICA_MAX_LAG = config('REPLICA_MAX_LAG', default=5, cast=float)
+REPLICA_LAG_CHECK_INTERVAL = config('REPLICA_LAG_CHECK_INTERVAL', default=5, cast=float)
 
 
 # Password validation
@@ -137,6 +226,41 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Background tasks (core.tasks): image renditions and other deferred work.
+TASK_WORKERS = config('TASK_WORKERS', default=2, cast=int)
+TASKS_ALWAYS_EAGER = config('TASKS_ALWAYS_EAGER', default=False, cast=bool)
+
+# core.locations: location reports closer than LOCATION_MIN_MOVE_METERS to the
+# last accepted one are dropped; the rest are upserted in batches every
+# LOCATION_FLUSH_INTERVAL seconds (0 writes each report immediately).
+LOCATION_MIN_MOVE_METERS = config('LOCATION_MIN_MOVE_METERS', default=25, cast=float)
+LOCATION_FLUSH_INTERVAL = config('LOCATION_FLUSH_INTERVAL', default=5, cast=float)
+
+# core.recommendations: the suggested-swaps change log and precomputed lists
+# live in RECOMMENDATIONS_SHARED_CACHE, a cache alias shared by all workers
+# (Redis or Memcached). Without one each worker rebuilds its feature matrix
+# every few minutes and precompute_suggestions refuses to run.
+RECOMMENDATIONS_SHARED_CACHE = config('RECOMMENDATIONS_SHARED_CACHE', default=None)
+
+# core.throttling: per-route policies of key kind ('user', 'ip', 'username') ->
+# rate. Limits are per process unless RATE_LIMIT_SHARED_CACHE names a cache
+# alias (use a shared backend such as Redis or Memcached there).
+RATE_LIMITS = {
+    'login': {'ip': '30/min', 'username': '10/min'},
+    'listing-create': {'user': '30/min', 'ip': '120/min'},
+    'message-create': {'user': '60/min', 'ip': '240/min'},
+    # Hot reads, sync and async alike (rate_limit_methods = ('GET', 'HEAD')).
+    'listing-read': {'user': '300/min', 'ip': '600/min'},
+    'inbox': {'user': '120/min'},
+}
+RATE_LIMIT_SHARED_CACHE = config('RATE_LIMIT_SHARED_CACHE', default=None)
+
+# core.partitions: messages live in monthly partitions; the message_partitions
+# command archives months older than MESSAGE_HOT_MONTHS to gzipped JSON Lines
+# files in MESSAGE_ARCHIVE_DIR and drops them.
+MESSAGE_HOT_MONTHS = config('MESSAGE_HOT_MONTHS', default=12, cast=int)
+MESSAGE_ARCHIVE_DIR = config('MESSAGE_ARCHIVE_DIR', default=str(BASE_DIR / 'archive' / 'messages'))
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -146,10 +270,26 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'core.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    # Trusted reverse proxies in front of the app. With 0 the client address
+    # is REMOTE_ADDR; X-Forwarded-For is client-supplied and only trusted
+    # that many hops back.
+    'NUM_PROXIES': config('NUM_PROXIES', default=0, cast=int),
 }
-     
+
+# core.authentication: tokens expire AUTH_TOKEN_TTL seconds after issue (0
+# disables expiry). If AUTH_TOKEN_SHARED_CACHE names a cache alias shared by
+# all workers, resolved tokens are cached there and per process for up to
+# AUTH_TOKEN_CACHE_TTL seconds; without one they aren't cached.
+AUTH_TOKEN_TTL = config('AUTH_TOKEN_TTL', default=60 * 60 * 24 * 30, cast=int)
+AUTH_TOKEN_CACHE_TTL = config('AUTH_TOKEN_CACHE_TTL', default=60, cast=int)
+AUTH_TOKEN_CACHE_SIZE = config('AUTH_TOKEN_CACHE_SIZE', default=10_000, cast=int)
+AUTH_TOKEN_SHARED_CACHE = config('AUTH_TOKEN_SHARED_CACHE', default=None)
@@ -21,9 +21,54 @@ function Inbox({ user, apiBase }) {
     fetchMessages();
   }, [apiBase]);
 
+  // New messages are pushed over /ws/inbox/ instead of polling /inbox/.
+  useEffect(() => {
+    const token = localStorage.getItem('token');
+    if (!token) return undefined;
+    const url = new URL(apiBase, window.location.href);
+    url.protocol = url.protocol === 'https:' ? 'wss:' : 'ws:';
+    url.pathname = '/ws/inbox/';
+    url.search = `?token=${encodeURIComponent(token)}`;
+
+    let socket;
+    let retryTimer;
+    let retryDelay = 1000;
+    let closed = false;
+
+    const connect = () => {
+      socket = new WebSocket(url);
+      socket.onopen = () => {
+        retryDelay = 1000;
+      };
+      socket.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (data.type === 'message.new') {
+          setMessages((prevMessages) =>
+            prevMessages.some((msg) => msg.id === data.message.id)
+              ? prevMessages
+              : [data.message, ...prevMessages]
+          );
+        }
+      };
+      socket.onclose = (event) => {
+        // 4401: the token was rejected; reconnecting won't help.
+        if (closed || event.code === 4401) return;
+        retryTimer = setTimeout(connect, retryDelay);
+        retryDelay = Math.min(retryDelay * 2, 30000);
+      };
+    };
+    connect();
+
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      socket.close();
+    };
+  }, [apiBase]);
+
   const handleMarkRead = async (msgId) => {
     try {
-      await axios.patch(`${apiBase}/messages/${msgId}/`, { is_read: true });
+      await axios.post(`${apiBase}/messages/read/`, { message_ids: [msgId] });
       setMessages((prevMessages) =>
         prevMessages.map((msg) =>
           msg.id === msgId ? { ...msg, is_read: true } : msg
@@ -12,11 +12,13 @@ function Listings({ user, apiBase }) {
     if (navigator.geolocation) {
       navigator.geolocation.getCurrentPosition(
         (position) => {
-          setUserLocation({
-            lat: position.coords.latitude,
-            lon: position.coords.longitude,
-          });
+          const { latitude: lat, longitude: lon } = position.coords;
+          setUserLocation({ lat, lon });
           setGeoError("");
+          // Remember it server-side; small moves are coalesced there.
+          axios.post(`${apiBase}/user-location/`, { location: `${lon},${lat}` }).catch((err) => {
+            console.error("Failed to save location:", err);
+          });
         },
         (err) => {
           console.error("Geolocation error:", err);
@@ -27,7 +29,7 @@ function Listings({ user, apiBase }) {
     } else {
       setGeoError("Geolocation not supported. Showing all public listings.");
     }
-  }, []);
+  }, [apiBase]);
 
   useEffect(() => {
     const fetchListings = async () => {
@@ -39,7 +41,7 @@ function Listings({ user, apiBase }) {
           url = `${apiBase}/nearby-listings/?lat=${userLocation.lat}&lon=${userLocation.lon}&radius=10`;
         }
         const res = await axios.get(url);
-        setAllListings(res.data);
+        setAllListings(res.data.results ?? res.data);
       } catch (err) {
         console.error("Error fetching listings:", err);
         setError("Failed to load listings: " + (err.response?.data?.detail || err.message));
@@ -89,9 +91,9 @@ function Listings({ user, apiBase }) {
         {allListings.map((item) => (
           <div key={item.id} className="col-md-4 mb-4">
             <div className="card h-100 shadow-sm">
-              {item.image && (
+              {item.images?.medium && (
                 <img
-                  src={`http://localhost:8000${item.image}`}
+                  src={item.images.medium}
                   alt={item.title}
                   className="card-img-top"
                   style={{ objectFit: "cover", height: "200px" }}
@@ -1,6 +1,24 @@
 import { useState, useEffect } from 'react';
 import axios from 'axios';
 
+// Local copy of the wardrobe plus the change-feed cursor it is synced to.
+const cacheKey = (username) => `wardrobe:${username}`;
+
+const loadCache = (username) => {
+  try {
+    return JSON.parse(localStorage.getItem(cacheKey(username))) || { cursor: null, items: [] };
+  } catch {
+    return { cursor: null, items: [] };
+  }
+};
+
+const applyChanges = (items, { upserted, deleted }) => {
+  const byId = new Map(items.map((item) => [item.id, item]));
+  upserted.forEach((item) => byId.set(item.id, item));
+  deleted.forEach((id) => byId.delete(id));
+  return [...byId.values()].sort((a, b) => a.id - b.id);
+};
+
 function Wardrobe({ user, apiBase }) {
   const [listings, setListings] = useState([]);
   const [loading, setLoading] = useState(true);
@@ -17,9 +35,21 @@ function Wardrobe({ user, apiBase }) {
 
   useEffect(() => {
     const fetchListings = async () => {
+      let { cursor, items } = loadCache(user.username);
+      if (items.length) {
+        setListings(items);
+        setLoading(false);
+      }
       try {
-        const res = await axios.get(`${apiBase}/listings/`);
-        setListings(res.data);
+        let page;
+        do {
+          const res = await axios.get(`${apiBase}/listings/changes/`, { params: cursor ? { since: cursor } : {} });
+          page = res.data;
+          items = applyChanges(items, page);
+          cursor = page.cursor;
+        } while (page.has_more);
+        localStorage.setItem(cacheKey(user.username), JSON.stringify({ cursor, items }));
+        setListings(items);
         setError('');
       } catch (err) {
         setError('Failed to load wardrobe: ' + (err.response?.data?.detail || err.message));
@@ -28,7 +58,7 @@ function Wardrobe({ user, apiBase }) {
       }
     };
     fetchListings();
-  }, [apiBase]);
+  }, [apiBase, user.username]);
 
   const handleSubmit = async (e) => {
     e.preventDefault();
@@ -150,9 +180,9 @@ function Wardrobe({ user, apiBase }) {
           {listings.map((item) => (
             <div className="col-md-4 mb-4" key={item.id}>
               <div className="card h-100 shadow-sm">
-                {item.image && (
+                {item.images?.thumbnail && (
                   <img
-                    src={`http://localhost:8000${item.image}`}
+                    src={item.images.thumbnail}
                     alt={item.title}
                     className="card-img-top"
                     onError={(e) => {